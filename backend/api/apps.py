@@ -1,7 +1,28 @@
+import os
+import sys
 from django.apps import AppConfig
 
 
+def _serves_requests():
+    """False for management commands and for the autoreloader parent of runserver"""
+    if len(sys.argv) > 1 and os.path.basename(sys.argv[0]) in ('manage.py', 'django-admin'):
+        return sys.argv[1] == 'runserver' and (os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv)
+    return True
+
+
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
 
+    def ready(self):
+        if not _serves_requests():
+            # migrate, shell, build_snapshot... keep the default signal handling
+            return
+        from .data_loader import data_loader
+        from .popularity import warmup_settings
+        from .reload import install_signal_handler
+        install_signal_handler(data_loader)
+        config = warmup_settings()
+        if config['ENABLED']:
+            from . import warmup
+            warmup.start(config['BLOCKING'])
@@ -0,0 +1,200 @@
+"""
+Async variants of the API views, for serving under ASGI.
+
+Enabled with ASYNC_VIEWS. Only ETag checks run on the event loop. Response
+cache reads and writes (which may hit a shared cache server) and response
+compression run in threads through sync_to_async; the CPU-bound aggregation
+and serialization run on the bounded compute pool (api/executor.py). A slow
+query or cache server therefore never blocks /api/health/. When the pool
+is saturated requests are answered 503 with Retry-After instead of queueing
+without bound. These are plain Django async views: DRF's @api_view only
+supports synchronous views.
+"""
+import functools
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse
+from . import popularity, warmup
+from .cache import get_response_cache
+from .coalesce import data_flight
+from .data_loader import data_loader
+from .delta import get_delta_store, parse_delta
+from .executor import Overloaded, get_compute_pool
+from .metrics import stage
+from .profiling import annotate
+from .renderers import dumps
+from .responses import etag_matches, json_response, make_etag, not_modified
+from .views import (
+    batch_response, delta_data, delta_response, filter_options_key, parse_batch_request,
+    parse_data_request, render_and_cache, render_filter_options,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds clients are asked to wait after a 503
+RETRY_AFTER = 1
+
+
+def _csrf_exempt(view):
+    # django.views.decorators.csrf.csrf_exempt wraps async views in a sync
+    # function before Django 5.0, so mark the view directly
+    view.csrf_exempt = True
+    return view
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _overloaded(e):
+    response = _error(f"Server busy, retry later ({e})", 503)
+    response['Retry-After'] = str(RETRY_AFTER)
+    return response
+
+
+def _payload(request):
+    """JSON body of a request ({} when empty)"""
+    if not request.body:
+        return {}
+    payload = json.loads(request.body)
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object")
+    return payload
+
+
+def _off_loop(fn, *args):
+    """Awaitable running a blocking call (cache I/O, compression) in a thread"""
+    return sync_to_async(fn, thread_sensitive=False)(*args)
+
+
+async def _compute_data(state, cache, filters, names, fields, response_format, limits, grain, key):
+    """Async counterpart of views.compute_data, computing on the pool"""
+    compute = functools.partial(
+        render_and_cache, state, cache, filters, names, fields, response_format, limits, grain, key,
+    )
+    # Identical concurrent requests await the leader's computation
+    with stage('compute'):
+        return await data_flight.do_async(f"{state.version}:{key}", compute, run=get_compute_pool().run)
+
+
+async def _state():
+    """Current dataset state, loading it on the pool the first time"""
+    if data_loader.is_loaded():
+        return data_loader.get_state()
+    return await get_compute_pool().run(data_loader.get_state)
+
+
+@_csrf_exempt
+async def get_filter_options(request):
+    """Async /api/filters/: the catalog on GET, facets for a selection on POST"""
+    if request.method not in ('GET', 'POST'):
+        return HttpResponseNotAllowed(['GET', 'POST'])
+    try:
+        filters = None
+        if request.method == 'POST':
+            filters = _payload(request).get('filters', {})
+        key = filter_options_key(filters)
+    except ValueError as e:
+        return _error(str(e), 400)
+    try:
+        cache = get_response_cache()
+        state = await _state()
+        version = state.version
+        digest = make_etag(version, key)
+        if etag_matches(request, digest):
+            return not_modified(digest)
+        body = await _off_loop(cache.get, key, version)
+        if body is None:
+            body = await get_compute_pool().run(render_filter_options, state, filters)
+            await _off_loop(cache.set, key, version, body)
+        return await _off_loop(json_response, request, body, digest, cache, key, version)
+    except Overloaded as e:
+        return _overloaded(e)
+    except Exception as e:
+        logger.error(f"Error fetching filter options: {e}", exc_info=True)
+        return _error(str(e), 500)
+
+
+@_csrf_exempt
+async def get_filtered_data(request):
+    """Async /api/data/, same payload and response as views.get_filtered_data"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        payload = _payload(request)
+        filters, names, fields, response_format, limits, grain, key = parse_data_request(payload)
+        delta = parse_delta(payload)
+    except ValueError as e:
+        return _error(str(e), 400)
+    popularity.record(key)
+    try:
+        cache = get_response_cache()
+        state = await _state()
+        version = state.version
+        # Recorded with the profile if this request gets profiled
+        annotate(payload=key, version=version)
+        digest = make_etag(version, key)
+        if etag_matches(request, digest):
+            return not_modified(digest)
+        if delta is not None:
+            body, how, patch, exact = await get_compute_pool().run(
+                delta_data, state, cache, delta, filters, names, fields, response_format, limits, grain, key,
+            )
+            return await _off_loop(delta_response, request, body, how, patch, exact, digest, cache, key, version)
+        body = await _off_loop(cache.get, key, version)
+        if body is None:
+            body = await _compute_data(state, cache, filters, names, fields, response_format, limits, grain, key)
+        return await _off_loop(json_response, request, body, digest, cache, key, version)
+    except Overloaded as e:
+        return _overloaded(e)
+    except Exception as e:
+        logger.error(f"Error in get_filtered_data: {e}", exc_info=True)
+        return _error(str(e), 500)
+
+
+async def _stream_batch(state, scenarios):
+    """Async counterpart of views.stream_batch, computing scenarios on the pool"""
+    cache = get_response_cache()
+    yield b'{'
+    for position, (scenario_id, (filters, names, fields, response_format, limits, grain, key)) in enumerate(scenarios):
+        try:
+            body = await _off_loop(cache.get, key, state.version)
+            if body is None:
+                body = await _compute_data(state, cache, filters, names, fields, response_format, limits, grain, key)
+        except Exception as e:
+            logger.error(f"Error in batch scenario {scenario_id!r}: {e}", exc_info=not isinstance(e, Overloaded))
+            body = dumps({'error': str(e)})
+        yield (b',' if position else b'') + dumps(scenario_id) + b':' + body
+    yield b'}'
+
+
+@_csrf_exempt
+async def get_batch_data(request):
+    """Async /api/data/batch/, same payload and response as views.get_batch_data"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        scenarios = parse_batch_request(_payload(request))
+    except ValueError as e:
+        return _error(str(e), 400)
+    try:
+        state = await _state()
+    except Overloaded as e:
+        return _overloaded(e)
+    return batch_response(_stream_batch(state, scenarios))
+
+
+async def health_check(request):
+    """Async health check; answers from the event loop without touching the pool (503 while warming up)"""
+    warming = warmup.is_warming()
+    return JsonResponse({
+        'status': 'warming' if warming else 'ok',
+        'message': 'Warming up' if warming else 'Application is running',
+        'dataset': data_loader.describe(load=False),
+        'warmup': warmup.status(),
+        'responseCache': get_response_cache().stats(),
+        'coalescing': data_flight.stats(),
+        'delta': get_delta_store().stats(),
+        'computePool': get_compute_pool().stats(),
+    }, status=503 if warming else 200)
@@ -0,0 +1,330 @@
+"""
+Benchmarks of the data pipeline on synthetic datasets.
+
+generate_dataset writes a CSV with the schema of Technical Evaluation.csv at
+a multiple of its row count, with configurable brand, PPG and channel
+cardinality. run_benchmarks loads each dataset through the DataLoader (with
+DATASET_PATH pointed at it) and times every stage of an /api/data/ request
+over a matrix of filter selections. The report is plain JSON; compare_reports
+lists the measurements that regressed against a stored baseline.
+
+Run it with `python manage.py benchmark` (see the command for options).
+"""
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from django.test import Client, override_settings
+from . import ingest
+from .cache import get_response_cache
+from .data_loader import DatasetState, data_loader, read_dataset
+from .renderers import RECORDS, dumps, serialize_frame
+from .utils import ALL_OUTPUTS, DATASET_SPECS, apply_filters, build_datasets
+from .views import render_data
+
+# Rows of Technical Evaluation.csv; scales multiply it
+BASE_ROWS = 10244
+SCALES = (10, 100, 1000)
+
+DEFAULT_CARDINALITY = {
+    'brands': 6,
+    'ppgs': 6,
+    'channels': 4,
+}
+
+COLUMNS = [
+    'Market', 'Channel', 'Region', 'Category', 'SubCategory', 'Brand', 'Variant',
+    'PackType', 'PPG', 'PackSize', 'Year', 'Month', 'Week', 'date', 'BrCatId',
+    'SalesValue', 'Volume', 'VolumeUnits',
+    *[f'{prefix}{i}' for prefix in ('D', 'AV', 'EV') for i in range(1, 7)],
+    '',
+]
+
+# Weekly dates of the source dataset: 2021-01-09 onwards, 164 weeks
+FIRST_DATE = '2021-01-09'
+WEEKS = 164
+
+# Share of rows whose driver columns other than D1 are missing, as in the source
+MISSING_DRIVERS = 0.064
+
+GENERATE_CHUNK_ROWS = 250_000
+
+# Relative slowdown of a median beyond which compare_reports flags a regression
+DEFAULT_TOLERANCE = 0.2
+
+
+def generate_dataset(path, rows, cardinality=None, seed=0):
+    """
+    Write a synthetic CSV with the source schema
+
+    Args:
+        path: output CSV path
+        rows: number of data rows
+        cardinality: dict overriding DEFAULT_CARDINALITY (brands, ppgs, channels)
+        seed: random seed, so a scale always produces the same file
+
+    Returns:
+        path
+    """
+    cardinality = dict(DEFAULT_CARDINALITY, **(cardinality or {}))
+    rng = np.random.default_rng(seed)
+    brands = np.array([f'Brand {i + 1}' for i in range(cardinality['brands'])], dtype=object)
+    ppgs = np.array([f'PPG {i + 1}' for i in range(cardinality['ppgs'])], dtype=object)
+    channels = np.array([f'Channel {i + 1}' for i in range(cardinality['channels'])], dtype=object)
+    variants = np.array(['Flavoured', 'Standard'], dtype=object)
+
+    dates = pd.date_range(FIRST_DATE, periods=WEEKS, freq='7D')
+    date_text = np.array(dates.strftime('%d-%m-%Y'), dtype=object)
+    years = dates.year.to_numpy()
+    months = dates.month.to_numpy()
+    weeks = dates.isocalendar().week.to_numpy()
+
+    written = 0
+    with open(path, 'w', newline='') as handle:
+        while written < rows:
+            n = min(GENERATE_CHUNK_ROWS, rows - written)
+            week = rng.integers(0, WEEKS, n)
+            sales = rng.lognormal(11.0, 1.2, n).round(6)
+            volume = (sales / rng.uniform(1.2, 2.5, n)).round(6)
+            missing = rng.random(n) < MISSING_DRIVERS
+            driver = np.where(missing, np.nan, 0.0)
+            chunk = {
+                'Market': 'Market 1',
+                'Channel': channels[rng.integers(0, len(channels), n)],
+                'Region': 'AllRegion',
+                'Category': 'Beans',
+                'SubCategory': 'AllSubCategory',
+                'Brand': brands[rng.integers(0, len(brands), n)],
+                'Variant': variants[rng.integers(0, len(variants), n)],
+                'PackType': 'AllPackType',
+                'PPG': ppgs[rng.integers(0, len(ppgs), n)],
+                'PackSize': 'AllPackSize',
+                'Year': years[week],
+                'Month': months[week],
+                'Week': weeks[week],
+                'date': date_text[week],
+                'BrCatId': 'Brand',
+                'SalesValue': sales,
+                'Volume': volume,
+                'VolumeUnits': (volume * rng.uniform(1.5, 2.0, n)).round(),
+                'D1': rng.uniform(0, 100, n).round(6),
+            }
+            for column in COLUMNS[19:-1]:
+                chunk[column] = driver
+            chunk[''] = None
+            frame = pd.DataFrame(chunk, columns=COLUMNS)
+            frame.to_csv(handle, index=False, header=written == 0)
+            written += n
+    return path
+
+
+def filter_cases(catalog):
+    """Matrix of filter selections drawn from a dataset's filter catalog"""
+    brands = catalog.get('brands', [])
+    ppgs = catalog.get('ppgs', [])
+    channels = catalog.get('channels', [])
+    years = catalog.get('years', [])
+    return {
+        'all': {},
+        'one_brand': {'brands': brands[:1]},
+        'brands_year': {'brands': brands[:2], 'years': years[-1:]},
+        'narrow': {'brands': brands[:1], 'ppgs': ppgs[:1], 'channels': channels[:1], 'years': years[:1]},
+        'empty': {'brands': ['(none)']},
+    }
+
+
+def time_call(fn, repeat):
+    """Run fn `repeat` times; returns timing stats in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'repeat': repeat,
+    }
+
+
+def _post(client, body):
+    response = client.post('/api/data/', data=body, content_type='application/json')
+    if response.status_code != 200:
+        raise RuntimeError(f"/api/data/ answered {response.status_code}: {response.content[:200]!r}")
+
+
+def _serialize(datasets):
+    return dumps({name: serialize_frame(frame, RECORDS) for name, frame in datasets.items()})
+
+
+def benchmark_state(state, repeat=5, cases=None):
+    """
+    Time the per-request stages against a loaded DatasetState
+
+    Returns:
+        list of result dicts (stage, case, timing stats)
+    """
+    cases = filter_cases(state.catalog) if cases is None else cases
+    client = Client()
+    cache = get_response_cache()
+    results = []
+
+    def record(stage, case, fn, n=repeat):
+        results.append({'stage': stage, 'case': case, **time_call(fn, n)})
+
+    for case, filters in cases.items():
+        body = json.dumps({'filters': filters})
+        cells = state.cube.select(filters)
+        datasets = build_datasets(cells)
+
+        record('apply_filters', case, lambda: apply_filters(state.frame, filters, state.index))
+        record('cube_select', case, lambda: state.cube.select(filters))
+        for name in DATASET_SPECS:
+            record(f'aggregate.{name}', case, lambda name=name: build_datasets(cells, [name]))
+        record('aggregate.all', case, lambda: build_datasets(cells))
+        record('correlation', case, lambda: state.cube.correlation_pairs(filters))
+        record('serialize', case, lambda: _serialize(datasets))
+        record('render', case, lambda: render_data(state, filters, ALL_OUTPUTS, {}, RECORDS))
+
+        def cold():
+            cache.clear()
+            _post(client, body)
+
+        record('endpoint.cold', case, cold)
+        _post(client, body)
+        record('endpoint.cached', case, lambda: _post(client, body))
+    return results
+
+
+def benchmark_scale(scale, workdir, repeat=5, cardinality=None, load_repeat=1):
+    """
+    Generate the dataset for one scale, load it and time every stage
+
+    Loading is timed from the CSV (no snapshot), writing the snapshot and from
+    the snapshot, `load_repeat` times each; the eager parse and state build are
+    timed separately unless the dataset is large enough for chunked ingestion.
+    """
+    rows = BASE_ROWS * scale
+    csv_path = os.path.join(workdir, f'synthetic-{scale}x.csv')
+    started = time.perf_counter()
+    if not os.path.exists(csv_path):
+        generate_dataset(csv_path, rows, cardinality, seed=scale)
+    generated = time.perf_counter() - started
+
+    overrides = {
+        'DATASET_PATH': csv_path,
+        'DATASET_SNAPSHOT_PATH': csv_path + '.snapshot',
+        'DATASET_SHARED': {'ENABLED': False},
+        'DATASET_RELOAD': {'WATCH': False},
+        # Synthetic requests must not skew the popularity sketch of warm-up
+        'WARMUP': {'TRACK': False},
+    }
+    results = []
+
+    def record(stage, fn):
+        results.append({'stage': stage, 'case': None, **time_call(fn, load_repeat)})
+
+    with override_settings(**overrides):
+        chunked = ingest.use_chunked(csv_path)
+        if not chunked:
+            record('parse', lambda: read_dataset(csv_path))
+            frame, _ = read_dataset(csv_path)
+            record('build_state', lambda: DatasetState.from_frame(frame, 'benchmark'))
+            del frame
+        with override_settings(DATASET_SNAPSHOT_ENABLED=False):
+            record('load.csv', data_loader.reload)
+        record('snapshot.build', data_loader.build_snapshot)
+        record('load.snapshot', data_loader.reload)
+        state = data_loader.get_state()
+        results.extend(benchmark_state(state, repeat))
+
+    for result in results:
+        result['scale'] = scale
+    return {
+        'scale': scale,
+        'rows': len(state.frame),
+        'cells': len(state.cube.cells),
+        'chunked': chunked,
+        'generate_s': round(generated, 3),
+        'results': results,
+    }
+
+
+def run_benchmarks(scales=SCALES, workdir=None, repeat=5, cardinality=None, load_repeat=1):
+    """
+    Benchmark the pipeline at each scale
+
+    The loader's current state is restored afterwards.
+
+    Returns:
+        JSON-serializable report
+    """
+    cardinality = dict(DEFAULT_CARDINALITY, **(cardinality or {}))
+    previous = data_loader._state
+    report = {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'repeat': repeat,
+            'load_repeat': load_repeat,
+            'cardinality': cardinality,
+        },
+        'scales': [],
+    }
+    if workdir:
+        os.makedirs(workdir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix='eda-benchmark-') as scratch:
+        try:
+            for scale in scales:
+                report['scales'].append(
+                    benchmark_scale(scale, workdir or scratch, repeat, cardinality, load_repeat)
+                )
+        finally:
+            if previous is not None:
+                data_loader._swap(previous)
+    return report
+
+
+def _measurements(report):
+    return {
+        (result['scale'], result['stage'], result['case']): result
+        for scale in report['scales']
+        for result in scale['results']
+    }
+
+
+def compare_reports(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare the medians of a report against a baseline report
+
+    Returns:
+        list of regressions (scale, stage, case, baseline_ms, current_ms, ratio)
+        for the measurements slower than baseline by more than `tolerance`
+    """
+    current = _measurements(report)
+    regressions = []
+    for key, before in _measurements(baseline).items():
+        after = current.get(key)
+        if after is None or before['median_ms'] <= 0:
+            continue
+        ratio = after['median_ms'] / before['median_ms']
+        if ratio > 1 + tolerance:
+            scale, stage, case = key
+            regressions.append({
+                'scale': scale,
+                'stage': stage,
+                'case': case,
+                'baseline_ms': before['median_ms'],
+                'current_ms': after['median_ms'],
+                'ratio': round(ratio, 3),
+            })
+    return regressions
@@ -0,0 +1,211 @@
+"""
+Response cache for the data endpoints.
+
+Responses are cached as already-serialized bytes under a canonical form of
+the request payload, scoped by the dataset version so a new dataset never
+serves stale entries. When the loader swaps in a new version the cache is
+activated for it; requests still finishing on the previous version neither
+read nor write entries from then on. Two backends are available: an in-process LRU with a
+size bound and TTL, and one backed by Django's cache framework so several
+workers can share hits (configure CACHES with a shared backend for that).
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from .filter_index import FILTER_DIMENSIONS, integral_value
+
+DEFAULT_CACHE_SETTINGS = {
+    'BACKEND': 'local',
+    'MAX_ENTRIES': 256,
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'TTL': 300,
+    'CACHE_ALIAS': 'default',
+}
+
+NUMERIC_FILTERS = {'years'}
+
+
+def _sort_key(value):
+    return (isinstance(value, str), value)
+
+
+def canonical_filters(filters):
+    """
+    Normalize a filter payload so equivalent selections compare equal
+
+    Lists are de-duplicated and sorted, empty selections are dropped and
+    years are coerced to int.
+
+    Raises:
+        ValueError: unless filters is an object whose selections are lists
+        of strings or numbers
+    """
+    if filters is None:
+        filters = {}
+    if not isinstance(filters, dict):
+        raise ValueError("'filters' must be an object")
+    canonical = {}
+    for key in FILTER_DIMENSIONS:
+        values = filters.get(key)
+        if values is None:
+            continue
+        if not isinstance(values, (list, tuple)):
+            raise ValueError(f"Filter {key!r} must be a list of values")
+        if not values:
+            continue
+        for value in values:
+            if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                raise ValueError(f"Filter {key!r} values must be strings or numbers, not {value!r}")
+        if key in NUMERIC_FILTERS:
+            values = [integral_value(value) for value in values]
+        canonical[key] = sorted(set(values), key=_sort_key)
+    return canonical
+
+
+def canonical_key(payload):
+    """Stable string form of a canonical payload"""
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'))
+
+
+class LocalBackend:
+    """In-process LRU bounded by entry count, total bytes and TTL"""
+
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self._bytes, 'evictions': self.evictions}
+
+
+class DjangoBackend:
+    """Backend on top of a Django cache alias, shared across workers when CACHES is"""
+
+    def __init__(self, alias, ttl):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, timeout=self.ttl)
+
+    def clear(self):
+        # Entries are version-scoped, so stale ones simply age out
+        pass
+
+    def stats(self):
+        return {}
+
+
+class ResponseCache:
+    """Version-scoped cache of serialized responses with hit/miss counters"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def activate(self, version):
+        """Switch to a new dataset version, dropping the previous version's entries"""
+        with self._lock:
+            if version != self.version:
+                self.backend.clear()
+                self.version = version
+
+    def clear(self):
+        """Drop every cached response, keeping the active version"""
+        with self._lock:
+            self.backend.clear()
+
+    def _is_current(self, version):
+        if self.version is None:
+            self.activate(version)
+        return version == self.version
+
+    def _scoped(self, key, version):
+        return f"eda:{version}:{key}"
+
+    def get(self, key, version, track=True):
+        value = self.backend.get(self._scoped(key, version)) if self._is_current(version) else None
+        if not track:
+            return value
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, version, value):
+        if self._is_current(version):
+            self.backend.set(self._scoped(key, version), value)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return dict(
+            self.backend.stats(),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / total if total else 0.0,
+        )
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    """Process-wide ResponseCache configured from settings.RESPONSE_CACHE"""
+    global _response_cache
+    if _response_cache is None:
+        config = dict(DEFAULT_CACHE_SETTINGS, **getattr(settings, 'RESPONSE_CACHE', {}))
+        if config['BACKEND'] == 'django':
+            backend = DjangoBackend(config['CACHE_ALIAS'], config['TTL'])
+        else:
+            backend = LocalBackend(config['MAX_ENTRIES'], config['MAX_BYTES'], config['TTL'])
+        _response_cache = ResponseCache(backend)
+    return _response_cache
@@ -0,0 +1,87 @@
+"""
+Filter option catalog and faceted (cross-filter) counts.
+
+The catalog lists the selectable values of every filter dimension and is
+built once per dataset version from the filter index. Facets answer "which
+values are still reachable given the rest of the selection": for each
+dimension the other dimensions' selections are combined through the cube's
+filter index, and row counts and SalesValue totals per value come from one
+bincount over the matching cells.
+"""
+import numpy as np
+from .cube import ROW_COUNT
+from .filter_index import FILTER_DIMENSIONS, unpack_mask
+
+# Aggregate rows such as 'AllBrands' are not offered as filter options
+EXCLUDED_PREFIX = 'All'
+
+
+def build_catalog(index):
+    """
+    Selectable values per filter dimension
+
+    Args:
+        index: FilterIndex over the raw rows
+
+    Returns:
+        dict with brands, packTypes, ppgs, channels and years lists
+    """
+    catalog = {}
+    for key, column in FILTER_DIMENSIONS.items():
+        if index is None:
+            catalog[key] = []
+            continue
+        values = list(index.bitsets.get(column, {}))
+        if column in index.numeric:
+            catalog[key] = sorted(int(v) for v in values)
+        else:
+            catalog[key] = sorted(v for v in values if not str(v).startswith(EXCLUDED_PREFIX))
+    return catalog
+
+
+def facet_counts(cube, catalog, filters):
+    """
+    Reachable values of each dimension under the current selection
+
+    The selection on a dimension itself is ignored when computing its own
+    facet, so already-selected values stay visible alongside alternatives.
+
+    Args:
+        cube: Cube whose index covers the filter dimensions
+        catalog: dict from build_catalog
+        filters: dict with filter keys (brands, packTypes, ppgs, channels, years)
+
+    Returns:
+        dict of filter key -> list of {'value', 'count', 'salesValue'} in catalog
+        order; empty lists when the cube has no index (empty dataset)
+    """
+    index = cube.index
+    if index is None:
+        return {key: [] for key in FILTER_DIMENSIONS}
+    rows = cube.cells[ROW_COUNT].to_numpy(dtype=float)
+    sales = cube.cells['SalesValue'].to_numpy(dtype=float)
+    facets = {}
+
+    for key, column in FILTER_DIMENSIONS.items():
+        codes = index.codes[column]
+        values = list(index.bitsets[column])
+        mask = index.bitset(filters, exclude=column)
+        if mask is not None:
+            selected = unpack_mask(mask, index.length)
+            codes, cell_rows, cell_sales = codes[selected], rows[selected], sales[selected]
+        else:
+            cell_rows, cell_sales = rows, sales
+        present = codes >= 0
+        counts = np.bincount(codes[present], weights=cell_rows[present], minlength=len(values))
+        totals = np.bincount(codes[present], weights=cell_sales[present], minlength=len(values))
+
+        position = {value: i for i, value in enumerate(values)}
+        facets[key] = [
+            {
+                'value': value,
+                'count': int(counts[position[value]]) if value in position else 0,
+                'salesValue': float(totals[position[value]]) if value in position else 0.0,
+            }
+            for value in catalog[key]
+        ]
+    return facets
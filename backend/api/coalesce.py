@@ -0,0 +1,119 @@
+"""
+Single-flight coalescing of identical concurrent computations.
+
+The first caller for a key becomes the leader and computes; callers arriving
+with the same key while it runs wait on the leader's future and receive the
+same result (for /api/data/, the serialized response bytes). Followers can
+block (threaded WSGI workers) or await (async views under ASGI); both wait on
+the same concurrent.futures.Future.
+
+The leader always settles the future, even when it is interrupted rather
+than failing (a cancelled ASGI request, KeyboardInterrupt, a worker timeout
+raising SystemExit): its followers then get LeaderInterrupted, and the next
+caller for the key computes afresh. A cancelled async follower only stops
+waiting: the shared future is shielded from its cancellation.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from asgiref.sync import sync_to_async
+
+
+class LeaderInterrupted(RuntimeError):
+    """Raised in followers whose leader was interrupted before finishing"""
+
+
+class SingleFlight:
+    """Registry of in-flight computations keyed by a canonical request key"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def _join(self, key):
+        """Return (future, is_leader) for a key"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.executions += 1
+            return future, True
+
+    def _settle(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+            if error is not None:
+                self.errors += 1
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    @staticmethod
+    def _shared_error(error):
+        """The exception followers get: the leader's own, unless it was interrupted"""
+        if isinstance(error, Exception):
+            return error
+        # A follower re-raising the leader's CancelledError would look cancelled itself
+        return LeaderInterrupted(f"Leader interrupted by {type(error).__name__}")
+
+    def do(self, key, fn):
+        """
+        Run fn once for all concurrent callers with the same key (blocking)
+
+        Exceptions raised by the leader are re-raised in every waiting caller;
+        an interrupted leader gives them LeaderInterrupted.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._settle(key, future, error=self._shared_error(e))
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def do_async(self, key, fn, run=None):
+        """
+        Async counterpart of do()
+
+        The leader runs fn in a worker thread, through `run` (a coroutine
+        function taking fn, e.g. ComputePool.run) when given.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            # Cancelling the wrapper would cancel the future shared with the leader
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await (run(fn) if run is not None else sync_to_async(fn, thread_sensitive=False)())
+        except BaseException as e:
+            self._settle(key, future, error=self._shared_error(e))
+            raise
+        self._settle(key, future, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        total = self.executions + self.coalesced
+        return {
+            'in_flight': in_flight,
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'coalesced_rate': self.coalesced / total if total else 0.0,
+        }
+
+
+# Shared by every view of the process
+data_flight = SingleFlight()
@@ -0,0 +1,161 @@
+"""
+Correlation engine built on additive sufficient statistics.
+
+For columns x_i, x_j and pairwise-complete rows (both present) the Pearson
+correlation only needs n, the two sums, the two sums of squares and the sum
+of products. Those are kept as k x k matrices so every pair gets its own
+pairwise-complete counts, matching DataFrame.corr():
+
+    n[i, j]   = number of rows with both i and j present
+    sx[i, j]  = sum of x_i over those rows
+    sxx[i, j] = sum of x_i^2 over those rows
+    sxy[i, j] = sum of x_i * x_j over those rows
+
+The statistics are additive, so they are precomputed per cube cell and any
+filtered correlation matrix is a sum over the selected cells. Columns that
+are constant across the whole dataset can never correlate and are dropped up
+front; values are shifted by the column mean to limit cancellation.
+"""
+import numpy as np
+import pandas as pd
+from .schema import is_driver_column
+
+STANDARD_COLUMNS = ['SalesValue', 'Volume', 'VolumeUnits']
+
+# Variances below this fraction of the raw second moment are treated as zero
+_RELATIVE_TOLERANCE = 1e-12
+
+
+def candidate_columns(df):
+    """SalesValue, Volume, VolumeUnits and the numeric D*/AV*/EV* columns, in order"""
+    columns = [c for c in STANDARD_COLUMNS if c in df.columns]
+    columns += [c for c in df.columns if is_driver_column(c) and pd.api.types.is_numeric_dtype(df[c])]
+    return list(dict.fromkeys(columns))
+
+
+def _is_constant(series):
+    present = series.dropna()
+    return present.empty or present.min() == present.max()
+
+
+def correlation_columns(df):
+    """candidate_columns without the ones that are constant (e.g. all zero)"""
+    return [c for c in candidate_columns(df) if not _is_constant(df[c])]
+
+
+def column_matrix(df, columns):
+    """Dense float64 (rows x columns) matrix, NaN for missing values"""
+    if not columns:
+        return np.empty((len(df), 0))
+    return np.column_stack([
+        df[c].sparse.to_dense().to_numpy(dtype=float) if isinstance(df[c].dtype, pd.SparseDtype)
+        else df[c].to_numpy(dtype=float)
+        for c in columns
+    ])
+
+
+def _row_terms(values):
+    """Per-row factors whose products give the four statistics"""
+    present = ~np.isnan(values)
+    x = np.where(present, values, 0.0)
+    return present.astype(float), x
+
+
+def sufficient_stats(values):
+    """Sufficient statistics (n, sx, sxx, sxy) of a rows x k matrix"""
+    m, x = _row_terms(values)
+    return m.T @ m, x.T @ m, (x * x).T @ m, x.T @ x
+
+
+def grouped_sufficient_stats(values, group_ids, n_groups):
+    """
+    Sufficient statistics per group
+
+    Args:
+        values: (rows x k) float matrix with NaN for missing
+        group_ids: int array assigning each row to a group in [0, n_groups)
+        n_groups: int - every group must hold at least one row
+
+    Returns:
+        tuple of four (n_groups x k x k) arrays
+    """
+    order = np.argsort(group_ids, kind='stable')
+    starts = np.searchsorted(group_ids[order], np.arange(n_groups))
+    m, x = _row_terms(values[order])
+    xx = x * x
+    k = values.shape[1]
+    stats = [np.empty((n_groups, k, k)) for _ in range(4)]
+    for i in range(k):
+        # Column i against every column j, reduced per group in one pass
+        stats[0][:, i, :] = np.add.reduceat(m[:, i:i + 1] * m, starts, axis=0)
+        stats[1][:, i, :] = np.add.reduceat(x[:, i:i + 1] * m, starts, axis=0)
+        stats[2][:, i, :] = np.add.reduceat(xx[:, i:i + 1] * m, starts, axis=0)
+        stats[3][:, i, :] = np.add.reduceat(x[:, i:i + 1] * x, starts, axis=0)
+    return tuple(stats)
+
+
+def correlation_matrix(n, sx, sxx, sxy):
+    """Pairwise-complete Pearson correlation matrix from summed statistics"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = n * sxx - sx * sx
+        var = np.where(var > _RELATIVE_TOLERANCE * n * sxx, var, np.nan)
+        cov = n * sxy - sx * sx.T
+        corr = cov / np.sqrt(var * var.T)
+    corr[n < 2] = np.nan
+    diagonal = np.isfinite(np.diag(corr))
+    corr[np.diag_indices_from(corr)] = np.where(diagonal, 1.0, np.nan)
+    return np.clip(corr, -1.0, 1.0)
+
+
+def upper_pairs(columns, corr):
+    """{'var1', 'var2', 'corr'} for every finite pair above the diagonal"""
+    rows, cols = np.triu_indices(len(columns), 1)
+    values = corr[rows, cols]
+    keep = np.isfinite(values)
+    return [
+        {'var1': columns[i], 'var2': columns[j], 'corr': v}
+        for i, j, v in zip(rows[keep].tolist(), cols[keep].tolist(), values[keep].tolist())
+    ]
+
+
+class CorrelationStats:
+    """Per-cell sufficient statistics for the general correlation matrix"""
+
+    def __init__(self, columns, n, sx, sxx, sxy):
+        self.columns = columns
+        self.n, self.sx, self.sxx, self.sxy = n, sx, sxx, sxy
+        self.totals = tuple(stat.sum(axis=0) for stat in (n, sx, sxx, sxy))
+
+    @classmethod
+    def build(cls, df, cell_ids, n_cells):
+        """
+        Precompute statistics for each cube cell
+
+        Args:
+            df: pandas DataFrame with the raw rows
+            cell_ids: int array mapping each row to its cube cell
+            n_cells: int - number of cube cells
+        """
+        columns = correlation_columns(df)
+        values = column_matrix(df, columns)
+        if columns:
+            values = values - np.nanmean(values, axis=0)
+        return cls(columns, *grouped_sufficient_stats(values, cell_ids, n_cells))
+
+    def pairs(self, positions=None):
+        """
+        Correlation pairs over a selection of cells
+
+        Args:
+            positions: cell positions from Cube.positions (None for all cells)
+
+        Returns:
+            List of correlation pairs
+        """
+        if len(self.columns) < 2:
+            return []
+        if positions is None:
+            stats = self.totals
+        else:
+            stats = tuple(stat[positions].sum(axis=0) for stat in (self.n, self.sx, self.sxx, self.sxy))
+        return upper_pairs(self.columns, correlation_matrix(*stats))
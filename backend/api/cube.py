@@ -0,0 +1,209 @@
+"""
+Pre-aggregated OLAP cube over the dashboard dimensions.
+
+The raw rows are grouped once, at load time, to the finest grain of
+{Year, Month, Brand, PackType, PPG, Channel}. Each cell holds additive
+measures (sum, count, sum of squares, cross-product) plus min/max, so every
+chart and the KPI summary can be rolled up from the filtered cells instead of
+the raw rows. The general correlation matrix over the driver columns is
+served the same way, from per-cell sufficient statistics (see correlation.py).
+"""
+import numpy as np
+import pandas as pd
+from .correlation import CorrelationStats
+from .filter_index import FilterIndex
+
+CUBE_DIMENSIONS = ['Year', 'Month', 'Brand', 'PackType', 'PPG', 'Channel']
+CUBE_MEASURES = ['SalesValue', 'Volume']
+
+# Helper columns holding the row position of each cell's first dated row,
+# used to reproduce groupby 'first' semantics for the date column
+DATE_POSITION = 'date__pos'
+ROW_COUNT = 'rows'
+
+
+def _stat(measure, stat):
+    return f"{measure}__{stat}"
+
+
+class Cube:
+    """Finest-grain aggregate of the dataset plus a filter index over its cells"""
+
+    def __init__(self, cells, index, correlation=None):
+        self.cells = cells
+        self.index = index
+        self.correlation = correlation
+
+    @classmethod
+    def build(cls, df, dimensions=None, measures=None):
+        """
+        Group the raw rows into cube cells
+
+        Args:
+            df: pandas DataFrame with the raw rows
+            dimensions: list of grouping columns (default: CUBE_DIMENSIONS)
+            measures: list of additive measures (default: CUBE_MEASURES)
+
+        Returns:
+            Cube
+        """
+        dimensions = dimensions or CUBE_DIMENSIONS
+        measures = measures or CUBE_MEASURES
+        if df.empty or not set(dimensions + measures).issubset(df.columns):
+            return cls(pd.DataFrame(columns=dimensions), None)
+
+        cells, cell_ids = aggregate_cells(df, dimensions, measures)
+        correlation = CorrelationStats.build(df, cell_ids, len(cells))
+        return cls.from_cells(cells, dimensions, correlation)
+
+    @classmethod
+    def from_cells(cls, cells, dimensions=None, correlation=None, dtypes=None):
+        """
+        Cube over already aggregated cells
+
+        Args:
+            cells: DataFrame from aggregate_cells / combine_cells
+            dimensions: list of grouping columns (default: CUBE_DIMENSIONS)
+            correlation: CorrelationStats aligned with the cells
+            dtypes: dict of dimension -> dtype of the raw column, applied
+                before the dimensions become categoricals
+
+        Returns:
+            Cube
+        """
+        dimensions = dimensions or CUBE_DIMENSIONS
+        # Dimensions are kept as categoricals so rollups can work on their codes
+        for d in dimensions:
+            if dtypes and d in dtypes:
+                cells[d] = cells[d].astype(dtypes[d])
+            if not isinstance(cells[d].dtype, pd.CategoricalDtype):
+                cells[d] = cells[d].astype('category')
+        return cls(cells, FilterIndex.build(cells), correlation)
+
+    def positions(self, filters):
+        """Positions of the cells matching the filters (None when unfiltered)"""
+        if self.index is None:
+            return None
+        return self.index.rows(filters)
+
+    def select(self, filters):
+        """Cube cells matching the filters (the shared cell frame when unfiltered)"""
+        rows = self.positions(filters)
+        return self.cells if rows is None else self.cells.take(rows)
+
+    def correlation_pairs(self, filters):
+        """General correlation pairs over the rows matching the filters"""
+        if self.correlation is None:
+            return []
+        return self.correlation.pairs(self.positions(filters))
+
+
+def aggregate_cells(df, dimensions=None, measures=None, offset=0, undated=None):
+    """
+    Group raw rows into cells of additive statistics
+
+    Args:
+        df: pandas DataFrame with the raw rows
+        dimensions: list of grouping columns (default: CUBE_DIMENSIONS)
+        measures: list of additive measures (default: CUBE_MEASURES)
+        offset: int - position of the first row of df in the whole dataset
+        undated: int - date position recorded for cells without a date
+            (default: the number of rows in df)
+
+    Returns:
+        (cells, cell_ids) - the cell frame and the cell position of every row
+    """
+    dimensions = dimensions or CUBE_DIMENSIONS
+    measures = measures or CUBE_MEASURES
+    work = {d: df[d] for d in dimensions}
+    aggregations = {ROW_COUNT: (dimensions[0], 'size')}
+    for m in measures:
+        values = df[m].to_numpy(dtype=float)
+        work[m] = values
+        work[_stat(m, 'sq')] = values * values
+        aggregations[m] = (m, 'sum')
+        aggregations[_stat(m, 'count')] = (m, 'count')
+        aggregations[_stat(m, 'sumsq')] = (_stat(m, 'sq'), 'sum')
+        aggregations[_stat(m, 'min')] = (m, 'min')
+        aggregations[_stat(m, 'max')] = (m, 'max')
+    for i, a in enumerate(measures):
+        for b in measures[i + 1:]:
+            work[f"{a}__x__{b}"] = work[a] * work[b]
+            aggregations[f"{a}__x__{b}"] = (f"{a}__x__{b}", 'sum')
+
+    if 'date' in df.columns:
+        dated = df['date'].notna().to_numpy()
+        work['date'] = df['date']
+        work[DATE_POSITION] = np.where(dated, offset + np.arange(len(df)), len(df) if undated is None else undated)
+        aggregations['date'] = ('date', 'first')
+        aggregations[DATE_POSITION] = (DATE_POSITION, 'min')
+
+    # dropna=False keeps rows with a missing key in some dimension, so
+    # rollups over the other dimensions still include them.
+    grouped = (pd.DataFrame(work, index=df.index)
+               .groupby(dimensions, observed=True, dropna=False, sort=True))
+    cells = grouped.agg(**aggregations).reset_index()
+    # Cell position of every raw row, in the same order as the cells
+    return cells, grouped.ngroup().to_numpy()
+
+
+def combine_cells(parts, dimensions=None):
+    """
+    Merge partial cell frames (e.g. one per chunk of rows) into one cell per key
+
+    Args:
+        parts: list of cell frames from aggregate_cells
+        dimensions: list of grouping columns (default: CUBE_DIMENSIONS)
+
+    Returns:
+        (cells, cell_ids) - the merged cells and the merged position of every
+        input cell, in the order of the concatenated parts
+    """
+    dimensions = dimensions or CUBE_DIMENSIONS
+    frame = pd.concat(parts, ignore_index=True)
+    order = None
+    if DATE_POSITION in frame.columns:
+        # 'first' then picks the date of the earliest dated row of each key
+        order = np.argsort(frame[DATE_POSITION].to_numpy(), kind='stable')
+        frame = frame.take(order)
+
+    aggregations = {}
+    for column in frame.columns:
+        if column in dimensions:
+            continue
+        if column == 'date':
+            how = 'first'
+        elif column == DATE_POSITION or column.endswith('__min'):
+            how = 'min'
+        elif column.endswith('__max'):
+            how = 'max'
+        else:
+            how = 'sum'
+        aggregations[column] = (column, how)
+
+    grouped = frame.groupby(dimensions, observed=True, dropna=False, sort=True)
+    cells = grouped.agg(**aggregations).reset_index()
+    cell_ids = grouped.ngroup().to_numpy()
+    if order is not None:
+        restored = np.empty_like(cell_ids)
+        restored[order] = cell_ids
+        cell_ids = restored
+    return cells, cell_ids
+
+
+def summarize(cells, measure):
+    """
+    KPI summary for a measure over the selected cells
+
+    Matches sum/mean/min/max/count of the raw column over the same rows.
+    """
+    has_rows = cells[ROW_COUNT].sum() > 0 if len(cells) else False
+    total = float(cells[measure].sum())
+    count = int(cells[_stat(measure, 'count')].sum())
+    return {
+        'sum': total,
+        'average': (total / count if count else float('nan')) if has_rows else 0.0,
+        'min': float(cells[_stat(measure, 'min')].min()) if has_rows else 0.0,
+        'max': float(cells[_stat(measure, 'max')].max()) if has_rows else 0.0,
+        'count': count,
+    }
@@ -1,47 +1,418 @@
 """
 Data loader module for loading and caching the CSV dataset.
+
+Everything derived from one load of the dataset (frame, filter index, cube,
+catalog) is held in an immutable DatasetState. Reloading builds a complete
+new state next to the current one and swaps it in with a single assignment,
+so a request that took the old state finishes on it while new requests see
+the new one.
 """
 import pandas as pd
 import logging
+import threading
+import time
 from django.conf import settings
+from . import ingest, schema, shared, snapshot
+from .cache import get_response_cache
+from .catalog import build_catalog
+from .cube import Cube
+from .filter_index import FilterIndex
+from .periods import CalendarKeys
 
 logger = logging.getLogger(__name__)
 
 
+def read_dataset(path):
+    """
+    Parse the CSV dataset, coerce dates and numbers and apply the compact schema
+
+    Returns:
+        (DataFrame, stats) where stats is the schema memory report
+    """
+    df = coerce_columns(pd.read_csv(path))
+    return schema.optimize_frame(df)
+
+
+def coerce_columns(df):
+    """Apply the date and numeric coercions the rest of the app relies on"""
+    # Convert date column to datetime
+    df['date'] = pd.to_datetime(df['date'], format='%d-%m-%Y', errors='coerce')
+    # Ensure numeric columns are properly typed
+    df['SalesValue'] = pd.to_numeric(df['SalesValue'], errors='coerce')
+    df['Volume'] = pd.to_numeric(df['Volume'], errors='coerce')
+    df['Year'] = pd.to_numeric(df['Year'], errors='coerce').astype('Int64')
+    df['Month'] = pd.to_numeric(df['Month'], errors='coerce').astype('Int64')
+    return df
+
+
+class DatasetState:
+    """
+    One loaded version of the dataset and everything derived from it
+
+    `version` is the source content hash (shared by every worker, used for
+    caches and ETags); `generation` increases by one with every swap in this
+    process.
+    """
+
+    def __init__(self, frame, index, cube, catalog, version, stats=None, source=None,
+                 segment=None, load_duration=0.0):
+        self.frame = frame
+        self.index = index
+        self.cube = cube
+        self.catalog = catalog
+        self.version = version
+        self.stats = stats
+        self.source = source
+        self.segment = segment
+        self.load_duration = load_duration
+        self.generation = 0
+        self.loaded_at = time.time()
+        self._calendar = None
+
+    @property
+    def calendar(self):
+        """Integer week keys of the rows (periods.CalendarKeys), built once"""
+        if self._calendar is None:
+            self._calendar = CalendarKeys.build(self.frame)
+        return self._calendar
+
+    @classmethod
+    def empty(cls):
+        """State served when the dataset cannot be loaded"""
+        frame = pd.DataFrame()
+        return cls(frame, None, Cube.build(frame), build_catalog(None), 'empty')
+
+    @classmethod
+    def from_frame(cls, frame, version, **kwargs):
+        """Build the index, cube and catalog for a loaded frame"""
+        index = FilterIndex.build(frame)
+        return cls(frame, index, Cube.build(frame), build_catalog(index), version, **kwargs)
+
+
 class DataLoader:
     _instance = None
-    _data = None
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(DataLoader, cls).__new__(cls)
+            cls._instance._state = None
+            cls._instance._generation = 0
+            cls._instance._build_lock = threading.Lock()
+            cls._instance._reload_lock = threading.Lock()
+            cls._instance._reload_thread = None
+            cls._instance._reload_pending = False
         return cls._instance
-    
+
     def load_data(self):
         """Load the CSV data into memory (singleton pattern for efficiency)"""
-        if self._data is None:
+        return self.get_state().frame
+
+    def get_state(self):
+        """
+        Current DatasetState, loading it on first use
+
+        Take the state once per request and read everything from it, so the
+        request is answered from a single dataset version even if a reload
+        swaps in a new one meanwhile.
+        """
+        state = self._state
+        if state is None:
+            with self._build_lock:
+                if self._state is None:
+                    try:
+                        self._swap(self._build_state())
+                    except Exception as e:
+                        logger.error(f"Error loading data: {e}", exc_info=True)
+                        self._swap(DatasetState.empty())
+                    from .reload import start_watcher
+                    start_watcher(self)
+                state = self._state
+        return state
+
+    def reload(self):
+        """
+        Build a fresh state from the source and swap it in
+
+        The current state keeps serving while the new one is built. If the
+        content (and shared segment) did not change nothing is swapped; if the
+        build fails the error is raised and the current state stays active.
+
+        Returns:
+            the active DatasetState
+        """
+        with self._build_lock:
+            state = self._build_state()
+            current = self._state
+            if current is not None and (state.version, state.segment) == (current.version, current.segment):
+                logger.info(f"Dataset {current.version} unchanged, keeping generation {current.generation}")
+                return current
+            self._swap(state)
+            return state
+
+    def reload_async(self):
+        """
+        Reload in a background thread
+
+        Requests made while a reload runs are coalesced into one more reload
+        after it finishes.
+
+        Returns:
+            bool - True when a new reload thread was started
+        """
+        with self._reload_lock:
+            if self._reload_thread is not None:
+                self._reload_pending = True
+                return False
+            self._reload_thread = threading.Thread(target=self._reload_worker, name='dataset-reload', daemon=True)
+            self._reload_thread.start()
+            return True
+
+    def _reload_worker(self):
+        while True:
             try:
-                self._data = pd.read_csv(settings.DATASET_PATH)
-                # Convert date column to datetime
-                self._data['date'] = pd.to_datetime(self._data['date'], format='%d-%m-%Y', errors='coerce')
-                # Ensure numeric columns are properly typed
-                self._data['SalesValue'] = pd.to_numeric(self._data['SalesValue'], errors='coerce')
-                self._data['Volume'] = pd.to_numeric(self._data['Volume'], errors='coerce')
-                self._data['Year'] = pd.to_numeric(self._data['Year'], errors='coerce').astype('Int64')
-                self._data['Month'] = pd.to_numeric(self._data['Month'], errors='coerce').astype('Int64')
-                logger.info(f"Successfully loaded data with {len(self._data)} rows")
+                self.reload()
             except Exception as e:
-                logger.error(f"Error loading data: {e}", exc_info=True)
-                self._data = pd.DataFrame()
-        return self._data
-    
+                logger.error(f"Dataset reload failed, keeping the current version: {e}", exc_info=True)
+            with self._reload_lock:
+                if not self._reload_pending:
+                    self._reload_thread = None
+                    return
+                self._reload_pending = False
+
+    def is_loaded(self):
+        """True once a dataset state is being served"""
+        return self._state is not None
+
+    def is_reloading(self):
+        """True while a background reload is running"""
+        return self._reload_thread is not None
+
+    def _swap(self, state):
+        """Make a fully built state current"""
+        self._generation += 1
+        state.generation = self._generation
+        get_response_cache().activate(state.version)
+        self._state = state
+        logger.info(f"Serving dataset {state.version} (generation {state.generation}, "
+                    f"{len(state.frame)} rows, loaded in {state.load_duration:.2f}s)")
+
+    def _build_state(self):
+        """Load the dataset from the shared segment or the source, timing the load"""
+        started = time.perf_counter()
+        if shared.shared_settings()['ENABLED']:
+            state = self._build_shared()
+        else:
+            state = self._build_local()
+        # Calendar keys are part of the load, not of the first weekly request
+        state.calendar
+        state.load_duration = time.perf_counter() - started
+        return state
+
+    def _build_local(self):
+        """Load the frame and build the index, cube and catalog in this process"""
+        if ingest.use_chunked(settings.DATASET_PATH):
+            return self._build_chunked()
+        frame, stats, source = self._load_frame()
+        return DatasetState.from_frame(frame, self._version_of(source), stats=stats, source=source)
+
+    def _build_chunked(self):
+        """
+        Out-of-core load for datasets larger than DATASET_MEMORY_BUDGET
+
+        A current snapshot is memory-mapped and folded into the index and
+        cube slice by slice; otherwise the CSV is streamed in chunks and its
+        typed columns are spilled to the snapshot directory (or kept in
+        memory when snapshots are disabled).
+        """
+        source_path = settings.DATASET_PATH
+        rows = ingest.chunk_rows(source_path, coerce=coerce_columns)
+        snapshot_path = settings.DATASET_SNAPSHOT_PATH
+        if settings.DATASET_SNAPSHOT_ENABLED:
+            try:
+                frame, manifest = snapshot.load_snapshot(source_path, snapshot_path)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable snapshot at {snapshot_path}: {e}")
+                frame = None
+            if frame is not None:
+                logger.info(f"Loaded dataset snapshot from {snapshot_path}")
+                index, cube = ingest.fold_frame(frame, rows)
+                return DatasetState(frame, index, cube, build_catalog(index), self._version_of(manifest['source']),
+                                    stats=manifest.get('stats'), source=manifest['source'])
+
+        source = snapshot.file_fingerprint(source_path)
+        spill = settings.DATASET_SNAPSHOT_ENABLED and settings.DATASET_SNAPSHOT_AUTOBUILD
+        frame, index, cube, stats = ingest.ingest_csv(
+            source_path, coerce_columns, rows,
+            store_path=snapshot_path if spill else None, meta={'source': source},
+        )
+        return DatasetState(frame, index, cube, build_catalog(index), self._version_of(source),
+                            stats=stats, source=source)
+
+    def _build_shared(self):
+        """
+        Attach to the dataset published in shared memory
+
+        When no current segment matches the source file and AUTOPUBLISH is
+        set, the first process to take the publish lock loads the dataset and
+        publishes it; the others wait on the lock and attach to its segment.
+        """
+        config = shared.shared_settings()
+        root = config['PATH']
+        attached = self._attach_current(root)
+        if attached is None and config['AUTOPUBLISH']:
+            with shared.publish_lock(root):
+                attached = self._attach_current(root)
+                if attached is None:
+                    self.publish_shared()
+                    attached = self._attach_current(root)
+        if attached is None:
+            logger.warning(f"No current shared dataset under {root}, loading a private copy")
+            return self._build_local()
+
+        manifest = attached['manifest']
+        logger.info(f"Attached to shared dataset segment {attached['segment']}")
+        return DatasetState(
+            attached['frame'], attached['index'], attached['cube'], attached['catalog'], attached['version'],
+            stats=manifest.get('stats'), source=manifest.get('source'), segment=attached['segment'],
+        )
+
+    @staticmethod
+    def _attach_current(root):
+        """Attach to the current segment if it was published from the current source file"""
+        attached = shared.attach(root)
+        if attached is None or not snapshot.snapshot_is_current(attached['manifest'], settings.DATASET_PATH):
+            return None
+        return attached
+
+    def publish_shared(self):
+        """
+        Load the dataset in this process and publish it as a new shared segment
+
+        Returns:
+            str - name of the published segment
+        """
+        config = shared.shared_settings()
+        state = self._build_local()
+        return shared.publish(
+            config['PATH'], state.version, state.frame, state.index, state.cube, state.catalog,
+            extra={'source': state.source, 'stats': state.stats}, keep=config['KEEP'],
+        )
+
+    def _load_frame(self):
+        """
+        Load from the columnar snapshot when it is current, else parse the CSV
+
+        Returns:
+            (DataFrame, stats, source fingerprint)
+        """
+        source_path = settings.DATASET_PATH
+        if not settings.DATASET_SNAPSHOT_ENABLED:
+            source = snapshot.file_fingerprint(source_path)
+            frame, stats = read_dataset(source_path)
+            return frame, stats, source
+
+        snapshot_path = settings.DATASET_SNAPSHOT_PATH
+        try:
+            frame, manifest = snapshot.load_snapshot(source_path, snapshot_path)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable snapshot at {snapshot_path}: {e}")
+            frame = None
+        if frame is not None:
+            # Snapshots are written from the already-compacted frame
+            logger.info(f"Loaded dataset snapshot from {snapshot_path}")
+            return frame, manifest.get('stats'), manifest['source']
+
+        fingerprint = snapshot.file_fingerprint(source_path)
+        frame, stats = read_dataset(source_path)
+        if settings.DATASET_SNAPSHOT_AUTOBUILD:
+            try:
+                snapshot.write_snapshot(frame, source_path, snapshot_path, fingerprint=fingerprint,
+                                        extra={'stats': stats})
+            except Exception as e:
+                logger.warning(f"Could not write snapshot to {snapshot_path}: {e}")
+        return frame, stats, fingerprint
+
+    @staticmethod
+    def _version_of(fingerprint):
+        """Dataset version derived from the source content hash"""
+        return fingerprint['sha256'][:16]
+
+    def get_version(self):
+        """
+        Version of the loaded dataset
+
+        Derived from the source file's content, so every worker loading the
+        same file agrees on it and caches keyed by it can be shared.
+        """
+        return self.get_state().version
+
+    def build_snapshot(self):
+        """Re-parse the CSV and rewrite the snapshot, returning the new frame"""
+        source_path = settings.DATASET_PATH
+        if ingest.use_chunked(source_path):
+            frame, _, _, _ = ingest.ingest_csv(
+                source_path, coerce_columns, ingest.chunk_rows(source_path, coerce=coerce_columns),
+                store_path=settings.DATASET_SNAPSHOT_PATH, meta={'source': snapshot.file_fingerprint(source_path)},
+            )
+            return frame
+        frame, stats = read_dataset(source_path)
+        snapshot.write_snapshot(frame, settings.DATASET_PATH, settings.DATASET_SNAPSHOT_PATH,
+                                extra={'stats': stats})
+        return frame
+
+    def get_stats(self):
+        """
+        Report the in-memory footprint of the loaded dataset
+
+        Returns:
+            dict with row count, memory before/after the compact schema
+            (bytes), the dtype of every column, the number of cube cells and
+            the shared-memory segment the data is mapped from (if any)
+        """
+        state = self.get_state()
+        stats = dict(state.stats or {})
+        stats['rows'] = len(state.frame)
+        stats['memory_current'] = schema.memory_usage(state.frame)
+        stats['cube_cells'] = len(state.cube.cells)
+        stats['shared_segment'] = state.segment
+        return stats
+
+    def describe(self, load=True):
+        """
+        Version, generation, size and load timing of the active dataset
+
+        With load=False nothing is loaded and None is returned until the
+        first load has finished.
+        """
+        state = self.get_state() if load else self._state
+        if state is None:
+            return None
+        return {
+            'version': state.version,
+            'generation': state.generation,
+            'rows': len(state.frame),
+            'loadDuration': round(state.load_duration, 4),
+            'loadedAt': state.loaded_at,
+            'segment': state.segment,
+            'reloading': self.is_reloading(),
+        }
+
+    def get_filter_index(self):
+        """Get the bitmap filter index for the loaded data"""
+        return self.get_state().index
+
+    def get_filter_catalog(self):
+        """Get the filter option catalog, computed once per loaded dataset"""
+        return self.get_state().catalog
+
+    def get_cube(self):
+        """Get the pre-aggregated cube for the loaded data"""
+        return self.get_state().cube
+
     def get_data(self):
         """Get the loaded data"""
-        if self._data is None:
-            self.load_data()
-        return self._data
+        return self.get_state().frame
 
 
 # Global data loader instance
 data_loader = DataLoader()
-
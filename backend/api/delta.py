@@ -0,0 +1,393 @@
+"""
+Incremental /api/data/ recomputation when one filter value is toggled.
+
+A request opting in with 'delta' has the root groupings of its aggregation
+plan (the groupings read from the cube cells) recorded as dense arrays over
+every group of the full cube, under the response's ETag. A later request
+naming that ETag as its base, whose selection differs by adding or removing
+one value of one non-empty filter, starts from the recorded sums and adds or
+subtracts the toggled value's slice of cells only. Sums and counts are
+additive; the first date of a group (a minimum) is merged when adding and
+recomputed from the new selection when removing. The KPI stats and the
+correlations are rolled up from the selected cells as usual (min/max and the
+sufficient statistics are cheap there), and the rollups, labels and
+serialization run unchanged on the updated groupings.
+
+With mode 'patch' the response only lists what changed against the base
+response: upserted and removed rows of record datasets (matched on their key
+columns) and replacement values for the other outputs.
+"""
+import json
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+from django.conf import settings
+from .cache import canonical_filters
+from .cube import DATE_POSITION
+from .filter_index import FILTER_DIMENSIONS
+from .renderers import RECORDS, dumps
+from .utils import DATASET_SPECS, plan_aggregations
+
+DEFAULT_DELTA_SETTINGS = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 64,
+}
+
+DELTA_MODES = ('full', 'patch')
+
+# Larger than any date position, marks groups without a dated cell yet
+_NO_DATE = np.iinfo(np.int64).max
+
+
+def delta_settings():
+    return dict(DEFAULT_DELTA_SETTINGS, **getattr(settings, 'DELTA', {}))
+
+
+def parse_delta(payload):
+    """
+    Read the optional 'delta' of a /api/data/ payload
+
+    Accepts true (record this response as a base) or an object with an
+    optional 'base' (ETag of a previous delta response, quoted or not) and
+    'mode' ('full' or 'patch').
+
+    Returns:
+        None, or dict with 'base' (digest or None) and 'mode'
+
+    Raises:
+        ValueError: for an unknown mode or a malformed value
+    """
+    delta = payload.get('delta')
+    if delta is None or delta is False or not delta_settings()['ENABLED']:
+        return None
+    if delta is True:
+        delta = {}
+    if not isinstance(delta, dict):
+        raise ValueError("'delta' must be true or an object")
+    mode = delta.get('mode', 'full')
+    if mode not in DELTA_MODES:
+        raise ValueError(f"Unknown delta mode {mode!r}, expected one of {', '.join(DELTA_MODES)}")
+    base = delta.get('base')
+    if base is not None:
+        base = str(base).strip()
+        if base.startswith('W/'):
+            base = base[2:]
+        # Drop the quotes and any content-encoding suffix of the ETag
+        base = base.strip('"').split('-', 1)[0]
+    return {'base': base or None, 'mode': mode}
+
+
+def toggled_value(old, new):
+    """
+    The single filter value toggled between two selections
+
+    Returns:
+        (filter key, value, +1 when added / -1 when removed), or None when the
+        selections differ otherwise (or a selection goes from or to "all")
+    """
+    old, new = canonical_filters(old), canonical_filters(new)
+    changed = [key for key in FILTER_DIMENSIONS if old.get(key) != new.get(key)]
+    if len(changed) != 1 or changed[0] not in old or changed[0] not in new:
+        return None
+    key = changed[0]
+    before, after = set(old[key]), set(new[key])
+    added, removed = after - before, before - after
+    if len(added) + len(removed) != 1:
+        return None
+    if added:
+        return key, added.pop(), 1
+    return key, removed.pop(), -1
+
+
+class GroupSpace:
+    """Every group of one key set over the full cube, with each cell's group id"""
+
+    def __init__(self, cells, keys):
+        keys = sorted(keys)
+        codes = {d: cells[d].cat.codes.to_numpy() for d in keys}
+        # Same folding as utils._group, so groups come out in the same order
+        combined = np.zeros(len(cells), dtype=np.int64)
+        radix = 1
+        for d in keys:
+            size = int(codes[d].max()) + 2 if len(cells) else 1
+            if radix * size >= 2 ** 62:
+                _, combined = np.unique(combined, return_inverse=True)
+                radix = int(combined.max()) + 1
+            combined = combined * size + (codes[d] + 1)
+            radix *= size
+        _, first, self.ids = np.unique(combined, return_index=True, return_inverse=True)
+        self.size = len(first)
+        self.codes = {d: codes[d][first] for d in keys}
+
+
+_spaces = weakref.WeakKeyDictionary()
+_spaces_lock = threading.Lock()
+
+
+def group_space(cube, keys):
+    """GroupSpace of a key set, computed once per cube"""
+    with _spaces_lock:
+        spaces = _spaces.setdefault(cube, {})
+        space = spaces.get(keys)
+    if space is None:
+        space = GroupSpace(cube.cells, keys)
+        with _spaces_lock:
+            spaces[keys] = space
+    return space
+
+
+class GroupSums:
+    """Dense per-group sums of one root grouping for one selection of cells"""
+
+    def __init__(self, counts, measures, date_pos=None, date=None):
+        self.counts = counts
+        self.measures = measures
+        self.date_pos = date_pos
+        self.date = date
+
+    @classmethod
+    def collect(cls, cube, space, measures, first_date, rows):
+        """Sum the cells at `rows` (None for all) into the group space"""
+        cells = cube.cells
+        ids = space.ids if rows is None else space.ids[rows]
+
+        def column(name):
+            values = cells[name].to_numpy()
+            return values if rows is None else values[rows]
+
+        sums = cls(
+            np.bincount(ids, minlength=space.size),
+            {m: np.bincount(ids, weights=column(m).astype(float), minlength=space.size) for m in measures},
+        )
+        if first_date:
+            sums.date_pos = np.full(space.size, _NO_DATE, dtype=np.int64)
+            sums.date = np.full(space.size, np.datetime64('NaT'), dtype=cells['date'].to_numpy().dtype)
+            if len(ids):
+                positions, dates = column(DATE_POSITION).astype(np.int64), column('date')
+                order = np.lexsort((positions, ids))
+                heads = order[np.r_[0, np.flatnonzero(np.diff(ids[order])) + 1]]
+                sums.date_pos[ids[heads]] = positions[heads]
+                sums.date[ids[heads]] = dates[heads]
+        return sums
+
+    def combine(self, other, sign):
+        """New sums with `other` added (sign 1) or subtracted (sign -1)"""
+        counts = self.counts + sign * other.counts
+        measures = {m: self.measures[m] + sign * values for m, values in other.measures.items()}
+        for values in measures.values():
+            # Emptied groups are exactly zero, not a rounding residue
+            values[counts == 0] = 0.0
+        result = GroupSums(counts, measures)
+        if other.date_pos is not None and sign > 0:
+            earlier = other.date_pos < self.date_pos
+            result.date_pos = np.where(earlier, other.date_pos, self.date_pos)
+            result.date = np.where(earlier, other.date, self.date)
+        return result
+
+    def grouped(self, space):
+        """The groups present in the selection, shaped like utils._group output"""
+        present = np.flatnonzero(self.counts > 0)
+        result = {
+            'codes': {d: codes[present] for d, codes in space.codes.items()},
+            'measures': {m: values[present] for m, values in self.measures.items()},
+        }
+        if self.date_pos is not None:
+            result['date_pos'] = self.date_pos[present]
+            result['date'] = self.date[present]
+        return result
+
+
+def root_steps(names):
+    """(keys, measures, first_date) of the plan steps read from the cube"""
+    return [
+        (keys, frozenset(measures), first_date)
+        for keys, measures, first_date, parent in plan_aggregations(names)
+        if parent is None
+    ]
+
+
+def _covers(sums, steps):
+    """True when recorded sums hold every measure (and first date) the steps need"""
+    for keys, measures, first_date in steps:
+        recorded = sums.get(keys)
+        if recorded is None or not measures <= set(recorded.measures):
+            return False
+        if first_date and recorded.date_pos is None:
+            return False
+    return True
+
+
+def collect_roots(cube, steps, rows):
+    """GroupSums of every root grouping for the cells at `rows`"""
+    return {
+        keys: GroupSums.collect(cube, group_space(cube, keys), measures, first_date, rows)
+        for keys, measures, first_date in steps
+    }
+
+
+def apply_toggle(cube, steps, base_sums, filters, toggle):
+    """
+    Update the base selection's sums for one toggled filter value
+
+    Returns:
+        dict of root key set -> GroupSums of the new selection
+    """
+    key, value, sign = toggle
+    toggled = dict(canonical_filters(filters), **{key: [value]})
+    slice_rows = cube.positions(toggled)
+    new_rows = None
+    sums = {}
+    for keys, measures, first_date in steps:
+        space = group_space(cube, keys)
+        if first_date and sign < 0:
+            # A removed slice may hold a group's first date: recompute the minimum
+            if new_rows is None:
+                new_rows = cube.positions(filters)
+            sums[keys] = GroupSums.collect(cube, space, measures, first_date, new_rows)
+        else:
+            part = GroupSums.collect(cube, space, measures, first_date, slice_rows)
+            sums[keys] = base_sums[keys].combine(part, sign)
+    return sums
+
+
+class DeltaEntry:
+    """
+    Recorded root sums of one delta response, stored under its ETag digest
+
+    body_key is the response cache key of the body that was sent, the base
+    of later patches.
+    """
+
+    def __init__(self, version, body_key, filters, sums):
+        self.version = version
+        self.body_key = body_key
+        self.filters = filters
+        self.sums = sums
+
+
+class DeltaStore:
+    """Bounded LRU of DeltaEntry by ETag digest"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.incremental = 0
+        self.recomputed = 0
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+            return entry
+
+    def put(self, digest, entry):
+        with self._lock:
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def count(self, incremental):
+        with self._lock:
+            if incremental:
+                self.incremental += 1
+            else:
+                self.recomputed += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'incremental': self.incremental, 'recomputed': self.recomputed}
+
+
+_delta_store = None
+_store_lock = threading.Lock()
+
+
+def get_delta_store():
+    global _delta_store
+    if _delta_store is None:
+        with _store_lock:
+            if _delta_store is None:
+                _delta_store = DeltaStore(delta_settings()['MAX_ENTRIES'])
+    return _delta_store
+
+
+def selection_sums(state, base, filters, names):
+    """
+    Root group sums of a selection for the tabular outputs `names`
+
+    Computed from the base entry when it is on the same dataset version,
+    holds the sums these outputs need, and its selection differs by one
+    toggled filter value; from the selected cells otherwise.
+
+    Returns:
+        (sums, True when computed incrementally)
+    """
+    store = get_delta_store()
+    steps = root_steps(names)
+    if base is not None and base.version == state.version and _covers(base.sums, steps):
+        toggle = toggled_value(base.filters, filters)
+        if toggle is not None:
+            store.count(True)
+            return apply_toggle(state.cube, steps, base.sums, filters, toggle), True
+    store.count(False)
+    return collect_roots(state.cube, steps, state.cube.positions(filters)), False
+
+
+def roots_of(state, sums):
+    """utils._group-shaped root groupings for build_datasets"""
+    return {keys: group_sums.grouped(group_space(state.cube, keys)) for keys, group_sums in sums.items()}
+
+
+def _row_key(row, keys):
+    return tuple(row.get(k) for k in keys)
+
+
+def diff_body(base_body, body, response_format):
+    """
+    Changes between two /api/data/ bodies
+
+    Record datasets whose rows carry their key columns are diffed row by row:
+    {'keys', 'upsert': [rows], 'remove': [key values]}, plus 'order' (the key
+    values of every row) when removing, replacing in place and appending the
+    new rows does not give the new row order. Any other changed output is
+    sent whole as {'replace': value}. Unchanged outputs are left out.
+    """
+    before, after = json.loads(base_body), json.loads(body)
+    changes = {}
+    for name, new in after.items():
+        old = before.get(name)
+        if old == new:
+            continue
+        keys = DATASET_SPECS[name]['keys'] if name in DATASET_SPECS else None
+        if keys and response_format == RECORDS and isinstance(old, list) \
+                and all(set(keys) <= set(rows[0]) for rows in (old, new) if rows):
+            old_rows = {_row_key(row, keys): row for row in old}
+            new_order = [_row_key(row, keys) for row in new]
+            present = set(new_order)
+            upsert = [row for row_key, row in zip(new_order, new) if old_rows.get(row_key) != row]
+            change = {
+                'keys': keys,
+                'upsert': upsert,
+                'remove': [list(row_key) for row_key in old_rows if row_key not in present],
+            }
+            patched = [row_key for row_key in old_rows if row_key in present]
+            patched += [row_key for row_key in new_order if row_key not in old_rows]
+            if patched != new_order:
+                change['order'] = [list(row_key) for row_key in new_order]
+            changes[name] = change
+        else:
+            changes[name] = {'replace': new}
+    return changes
+
+
+def patch_body(base_digest, digest, changes):
+    """Serialized patch response"""
+    return dumps({'delta': {'base': base_digest, 'etag': digest}, 'changes': changes})
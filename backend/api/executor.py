@@ -0,0 +1,178 @@
+"""
+Bounded thread pool for CPU-bound work of the async views.
+
+The aggregation and serialization kernels (NumPy, pandas, json) release the
+GIL for much of their time, so a pool of threads gives real parallelism
+while the event loop stays free for cheap requests such as /api/health/.
+At most WORKERS tasks run at once and at most QUEUE more wait for a thread;
+beyond that a task is refused straight away with Overloaded so the view can
+answer 503 instead of piling up latency. A queued task that did not start
+within QUEUE_TIMEOUT seconds is dropped the same way.
+
+A second, separate pool fans the independent aggregations of a single
+/api/data/ request out across cores (DATA_PARALLELISM). It is kept apart
+from the compute pool so a request never waits on its own queue.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from .profiling import profiled_thread
+
+DEFAULT_POOL_SETTINGS = {
+    'WORKERS': min(8, os.cpu_count() or 1),
+    'QUEUE': 32,
+    'QUEUE_TIMEOUT': 10.0,
+}
+
+DEFAULT_FANOUT_SETTINGS = {
+    'MODE': 'serial',
+    'WORKERS': min(4, os.cpu_count() or 1),
+    'MIN_CELLS': 50000,
+}
+
+FANOUT_MODES = ('serial', 'threads')
+
+
+class Overloaded(Exception):
+    """The pool is saturated; the request should be retried later"""
+
+
+class ComputePool:
+    """Thread pool with a bounded queue and counters for the health endpoint"""
+
+    def __init__(self, workers, queue, queue_timeout):
+        self.workers = workers
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='eda-compute')
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+
+    async def run(self, fn, *args):
+        """
+        Run fn(*args) on the pool and await its result
+
+        Raises:
+            Overloaded: when the queue is full or the task waited too long
+        """
+        with self._lock:
+            if self.pending >= self.workers + self.queue:
+                self.rejected += 1
+                raise Overloaded(f"{self.pending} requests in progress")
+            self.pending += 1
+        submitted = time.monotonic()
+        # Run in the caller's context, so request-scoped metrics reach the thread
+        context = contextvars.copy_context()
+
+        def task():
+            if time.monotonic() - submitted > self.queue_timeout:
+                with self._lock:
+                    self.expired += 1
+                raise Overloaded(f"Queued for more than {self.queue_timeout}s")
+            with self._lock:
+                self.running += 1
+            try:
+                # Sampled with the request when it gets profiled
+                with profiled_thread():
+                    return fn(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        try:
+            future = self._executor.submit(context.run, task)
+        except BaseException:
+            self._release()
+            raise
+        # A cancelled awaiter stops waiting but a started task keeps running,
+        # so the slot is released when the task itself is done
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future=None):
+        with self._lock:
+            self.pending -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'running': self.running,
+                'queued': self.pending - self.running,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'expired': self.expired,
+            }
+
+
+_compute_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_compute_pool():
+    """Process-wide ComputePool configured from settings.COMPUTE_POOL"""
+    global _compute_pool
+    if _compute_pool is None:
+        with _pool_lock:
+            if _compute_pool is None:
+                config = dict(DEFAULT_POOL_SETTINGS, **getattr(settings, 'COMPUTE_POOL', {}))
+                _compute_pool = ComputePool(config['WORKERS'], config['QUEUE'], config['QUEUE_TIMEOUT'])
+    return _compute_pool
+
+
+def _profiled_call(fn, item):
+    with profiled_thread():
+        return fn(item)
+
+
+def serial_map(fn, items):
+    """Apply fn to every item in the calling thread"""
+    return [fn(item) for item in items]
+
+
+_fanout_executor = None
+
+
+def fanout_settings():
+    config = dict(DEFAULT_FANOUT_SETTINGS, **getattr(settings, 'DATA_PARALLELISM', {}))
+    if config['MODE'] not in FANOUT_MODES:
+        raise ValueError(f"DATA_PARALLELISM MODE must be one of {', '.join(FANOUT_MODES)}")
+    return config
+
+
+def get_fanout(size):
+    """
+    Map function for the independent tasks of one request
+
+    Args:
+        size: number of cube cells the request aggregates
+
+    Returns:
+        callable(fn, items) -> list of results in item order; runs the tasks
+        on the fan-out threads in 'threads' mode when size reaches MIN_CELLS,
+        otherwise serially (small selections are faster without the hand-off)
+    """
+    global _fanout_executor
+    config = fanout_settings()
+    if config['MODE'] == 'serial' or config['WORKERS'] < 2 or size < config['MIN_CELLS']:
+        return serial_map
+    if _fanout_executor is None:
+        with _pool_lock:
+            if _fanout_executor is None:
+                _fanout_executor = ThreadPoolExecutor(max_workers=config['WORKERS'], thread_name_prefix='eda-fanout')
+    executor = _fanout_executor
+
+    def fan_out(fn, items):
+        # Each task runs in a copy of the caller's context (request-scoped metrics)
+        context = contextvars.copy_context()
+        return list(executor.map(lambda item: context.copy().run(_profiled_call, fn, item), items))
+    return fan_out
@@ -0,0 +1,157 @@
+"""
+Precomputed bitmap index over the filterable dimensions.
+
+For every value of Brand, PackType, PPG, Channel and Year the index keeps a
+packed bitset of the rows holding that value. A filter request ORs the
+bitsets within a dimension, ANDs them across dimensions and turns the result
+into row positions for a single take() on the frame.
+"""
+import numpy as np
+import pandas as pd
+
+# Filter payload key -> dataset column
+FILTER_DIMENSIONS = {
+    'brands': 'Brand',
+    'packTypes': 'PackType',
+    'ppgs': 'PPG',
+    'channels': 'Channel',
+    'years': 'Year',
+}
+
+
+def _words(length):
+    """Number of 64-bit words needed to hold one bit per row"""
+    return (length + 63) // 64
+
+
+def pack_mask(mask):
+    """Pack a boolean row mask into a uint64 bitset"""
+    packed = np.packbits(mask, bitorder='little')
+    words = np.zeros(_words(len(mask)) * 8, dtype=np.uint8)
+    words[:len(packed)] = packed
+    return words.view(np.uint64)
+
+
+def unpack_mask(bitset, length):
+    """Expand a uint64 bitset back into a boolean row mask"""
+    return np.unpackbits(bitset.view(np.uint8), count=length, bitorder='little').view(bool)
+
+
+def integral_value(value):
+    """
+    Coerce a filter value like '2021' or 2021.0 to the int 2021
+
+    Values that are not integral ('2021.5', 'abc', nan) come back unchanged
+    rather than truncated, so they match nothing instead of the wrong year.
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    return int(number) if number.is_integer() else value
+
+
+def active_filters(filters):
+    """Yield (column, values) for every dimension with a non-empty selection"""
+    for key, column in FILTER_DIMENSIONS.items():
+        values = filters.get(key) if filters else None
+        if values and len(values) > 0:
+            yield column, values
+
+
+class FilterIndex:
+    """
+    Bitset index of row positions per value of each filter dimension
+
+    Alongside the bitsets it keeps each dimension's per-row value code
+    (position in the bitset dict, -1 for missing) for group-by style counts.
+    Indexes folded from chunks (ingest.IndexBuilder) only carry the bitsets.
+    """
+
+    def __init__(self, length, bitsets, numeric=(), codes=None):
+        self.length = length
+        self.bitsets = bitsets
+        self.numeric = set(numeric)
+        self.codes = codes or {}
+
+    @classmethod
+    def build(cls, df, columns=None):
+        """
+        Build the index for a DataFrame
+
+        Args:
+            df: pandas DataFrame
+            columns: list of columns to index (default: all filter dimensions)
+
+        Returns:
+            FilterIndex
+        """
+        columns = columns or list(FILTER_DIMENSIONS.values())
+        bitsets = {}
+        numeric = []
+        all_codes = {}
+        for column in columns:
+            if column not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[column], sort=True)
+            dtype = df[column].dtype
+            if isinstance(dtype, pd.CategoricalDtype):
+                dtype = dtype.categories.dtype
+            if pd.api.types.is_numeric_dtype(dtype):
+                numeric.append(column)
+            bitsets[column] = cls._bitsets_from_codes(codes, uniques)
+            all_codes[column] = codes.astype(np.int32)
+        return cls(len(df), bitsets, numeric, all_codes)
+
+    @staticmethod
+    def _bitsets_from_codes(codes, uniques):
+        """One bitset per distinct value, built from a single sort of the codes"""
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        start = int((codes < 0).sum())
+        result = {}
+        for value, count in zip(uniques.tolist(), counts):
+            mask = np.zeros(len(codes), dtype=bool)
+            mask[order[start:start + count]] = True
+            start += count
+            result[value] = pack_mask(mask)
+        return result
+
+    def _lookup(self, column, value):
+        """Bitset for a filter value, coercing e.g. '2021' to 2021 for numeric columns"""
+        bitset = self.bitsets[column].get(value)
+        if bitset is None and column in self.numeric:
+            coerced = integral_value(value)
+            if coerced is not value:
+                bitset = self.bitsets[column].get(coerced)
+        return bitset
+
+    def bitset(self, filters, exclude=None):
+        """
+        Combined bitset for a filter payload
+
+        Args:
+            filters: dict with filter keys (brands, packTypes, ppgs, channels, years)
+            exclude: str - a column to leave out of the selection
+
+        Returns:
+            uint64 bitset, or None when no filter is active
+        """
+        combined = None
+        for column, values in active_filters(filters):
+            if column == exclude or column not in self.bitsets:
+                continue
+            within = np.zeros(_words(self.length), dtype=np.uint64)
+            for value in values:
+                bitset = self._lookup(column, value)
+                if bitset is not None:
+                    np.bitwise_or(within, bitset, out=within)
+            combined = within if combined is None else np.bitwise_and(combined, within, out=combined)
+        return combined
+
+    def rows(self, filters):
+        """Row positions matching the filters, or None when no filter is active"""
+        combined = self.bitset(filters)
+        if combined is None:
+            return None
+        return np.flatnonzero(unpack_mask(combined, self.length))
@@ -0,0 +1,478 @@
+"""
+Chunked (out-of-core) ingestion of the CSV dataset.
+
+The eager path parses the whole CSV into one frame. For files larger than
+DATASET_MEMORY_BUDGET the CSV is instead read in chunks sized from the
+budget; every chunk gets the same coercions as the eager path and is folded
+into:
+
+- the cube: each chunk is aggregated to partial cells (plus per-cell
+  correlation statistics) and merged into the running cells,
+- the filter index: each chunk contributes one packed bitset slice per value
+  (chunks hold a multiple of 64 rows so slices land on word boundaries),
+- the column store: raw column values are appended to temporary files while
+  running statistics decide the compact schema; a second pass writes the
+  typed columns into a snapshot bundle that is memory-mapped afterwards.
+
+Peak memory is therefore bounded by the chunk size and the number of cube
+cells, not by the number of rows. The type of every column is fixed by the
+first chunk, as far as the CSV parser is concerned.
+"""
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from . import schema, snapshot
+from .correlation import CorrelationStats, candidate_columns, grouped_sufficient_stats
+from .cube import CUBE_DIMENSIONS, CUBE_MEASURES, DATE_POSITION, Cube, aggregate_cells, combine_cells
+from .filter_index import FILTER_DIMENSIONS, FilterIndex, _words, pack_mask
+
+logger = logging.getLogger(__name__)
+
+# Rows parsed up front to estimate the in-memory size of one row
+SAMPLE_ROWS = 1024
+# A chunk is parsed, coerced and aggregated at once; leave room for copies
+WORKING_SET_FACTOR = 4
+# Date position of undated cells until the total row count is known
+_UNDATED = np.iinfo(np.int64).max
+
+
+def memory_budget():
+    """DATASET_MEMORY_BUDGET in bytes"""
+    return int(getattr(settings, 'DATASET_MEMORY_BUDGET', 512 * 1024 * 1024))
+
+
+def use_chunked(path):
+    """
+    Whether the CSV should be ingested in chunks
+
+    DATASET_CHUNKED_INGEST is True, False or 'auto' (files larger than the
+    memory budget).
+    """
+    mode = getattr(settings, 'DATASET_CHUNKED_INGEST', 'auto')
+    if mode == 'auto':
+        return os.path.getsize(path) > memory_budget()
+    return bool(mode)
+
+
+def chunk_rows(path, budget=None, coerce=None):
+    """
+    Rows per chunk so one chunk's working set fits in the memory budget
+
+    Args:
+        path: str - CSV file
+        budget: int - bytes (default: DATASET_MEMORY_BUDGET)
+        coerce: callable applied to the sample, as to every chunk
+
+    Returns:
+        int - a positive multiple of 64
+    """
+    budget = budget or memory_budget()
+    sample = pd.read_csv(path, nrows=SAMPLE_ROWS)
+    if coerce is not None:
+        sample = coerce(sample)
+    per_row = max(schema.memory_usage(sample) / max(len(sample), 1), 1)
+    rows = int(budget // (per_row * WORKING_SET_FACTOR))
+    return max(64, rows - rows % 64)
+
+
+def _numeric_matrix(chunk, columns):
+    """Float matrix of the chunk's columns, non-numeric values as NaN"""
+    if not columns:
+        return np.empty((len(chunk), 0))
+    matrix = np.empty((len(chunk), len(columns)))
+    for i, column in enumerate(columns):
+        series = chunk[column]
+        if isinstance(series.dtype, pd.SparseDtype):
+            series = series.sparse.to_dense()
+        matrix[:, i] = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    return matrix
+
+
+class IndexBuilder:
+    """Filter index bitsets folded chunk by chunk"""
+
+    def __init__(self, columns=None):
+        self.columns = columns or list(FILTER_DIMENSIONS.values())
+        self.slices = {}
+        self.length = 0
+
+    def add(self, chunk):
+        if self.length % 64:
+            raise ValueError("Only the last chunk may hold a number of rows that is not a multiple of 64")
+        word = self.length // 64
+        for column in self.columns:
+            if column not in chunk.columns:
+                continue
+            codes, uniques = pd.factorize(chunk[column])
+            values = self.slices.setdefault(column, {})
+            for code, value in enumerate(uniques.tolist()):
+                values.setdefault(value, []).append((word, pack_mask(codes == code)))
+        self.length += len(chunk)
+
+    def finish(self, numeric=()):
+        """FilterIndex over every row seen (without per-row codes)"""
+        words = _words(self.length)
+        bitsets = {}
+        for column, values in self.slices.items():
+            bitsets[column] = {}
+            for value in sorted(values):
+                bitset = np.zeros(words, dtype=np.uint64)
+                for word, packed in values[value]:
+                    bitset[word:word + len(packed)] = packed
+                bitsets[column][value] = bitset
+        return FilterIndex(self.length, bitsets, [c for c in numeric if c in bitsets])
+
+
+class CubeBuilder:
+    """Cube cells and per-cell correlation statistics folded chunk by chunk"""
+
+    def __init__(self, dimensions=None, measures=None):
+        self.dimensions = dimensions or CUBE_DIMENSIONS
+        self.measures = measures or CUBE_MEASURES
+        self.cells = None
+        self.stats = None
+        self.columns = None
+        self.shift = None
+        self.low = None
+        self.high = None
+        self.length = 0
+
+    def add(self, chunk):
+        if not set(self.dimensions + self.measures).issubset(chunk.columns):
+            self.length += len(chunk)
+            return
+        cells, cell_ids = aggregate_cells(chunk, self.dimensions, self.measures,
+                                          offset=self.length, undated=_UNDATED)
+
+        if self.columns is None:
+            self.columns = candidate_columns(chunk)
+        values = _numeric_matrix(chunk, self.columns)
+        if self.shift is None:
+            # Centre on the first chunk's means; correlations do not depend on the shift
+            with np.errstate(invalid='ignore'):
+                self.shift = np.nan_to_num(np.nanmean(values, axis=0)) if len(values) else np.zeros(len(self.columns))
+            self.low = np.full(len(self.columns), np.inf)
+            self.high = np.full(len(self.columns), -np.inf)
+        present = ~np.isnan(values)
+        self.low = np.fmin(self.low, np.where(present, values, np.inf).min(axis=0, initial=np.inf))
+        self.high = np.fmax(self.high, np.where(present, values, -np.inf).max(axis=0, initial=-np.inf))
+        stats = grouped_sufficient_stats(values - self.shift, cell_ids, len(cells))
+
+        if self.cells is None:
+            self.cells, self.stats = cells, stats
+        else:
+            merged, merged_ids = combine_cells([self.cells, cells], self.dimensions)
+            self.stats = tuple(self._scatter(np.concatenate([old, new]), merged_ids, len(merged))
+                               for old, new in zip(self.stats, stats))
+            self.cells = merged
+        self.length += len(chunk)
+
+    @staticmethod
+    def _scatter(values, ids, n):
+        out = np.zeros((n,) + values.shape[1:])
+        np.add.at(out, ids, values)
+        return out
+
+    def finish(self, frame):
+        """
+        Cube over every row seen
+
+        Args:
+            frame: the typed frame the rows end up in, whose dtypes the
+                dimensions and correlation columns follow
+        """
+        if self.cells is None:
+            return Cube(pd.DataFrame(columns=self.dimensions), None)
+        cells = self.cells
+        if DATE_POSITION in cells.columns:
+            positions = cells[DATE_POSITION].to_numpy()
+            cells[DATE_POSITION] = np.where(positions == _UNDATED, self.length, positions)
+
+        # Same columns as correlation_columns(frame): numeric and not constant
+        numeric = set(candidate_columns(frame))
+        keep = [i for i, column in enumerate(self.columns)
+                if column in numeric and self.low[i] < self.high[i]]
+        correlation = CorrelationStats([self.columns[i] for i in keep],
+                                       *(stat[:, keep][:, :, keep] for stat in self.stats))
+        dtypes = {d: frame[d].dtype for d in self.dimensions if d in frame.columns}
+        return Cube.from_cells(cells, self.dimensions, correlation, dtypes)
+
+
+# dtype read_csv gives a column of each numeric kind
+_PARSED_DTYPES = {'b': 'bool', 'i': 'int64', 'u': 'uint64', 'f': 'float64'}
+
+
+class _SpilledColumn:
+    """One column appended to a temporary file, with the statistics its compact type depends on"""
+
+    def __init__(self, name, series, directory, position):
+        self.name = name
+        self.path = os.path.join(directory, f"column_{position}.bin")
+        self.length = 0
+        dtype = series.dtype
+        if name in schema.LABEL_COLUMNS or pd.api.types.is_object_dtype(dtype) \
+                or isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(dtype):
+            self.kind, self.raw_dtype = 'label', np.int32
+            self.values = {}
+        elif pd.api.types.is_datetime64_dtype(dtype):
+            self.kind, self.raw_dtype = 'datetime', np.int64
+        else:
+            self.kind, self.raw_dtype = 'numeric', np.float64
+            # Nullable dtypes come from the coercions and hold for every chunk;
+            # otherwise the parser's dtype kind, widened to float on any mismatch
+            self.extension = str(dtype) if isinstance(dtype, pd.api.extensions.ExtensionDtype) else None
+            self.numeric_kind = dtype.kind
+            self.missing = 0
+            self.zeros = 0
+            self.low = np.inf
+            self.high = -np.inf
+            self.integral = True
+            self.fits_float32 = True
+
+    def add(self, series):
+        if self.kind == 'label':
+            codes, uniques = pd.factorize(series)
+            lookup = np.array([self.values.setdefault(v, len(self.values)) for v in uniques.tolist()] + [-1],
+                              dtype=np.int32)
+            raw = lookup[codes]
+        elif self.kind == 'datetime':
+            raw = pd.to_datetime(series, errors='coerce').to_numpy(dtype='datetime64[ns]').view(np.int64)
+        else:
+            raw = self._add_numeric(series)
+        with open(self.path, 'ab') as fh:
+            fh.write(np.ascontiguousarray(raw, dtype=self.raw_dtype).tobytes())
+        self.length += len(series)
+
+    def _add_numeric(self, series):
+        if self.extension is None and series.dtype.kind != self.numeric_kind:
+            self.numeric_kind = 'f'
+        values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        present = values[~np.isnan(values)]
+        self.missing += len(values) - len(present)
+        self.zeros += int((present == 0).sum())
+        if len(present):
+            self.low = min(self.low, present.min())
+            self.high = max(self.high, present.max())
+            self.integral = self.integral and bool(np.array_equal(present, np.round(present)))
+            self.fits_float32 = self.fits_float32 and schema.fits_float32(present)
+        return values
+
+    def read(self, start, stop):
+        """Raw values of rows [start, stop)"""
+        raw = np.memmap(self.path, dtype=self.raw_dtype, mode='r', shape=(self.length,)) if self.length else \
+            np.empty(0, dtype=self.raw_dtype)
+        return np.array(raw[start:stop])
+
+    def plan(self, sparse_threshold):
+        """Final pandas dtype (and sparse fill) following schema.optimize_frame"""
+        if self.kind == 'label':
+            try:
+                categories = sorted(self.values)
+            except TypeError:
+                categories = list(self.values)
+            return pd.CategoricalDtype(pd.Index(categories)), None
+        if self.kind == 'datetime':
+            return np.dtype('datetime64[ns]'), None
+
+        source = pd.api.types.pandas_dtype(self.extension or _PARSED_DTYPES.get(self.numeric_kind, 'float64'))
+        present = self.length - self.missing
+        if self.name in schema.MEASURE_COLUMNS:
+            return source, None
+        narrowed = schema._narrow_float(source, self.fits_float32)
+        if schema.is_driver_column(self.name) and pd.api.types.is_float_dtype(source) and self.length:
+            if self.zeros / self.length >= sparse_threshold:
+                return narrowed, 0.0
+            if self.missing / self.length >= sparse_threshold:
+                return narrowed, np.nan
+            return narrowed, None
+        if present == 0:
+            return narrowed, None
+        if pd.api.types.is_float_dtype(source) and not self.integral:
+            return narrowed, None
+        values = np.array([self.low, self.high])
+        return pd.api.types.pandas_dtype(schema._narrowest_int(values, self.missing > 0)), None
+
+
+def _codes_dtype(n_categories):
+    """Integer dtype pandas uses for the codes of a categorical"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class ColumnSpiller:
+    """Typed columns spilled to disk chunk by chunk and compacted into a snapshot bundle"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.columns = None
+        self.length = 0
+        self.memory_before = 0
+
+    def add(self, chunk):
+        if self.columns is None:
+            self.columns = [_SpilledColumn(name, chunk[name], self.directory, i)
+                            for i, name in enumerate(chunk.columns)]
+        for column in self.columns:
+            column.add(chunk[column.name])
+        self.length += len(chunk)
+        self.memory_before += schema.memory_usage(chunk)
+
+    def write(self, writer, rows, sparse_threshold=schema.SPARSE_THRESHOLD):
+        """
+        Write the compacted columns into a BundleWriter, `rows` at a time
+
+        Returns:
+            list of column specs as produced by snapshot.encode_frame
+        """
+        specs = []
+        blocks = {}
+        plans = []
+        for position, column in enumerate(self.columns or []):
+            dtype, fill = column.plan(sparse_threshold)
+            spec = {'name': column.name}
+            if fill is not None:
+                spec['sparse_fill'] = fill
+            if isinstance(dtype, pd.CategoricalDtype):
+                spec.update(kind='category', array=f"codes_{position}", categories=dtype.categories.tolist(),
+                            categories_dtype=str(dtype.categories.dtype))
+            elif column.kind == 'datetime':
+                spec.update(kind='datetime', array=f"datetime_{position}")
+            elif isinstance(dtype, pd.api.extensions.ExtensionDtype):
+                spec.update(kind='masked', array=f"masked_{position}", dtype=str(dtype))
+            else:
+                members = blocks.setdefault(str(dtype), [])
+                spec.update(kind='block', dtype=str(dtype), array=f"block_{dtype}", row=len(members))
+                members.append(column)
+            specs.append(spec)
+            plans.append((column, dtype, spec))
+
+        targets = {}
+        for dtype_name, members in blocks.items():
+            targets[f"block_{dtype_name}"] = writer.allocate(f"block_{dtype_name}", (len(members), self.length),
+                                                             np.dtype(dtype_name))
+        for column, dtype, spec in plans:
+            if spec['kind'] == 'category':
+                targets[spec['array']] = writer.allocate(spec['array'], (self.length,),
+                                                         _codes_dtype(len(dtype.categories)))
+            elif spec['kind'] == 'datetime':
+                targets[spec['array']] = writer.allocate(spec['array'], (self.length,), np.int64)
+            elif spec['kind'] == 'masked':
+                targets[f"{spec['array']}_values"] = writer.allocate(f"{spec['array']}_values", (self.length,),
+                                                                     dtype.numpy_dtype)
+                targets[f"{spec['array']}_mask"] = writer.allocate(f"{spec['array']}_mask", (self.length,), bool)
+
+        for column, dtype, spec in plans:
+            if spec['kind'] == 'category':
+                # Codes were assigned in order of appearance; map them to sorted categories
+                remap = np.full(len(column.values) + 1, -1, dtype=np.int64)
+                position = {value: i for i, value in enumerate(dtype.categories.tolist())}
+                for value, code in column.values.items():
+                    remap[code] = position[value]
+            for start in range(0, self.length, rows):
+                stop = min(start + rows, self.length)
+                raw = column.read(start, stop)
+                if spec['kind'] == 'category':
+                    targets[spec['array']][start:stop] = remap[raw]
+                elif spec['kind'] == 'datetime':
+                    targets[spec['array']][start:stop] = raw
+                elif spec['kind'] == 'masked':
+                    missing = np.isnan(raw)
+                    targets[f"{spec['array']}_values"][start:stop] = np.where(missing, 0, raw)
+                    targets[f"{spec['array']}_mask"][start:stop] = missing
+                else:
+                    targets[spec['array']][spec['row'], start:stop] = raw
+        for target in targets.values():
+            target.flush()
+        return specs
+
+
+def _chunks(frame, rows):
+    for start in range(0, len(frame), rows):
+        yield frame.iloc[start:start + rows]
+
+
+def fold_frame(frame, rows):
+    """
+    Build the filter index and cube of an already typed (e.g. memory-mapped) frame in slices
+
+    Returns:
+        (FilterIndex, Cube)
+    """
+    index_builder, cube_builder = IndexBuilder(), CubeBuilder()
+    for chunk in _chunks(frame, rows):
+        index_builder.add(chunk)
+        cube_builder.add(chunk)
+    return index_builder.finish(_numeric_dimensions(frame)), cube_builder.finish(frame)
+
+
+def _numeric_dimensions(frame):
+    numeric = []
+    for column in FILTER_DIMENSIONS.values():
+        if column not in frame.columns:
+            continue
+        dtype = frame[column].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtype = dtype.categories.dtype
+        if pd.api.types.is_numeric_dtype(dtype):
+            numeric.append(column)
+    return numeric
+
+
+def ingest_csv(path, coerce, rows, store_path=None, meta=None):
+    """
+    Stream a CSV into the column store, filter index and cube
+
+    Args:
+        path: str - CSV file
+        coerce: callable applied to every parsed chunk
+        rows: int - rows per chunk, a multiple of 64 (see chunk_rows)
+        store_path: str - snapshot directory the typed columns are written
+            to and mapped from; None keeps them in memory instead
+        meta: dict - extra JSON serializable manifest metadata (e.g. source)
+
+    Returns:
+        (frame, index, cube, stats) with stats as from schema.optimize_frame
+    """
+    spill_dir = tempfile.mkdtemp(prefix='eda-ingest-')
+    target = store_path or os.path.join(spill_dir, 'store')
+    writer = snapshot.BundleWriter(target)
+    try:
+        spiller, index_builder, cube_builder = ColumnSpiller(spill_dir), IndexBuilder(), CubeBuilder()
+        chunks = 0
+        for chunk in pd.read_csv(path, chunksize=rows):
+            chunk = coerce(chunk)
+            spiller.add(chunk)
+            index_builder.add(chunk)
+            cube_builder.add(chunk)
+            chunks += 1
+        logger.info(f"Ingested {spiller.length} rows from {path} in {chunks} chunks of {rows} rows")
+
+        columns = spiller.write(writer, rows)
+        arrays = {name: np.load(writer.array_path(name), mmap_mode='r') for name in writer.names}
+        frame = snapshot.decode_frame(arrays, columns, spiller.length)
+        stats = {
+            'memory_before': spiller.memory_before,
+            'memory_after': schema.memory_usage(frame),
+            'dtypes': {name: str(dtype) for name, dtype in frame.dtypes.items()},
+        }
+        writer.commit(dict(meta or {}, stats=stats, length=spiller.length, columns=columns))
+
+        if store_path is None:
+            # Not persisted: bring the columns into memory before the files go away
+            arrays, manifest = snapshot.read_bundle(target, mmap=False)
+        else:
+            arrays, manifest = snapshot.read_bundle(target, mmap=True)
+        frame = snapshot.decode_frame(arrays, manifest['columns'], manifest['length'])
+        index = index_builder.finish(_numeric_dimensions(frame))
+        cube = cube_builder.finish(frame)
+        return frame, index, cube, stats
+    finally:
+        writer.abort()
+        shutil.rmtree(spill_dir, ignore_errors=True)
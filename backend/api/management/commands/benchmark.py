@@ -0,0 +1,58 @@
+"""
+Benchmark the data pipeline on synthetic datasets.
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Time loading, filtering, each aggregation, serialization and the /api/data/ endpoint '
+            'on synthetic datasets, optionally comparing against a baseline report')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[10],
+                            help='Multiples of the source row count to benchmark (e.g. 10 100 1000)')
+        parser.add_argument('--brands', type=int, default=benchmarks.DEFAULT_CARDINALITY['brands'])
+        parser.add_argument('--ppgs', type=int, default=benchmarks.DEFAULT_CARDINALITY['ppgs'])
+        parser.add_argument('--channels', type=int, default=benchmarks.DEFAULT_CARDINALITY['channels'])
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per request stage')
+        parser.add_argument('--load-repeat', type=int, default=1, help='Timed runs per loading stage')
+        parser.add_argument('--workdir', help='Directory for the generated CSVs (reused across runs); '
+                                              'a temporary directory by default')
+        parser.add_argument('--output', help='Write the JSON report to this path (stdout by default)')
+        parser.add_argument('--baseline', help='Baseline report to compare the medians against')
+        parser.add_argument('--tolerance', type=float, default=benchmarks.DEFAULT_TOLERANCE,
+                            help='Allowed relative slowdown before a stage counts as a regression')
+
+    def handle(self, *args, **options):
+        cardinality = {key: options[key] for key in benchmarks.DEFAULT_CARDINALITY}
+        try:
+            report = benchmarks.run_benchmarks(
+                options['scales'], options['workdir'], options['repeat'], cardinality, options['load_repeat'],
+            )
+        except Exception as e:
+            raise CommandError(f"Benchmark failed: {e}")
+
+        regressions = None
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+            regressions = benchmarks.compare_reports(report, baseline, options['tolerance'])
+            report['regressions'] = regressions
+
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(text + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote benchmark report to {options['output']}"))
+        else:
+            self.stdout.write(text)
+
+        if regressions:
+            for item in regressions:
+                self.stderr.write(
+                    f"{item['scale']}x {item['stage']} [{item['case']}]: "
+                    f"{item['baseline_ms']:.3f} ms -> {item['current_ms']:.3f} ms ({item['ratio']:.2f}x)"
+                )
+            raise CommandError(f"{len(regressions)} measurements regressed beyond {options['tolerance']:.0%}")
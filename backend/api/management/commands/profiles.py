@@ -0,0 +1,80 @@
+"""
+List and summarize the profiles captured for slow requests.
+"""
+import datetime
+import io
+import json
+import os
+import pstats
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from api import profiling
+
+
+class Command(BaseCommand):
+    help = 'List the captured request profiles, or summarize one (or the newest with "latest")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('capture', nargs='?', help='Capture id to summarize, or "latest"')
+        parser.add_argument('--limit', type=int, default=20, help='Rows per table')
+        parser.add_argument('--clear', action='store_true', help='Delete every captured profile')
+
+    def handle(self, *args, **options):
+        root = profiling.profiling_settings()['PATH']
+        captures = profiling.list_captures(root)
+        if options['clear']:
+            for capture_id in captures:
+                profiling.remove_capture(root, capture_id)
+            self.stdout.write(self.style.SUCCESS(f"Removed {len(captures)} profiles from {root}"))
+            return
+        if not options['capture']:
+            self.list(root, captures)
+            return
+
+        capture_id = captures[-1] if options['capture'] == 'latest' and captures else options['capture']
+        if capture_id not in captures:
+            raise CommandError(f"No profile {options['capture']} in {root}")
+        self.summarize(root, profiling.read_capture(root, capture_id), options['limit'])
+
+    def list(self, root, captures):
+        if not captures:
+            self.stdout.write(f"No profiles in {root}")
+            return
+        self.stdout.write(f"{'id':<30} {'captured':<19} {'trigger':<9} {'ms':>9} {'status':>6}  filters")
+        for capture_id in reversed(captures):
+            record = profiling.read_capture(root, capture_id)
+            captured = datetime.datetime.fromtimestamp(record['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
+            filters = json.loads(record['payload']).get('filters') if record.get('payload') else '-'
+            self.stdout.write(
+                f"{capture_id:<30} {captured:<19} {record['trigger']:<9} {record['duration'] * 1000:>9.1f} "
+                f"{record['status']:>6}  {json.dumps(filters) if filters != '-' else filters}"
+            )
+
+    def summarize(self, root, record, limit):
+        self.stdout.write(f"{record['method']} {record['path']} -> {record['status']} "
+                          f"in {record['duration'] * 1000:.1f} ms ({record['trigger']})")
+        self.stdout.write(f"dataset version: {record.get('version', '-')}")
+        self.stdout.write(f"payload: {record.get('payload', '-')}")
+
+        if record['samples']:
+            # Stack samples: inclusive and self counts per frame
+            inclusive, own = Counter(), Counter()
+            for stack, count in record['stacks'].items():
+                frames = stack.split(';')
+                own[frames[-1]] += count
+                for frame in set(frames):
+                    inclusive[frame] += count
+            total = record['samples']
+            self.stdout.write(f"\n{total} stack samples of {record.get('threads', 1)} thread(s) "
+                              f"every {record['interval'] * 1000:g} ms "
+                              f"after the {record['threshold']:g}s threshold")
+            self.stdout.write(f"\n{'self %':>7} {'total %':>8}  frame")
+            for frame, count in own.most_common(limit):
+                self.stdout.write(f"{count / total:>7.1%} {inclusive[frame] / total:>8.1%}  {frame}")
+
+        prof_path = os.path.join(root, f"{record['id']}.prof")
+        if os.path.exists(prof_path):
+            output = io.StringIO()
+            pstats.Stats(prof_path, stream=output).sort_stats('cumulative').print_stats(limit)
+            self.stdout.write(f"\ncProfile ({prof_path}):")
+            self.stdout.write(output.getvalue())
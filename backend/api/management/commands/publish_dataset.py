@@ -0,0 +1,34 @@
+"""
+Publish the dataset into shared memory for the worker processes.
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api import shared
+from api.data_loader import data_loader
+
+
+class Command(BaseCommand):
+    help = 'Load the dataset and publish it as a new shared-memory segment that workers attach to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Only remove old segments, keeping the current one and the newest KEEP')
+
+    def handle(self, *args, **options):
+        config = shared.shared_settings()
+        root = config['PATH']
+        if options['cleanup']:
+            removed = shared.cleanup_segments(root, config['KEEP'])
+            self.stdout.write(self.style.SUCCESS(f"Removed {len(removed)} segments from {root}"))
+            return
+
+        started = time.perf_counter()
+        try:
+            with shared.publish_lock(root):
+                segment = data_loader.publish_shared()
+        except Exception as e:
+            raise CommandError(f"Failed to publish dataset: {e}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Published segment {segment} to {root} in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,36 @@
+"""
+Warm up the dataset and response cache, or show the popular request keys.
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api import popularity, warmup
+
+
+class Command(BaseCommand):
+    help = ('Load the dataset and prime the response cache with the default and the most requested '
+            '/api/data/ responses (useful with a shared RESPONSE_CACHE backend), or list the popular keys')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, help='Popular keys to replay (default WARMUP["TOP_K"])')
+        parser.add_argument('--list', action='store_true',
+                            help='Only list the most requested keys with their estimated counts')
+
+    def handle(self, *args, **options):
+        config = popularity.warmup_settings()
+        top_k = config['TOP_K'] if options['top_k'] is None else options['top_k']
+        if options['list']:
+            _, keys, total = popularity.read_sketch(config['SKETCH_PATH'])
+            self.stdout.write(f"{total} requests recorded in {config['SKETCH_PATH']}")
+            for key in popularity.top_keys(config['SKETCH_PATH'], top_k):
+                self.stdout.write(f"{keys[key]:>8}  {json.dumps(json.loads(key)['filters'])}")
+            return
+
+        try:
+            result = warmup.warm_up(top_k)
+        except Exception as e:
+            raise CommandError(f"Warm-up failed: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed up dataset {result['version']} in {result['duration']:.2f}s "
+            f"(load {result['loadDuration']:.2f}s): {result['primed']} of {result['keys']} responses primed"
+            + (f", {result['failed']} failed" if result['failed'] else '')
+        ))
@@ -0,0 +1,335 @@
+"""
+In-process request metrics.
+
+Hot-path stages (filter selection, each grouping, serialization, encoding,
+compression) are timed with `stage()`, which records the duration and the
+rows or bytes the stage touched into histograms. MetricsMiddleware times
+every API request and, when METRICS['SERVER_TIMING'] is on, reports the
+stages of that request in a Server-Timing header. Everything is kept per
+process and exported at /api/metrics/ in the Prometheus text format, so each
+worker is scraped (or reports) separately.
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from . import schema
+
+DEFAULT_METRICS_SETTINGS = {
+    'ENABLED': True,
+    'SERVER_TIMING': False,
+    'WINDOW': 1024,
+}
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def metrics_settings():
+    return dict(DEFAULT_METRICS_SETTINGS, **getattr(settings, 'METRICS', {}))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.documentation}')
+        lines.append(f'# TYPE {self.name} {self.kind}')
+        with self._lock:
+            series = {key: (list(counts), total, n) for key, (counts, total, n) in self._series.items()}
+        for values, (counts, total, n) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _labels(self.labels, values, ('le', _number(bound)))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {n}')
+
+
+class Summary:
+    """Quantiles over a sliding window of recent observations, plus sum and count"""
+
+    kind = 'summary'
+
+    def __init__(self, name, documentation, labels=(), window=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                window = self.window or metrics_settings()['WINDOW']
+                series = self._series[label_values] = [deque(maxlen=window), 0.0, 0]
+            series[0].append(value)
+            series[1] += value
+            series[2] += 1
+
+    def quantiles(self, *label_values):
+        """dict of quantile -> value over the window (empty when unobserved)"""
+        with self._lock:
+            series = self._series.get(label_values)
+            recent = sorted(series[0]) if series else []
+        if not recent:
+            return {}
+        return {q: recent[min(len(recent) - 1, int(q * len(recent)))] for q in QUANTILES}
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.documentation}')
+        lines.append(f'# TYPE {self.name} {self.kind}')
+        with self._lock:
+            keys = sorted(self._series)
+        for values in keys:
+            for q, value in self.quantiles(*values).items():
+                lines.append(f'{self.name}{_labels(self.labels, values, ("quantile", q))} {_number(value)}')
+            with self._lock:
+                _, total, n = self._series[values]
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {n}')
+
+
+REQUEST_DURATION = Histogram(
+    'eda_request_duration_seconds', 'Latency of API requests', LATENCY_BUCKETS, ('view', 'status'))
+REQUEST_LATENCY = Summary(
+    'eda_request_latency_seconds', 'Latency quantiles of recent API requests', ('view',))
+STAGE_DURATION = Histogram(
+    'eda_stage_duration_seconds', 'Duration of request stages', LATENCY_BUCKETS, ('stage',))
+STAGE_ROWS = Histogram(
+    'eda_stage_rows', 'Rows or cube cells processed by request stages', SIZE_BUCKETS, ('stage',))
+STAGE_BYTES = Histogram(
+    'eda_stage_bytes', 'Bytes produced by request stages', SIZE_BUCKETS, ('stage',))
+
+REGISTRY = (REQUEST_DURATION, REQUEST_LATENCY, STAGE_DURATION, STAGE_ROWS, STAGE_BYTES)
+
+
+class Stage:
+    """One timed stage; set rows or bytes inside the block to record its size"""
+
+    __slots__ = ('name', 'rows', 'bytes', 'duration')
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.bytes = None
+        self.duration = 0.0
+
+
+# Stages of the request being handled (None outside MetricsMiddleware)
+_timings = contextvars.ContextVar('eda_request_timings', default=None)
+
+
+@contextmanager
+def stage(name):
+    """Time a block as a request stage, yielding its Stage"""
+    current = Stage(name)
+    if not metrics_settings()['ENABLED']:
+        yield current
+        return
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.duration = time.perf_counter() - started
+        STAGE_DURATION.observe(current.duration, name)
+        if current.rows is not None:
+            STAGE_ROWS.observe(current.rows, name)
+        if current.bytes is not None:
+            STAGE_BYTES.observe(current.bytes, name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append(current)
+
+
+def server_timing(timings, total):
+    """Server-Timing header value; repeated stage names are summed"""
+    merged = {}
+    for item in timings:
+        entry = merged.setdefault(item.name, [0.0, None])
+        entry[0] += item.duration
+        size = f'{item.rows} rows' if item.rows is not None else (
+            f'{item.bytes} bytes' if item.bytes is not None else None)
+        entry[1] = size or entry[1]
+    parts = [
+        f'{name};dur={duration * 1000:.3f}' + (f';desc="{desc}"' if desc else '')
+        for name, (duration, desc) in merged.items()
+    ]
+    parts.append(f'total;dur={total * 1000:.3f}')
+    return ', '.join(parts)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.url_name if match is not None and match.url_name else 'unmatched'
+
+
+@sync_and_async_middleware
+def MetricsMiddleware(get_response):
+    """Times API requests and adds the Server-Timing header when enabled"""
+
+    def begin(request):
+        if not request.path.startswith('/api/') or not metrics_settings()['ENABLED']:
+            return None
+        timings = []
+        return timings, _timings.set(timings), time.perf_counter()
+
+    def finish(request, response, started):
+        timings, token, began = started
+        _timings.reset(token)
+        elapsed = time.perf_counter() - began
+        view = _view_name(request)
+        REQUEST_DURATION.observe(elapsed, view, str(response.status_code))
+        REQUEST_LATENCY.observe(elapsed, view)
+        if metrics_settings()['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(timings, elapsed)
+            response['Timing-Allow-Origin'] = '*'
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = begin(request)
+            response = await get_response(request)
+            return response if started is None else finish(request, response, started)
+    else:
+        def middleware(request):
+            started = begin(request)
+            response = get_response(request)
+            return response if started is None else finish(request, response, started)
+    return middleware
+
+
+def _resident_memory():
+    """Resident set size of this process in bytes (None when unavailable)"""
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+
+_footprint = (None, 0)
+
+
+def dataset_memory(state):
+    """In-memory bytes of a state's frame and cube cells, computed once per state"""
+    global _footprint
+    cached_state, size = _footprint
+    if cached_state is not state:
+        size = schema.memory_usage(state.frame) + schema.memory_usage(state.cube.cells)
+        _footprint = (state, size)
+    return size
+
+
+def _gauge(lines, name, documentation, samples, kind='gauge'):
+    lines.append(f'# HELP {name} {documentation}')
+    lines.append(f'# TYPE {name} {kind}')
+    for labels, value in samples:
+        if value is None:
+            continue
+        rendered = '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}' if labels else ''
+        lines.append(f'{name}{rendered} {_number(value)}')
+
+
+def export():
+    """All metrics of this process in the Prometheus text exposition format"""
+    from .cache import get_response_cache
+    from .coalesce import data_flight
+    from .data_loader import data_loader
+    from .executor import get_compute_pool
+
+    lines = []
+    for metric in REGISTRY:
+        metric.render(lines)
+
+    pid = {'pid': os.getpid()}
+    _gauge(lines, 'eda_process_resident_memory_bytes', 'Resident memory of this worker',
+           [(pid, _resident_memory())])
+
+    cache = get_response_cache().stats()
+    _gauge(lines, 'eda_response_cache_hits_total', 'Response cache hits', [({}, cache['hits'])], 'counter')
+    _gauge(lines, 'eda_response_cache_misses_total', 'Response cache misses', [({}, cache['misses'])], 'counter')
+    _gauge(lines, 'eda_response_cache_hit_ratio', 'Response cache hit ratio', [({}, cache['hit_rate'])])
+    _gauge(lines, 'eda_response_cache_entries', 'Cached responses', [({}, cache.get('entries'))])
+    _gauge(lines, 'eda_response_cache_bytes', 'Bytes held by the response cache', [({}, cache.get('bytes'))])
+
+    flight = data_flight.stats()
+    _gauge(lines, 'eda_coalesce_executions_total', 'Computations run for /api/data/',
+           [({}, flight['executions'])], 'counter')
+    _gauge(lines, 'eda_coalesce_coalesced_total', 'Requests that shared a running computation',
+           [({}, flight['coalesced'])], 'counter')
+    _gauge(lines, 'eda_coalesce_in_flight', 'Computations currently running', [({}, flight['in_flight'])])
+
+    if getattr(settings, 'ASYNC_VIEWS', False):
+        pool = get_compute_pool().stats()
+        _gauge(lines, 'eda_compute_pool_tasks', 'Compute pool tasks by state',
+               [({'state': key}, pool[key]) for key in ('running', 'queued')])
+        _gauge(lines, 'eda_compute_pool_rejected_total', 'Tasks refused by the compute pool',
+               [({'reason': 'full'}, pool['rejected']), ({'reason': 'expired'}, pool['expired'])], 'counter')
+
+    state = data_loader._state
+    if state is not None:
+        _gauge(lines, 'eda_dataset_info', 'Active dataset version',
+               [({'version': state.version, 'segment': state.segment or ''}, 1)])
+        _gauge(lines, 'eda_dataset_generation', 'Dataset swaps in this worker', [({}, state.generation)])
+        _gauge(lines, 'eda_dataset_rows', 'Rows of the active dataset', [({}, len(state.frame))])
+        _gauge(lines, 'eda_dataset_cube_cells', 'Cells of the active cube', [({}, len(state.cube.cells))])
+        _gauge(lines, 'eda_dataset_load_duration_seconds', 'Time taken to load the active dataset',
+               [({}, state.load_duration)])
+        _gauge(lines, 'eda_dataset_memory_bytes', 'Memory of the active frame and cube (mapped or private)',
+               [({}, dataset_memory(state))])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,275 @@
+"""
+Time-grain rollups of the trend datasets of /api/data/.
+
+monthlyTrend, monthlyBrandSales and monthlyChannelSales are monthly by
+default. A request 'grain' of 'week', 'quarter' or 'year' returns them per
+ISO week, calendar quarter or year instead, and 'maxPoints' coarsens the
+grain until the selection spans at most that many periods ('auto' starts
+from weeks). The response's 'meta' gives the grain used. kpiCorrelation,
+derived from the trend, stays monthly.
+
+Quarters and years are rolled up from the cube cells (Year, Month). The
+cube has no week dimension, which would multiply its cells for every
+request, so weeks are summed from the selected rows on integer week
+ordinals computed once per dataset state (CalendarKeys). Period labels are
+built once per distinct period, not per row.
+"""
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from .cube import DATE_POSITION
+from .utils import DATASET_SPECS, _finish, _group, dataset_columns
+
+GRAINS = ('week', 'month', 'quarter', 'year')
+AUTO = 'auto'
+
+DEFAULT_TIME_GRAIN_SETTINGS = {
+    'DEFAULT': 'month',
+    'MAX_POINTS': 104,
+}
+
+# Trend datasets and the member dimension each is split by
+TREND_DATASETS = {
+    'monthlyTrend': None,
+    'monthlyBrandSales': 'Brand',
+    'monthlyChannelSales': 'Channel',
+}
+
+# Period key dimensions of each grain, in output order
+GRAIN_KEYS = {
+    'week': ['Week'],
+    'quarter': ['Year', 'Quarter'],
+    'year': ['Year'],
+}
+
+# Period label column each grain adds
+GRAIN_LABELS = {
+    'week': 'YearWeek',
+    'quarter': 'YearQuarter',
+}
+
+QUARTERS = pd.Index([1, 2, 3, 4])
+
+
+def time_grain_settings():
+    return dict(DEFAULT_TIME_GRAIN_SETTINGS, **getattr(settings, 'TIME_GRAIN', {}))
+
+
+def parse_grain(payload):
+    """
+    Read the optional 'grain' and 'maxPoints' of a /api/data/ payload
+
+    Returns:
+        None for the default monthly series, otherwise a dict with 'grain'
+        (finest grain to use) and 'maxPoints' (int or None)
+
+    Raises:
+        ValueError: for an unknown grain or a non-positive maxPoints
+    """
+    config = time_grain_settings()
+    grain = payload.get('grain') or config['DEFAULT']
+    if grain not in GRAINS and grain != AUTO:
+        raise ValueError(f"Unknown grain {grain!r}, expected one of {', '.join(GRAINS + (AUTO,))}")
+    max_points = payload.get('maxPoints')
+    if max_points is not None and (isinstance(max_points, bool) or not isinstance(max_points, int) or max_points < 1):
+        raise ValueError("'maxPoints' must be a positive integer")
+    if grain == AUTO:
+        grain, max_points = GRAINS[0], max_points or config['MAX_POINTS']
+    if grain == 'month' and max_points is None:
+        return None
+    return {'grain': grain, 'maxPoints': max_points}
+
+
+def trend_columns(name, grain):
+    """Columns of a trend dataset at a grain"""
+    if grain == 'month':
+        return dataset_columns(name)
+    spec = DATASET_SPECS[name]
+    # Weeks are labelled with their ISO year
+    keys = ['Year'] + GRAIN_KEYS[grain] if grain == 'week' else GRAIN_KEYS[grain]
+    labels = [GRAIN_LABELS[grain]] if grain in GRAIN_LABELS else []
+    member = [TREND_DATASETS[name]] if TREND_DATASETS[name] else []
+    return keys + labels + member + spec['measures'] + ['date']
+
+
+def projection_columns(name, grain):
+    """
+    Columns a field mask of a dataset may name for a parse_grain result
+
+    With maxPoints the grain of the trends depends on the selection, so the
+    columns of every grain it may be coarsened to are accepted; those absent
+    at the grain chosen are left out of the response.
+    """
+    if grain is None or name not in TREND_DATASETS:
+        return dataset_columns(name)
+    if grain['maxPoints'] is None:
+        return trend_columns(name, grain['grain'])
+    columns = {}
+    for candidate in GRAINS[GRAINS.index(grain['grain']):]:
+        columns.update(dict.fromkeys(trend_columns(name, candidate)))
+    return list(columns)
+
+
+class CalendarKeys:
+    """
+    Integer week ordinal of every row of a dataset
+
+    `week` holds each row's position in the dataset's week range (-1 for
+    undated rows); `iso_year`, `iso_week` and `labels` describe each week of
+    the range. `weeks_in_month` counts the weeks with rows per month ordinal
+    (Year * 12 + Month - 1), to size selections without touching the rows.
+    """
+
+    def __init__(self, week, iso_year, iso_week, labels, weeks_in_month):
+        self.week = week
+        self.iso_year = iso_year
+        self.iso_week = iso_week
+        self.labels = labels
+        self.weeks_in_month = weeks_in_month
+
+    @classmethod
+    def build(cls, frame):
+        if 'date' not in frame.columns or not len(frame):
+            empty = np.zeros(0, dtype=np.int64)
+            return cls(np.full(len(frame), -1, dtype=np.int32), empty, empty, np.array([], dtype=object), {})
+        dates = frame['date'].to_numpy(dtype='datetime64[D]')
+        dated = ~np.isnat(dates)
+        # Weeks start on Monday; 1970-01-01 was a Thursday
+        ordinals = (dates.astype(np.int64) + 3) // 7
+        first = int(ordinals[dated].min()) if dated.any() else 0
+        span = int(ordinals[dated].max()) - first + 1 if dated.any() else 0
+        week = np.where(dated, ordinals - first, -1).astype(np.int32)
+
+        mondays = pd.DatetimeIndex(((first + np.arange(span)) * 7 - 3).astype('datetime64[D]'))
+        iso = mondays.isocalendar()
+        iso_year, iso_week = iso['year'].to_numpy(dtype=np.int64), iso['week'].to_numpy(dtype=np.int64)
+        labels = np.array([f'{y}-W{w:02d}' for y, w in zip(iso_year, iso_week)], dtype=object)
+
+        weeks_in_month = {}
+        if {'Year', 'Month'} <= set(frame.columns):
+            months = frame['Year'].astype('float64').to_numpy() * 12 + frame['Month'].astype('float64').to_numpy() - 1
+            valid = dated & ~np.isnan(months)
+            pairs = np.unique(months[valid].astype(np.int64) * span + week[valid])
+            month_ids, counts = np.unique(pairs // span, return_counts=True)
+            weeks_in_month = dict(zip(month_ids.tolist(), counts.tolist()))
+        return cls(week, iso_year, iso_week, labels, weeks_in_month)
+
+
+def _period_counts(cells, calendar):
+    """Periods of each grain spanned by the selected cells"""
+    years = cells['Year'].cat.categories.to_numpy()
+    months = cells['Month'].cat.categories.to_numpy()
+    year_codes, month_codes = cells['Year'].cat.codes.to_numpy(), cells['Month'].cat.codes.to_numpy()
+    valid = (year_codes >= 0) & (month_codes >= 0)
+    month_ids = np.unique(
+        years[year_codes[valid]].astype(np.int64) * 12 + months[month_codes[valid]].astype(np.int64) - 1
+    )
+    return {
+        'week': sum(calendar.weeks_in_month.get(m, 0) for m in month_ids.tolist()),
+        'month': len(month_ids),
+        'quarter': len(np.unique(month_ids // 3)),
+        'year': len(np.unique(month_ids // 12)),
+    }
+
+
+def choose_grain(cells, calendar, grain):
+    """The requested grain, coarsened until the selection fits maxPoints"""
+    if grain['maxPoints'] is None:
+        return grain['grain']
+    counts = _period_counts(cells, calendar)
+    for name in GRAINS[GRAINS.index(grain['grain']):]:
+        if counts[name] <= grain['maxPoints']:
+            return name
+    return GRAINS[-1]
+
+
+def _cell_source(cells, member, measures):
+    """Grouping input for quarters and years: the selected cube cells"""
+    month_levels = cells['Month'].cat.categories.to_numpy().astype(np.int64)
+    month_codes = cells['Month'].cat.codes.to_numpy()
+    quarter_of = (month_levels - 1) // 3
+    codes = {
+        'Year': cells['Year'].cat.codes.to_numpy(),
+        'Quarter': np.where(month_codes >= 0, quarter_of[month_codes], -1),
+    }
+    if member:
+        codes[member] = cells[member].cat.codes.to_numpy()
+    return {
+        'codes': codes,
+        'measures': {m: cells[m].to_numpy(dtype=float) for m in measures},
+        'date_pos': cells[DATE_POSITION].to_numpy(),
+        'date': cells['date'].to_numpy(),
+    }
+
+
+def _row_source(state, rows, member, measures):
+    """Grouping input for weeks: the selected rows of the dataset"""
+    frame = state.frame
+
+    def take(values):
+        return values if rows is None else values[rows]
+
+    codes = {'Week': take(state.calendar.week)}
+    if member:
+        codes[member] = take(frame[member].cat.codes.to_numpy())
+    return {
+        'codes': codes,
+        # Missing measures count as zero, as in the cube's sums
+        'measures': {m: np.nan_to_num(take(frame[m].to_numpy(dtype=float))) for m in measures},
+        'date_pos': np.arange(len(frame)) if rows is None else rows,
+        'date': take(frame['date'].to_numpy()),
+    }
+
+
+def _label(result, grain, calendar):
+    """Replace week positions with ISO year/week, or add the quarter label"""
+    if grain == 'week':
+        position = result['Week'].to_numpy()
+        result.insert(0, 'Year', calendar.iso_year[position])
+        result['Week'] = calendar.iso_week[position]
+        result.insert(2, 'YearWeek', calendar.labels[position])
+    elif grain == 'quarter':
+        year, quarter = result['Year'].to_numpy(dtype=np.int64), result['Quarter'].to_numpy(dtype=np.int64)
+        # One label per distinct quarter
+        ids, inverse = np.unique(year * 4 + quarter - 1, return_inverse=True)
+        labels = np.array([f'{i // 4}-Q{i % 4 + 1}' for i in ids.tolist()], dtype=object)
+        result.insert(2, 'YearQuarter', labels[inverse])
+    return result
+
+
+def build_trends(state, cells, filters, names, grain, limits=None):
+    """
+    Trend datasets of `names` at a grain other than month
+
+    Args:
+        state: DatasetState (the rows and calendar keys, for weeks)
+        cells: the selected cube cells
+        filters: the request filters
+        names: dataset names; those in TREND_DATASETS are computed
+        grain: 'week', 'quarter' or 'year' (see choose_grain)
+        limits: optional dict of dataset name -> top-N cap
+
+    Returns:
+        dict of dataset name -> DataFrame
+    """
+    limits = limits or {}
+    levels = {d: cells[d].cat.categories for d in ('Year', 'Brand', 'Channel')}
+    levels['Quarter'] = QUARTERS
+    levels['Week'] = pd.RangeIndex(len(state.calendar.labels))
+    rows = state.index.rows(filters) if state.index is not None else None
+
+    datasets = {}
+    for name in names:
+        if name not in TREND_DATASETS:
+            continue
+        member = TREND_DATASETS[name]
+        spec = DATASET_SPECS[name]
+        keys = GRAIN_KEYS[grain] + ([member] if member else [])
+        trend = dict(spec, keys=keys, label=None)
+        if grain == 'week':
+            source = _row_source(state, rows, member, spec['measures'])
+        else:
+            source = _cell_source(cells, member, spec['measures'])
+        grouped = _group(source, keys, spec['measures'], True)
+        datasets[name] = _label(_finish(grouped, trend, levels, limits.get(name)), grain, state.calendar)
+    return datasets
@@ -0,0 +1,183 @@
+"""
+Popularity of /api/data/ requests, persisted across restarts.
+
+Off unless WARMUP['TRACK'] is set. Each worker counts the canonical request
+keys it serves in a count-min sketch (DEPTH rows of WIDTH counters) and
+remembers the keys it has seen since its last flush. Every FLUSH_INTERVAL
+seconds a background thread merges the counts into the sketch file at
+WARMUP['SKETCH_PATH'] under an exclusive lock, and
+the CANDIDATES keys with the highest estimated counts are kept there, so the
+file aggregates the traffic of every worker and survives deploys. Warm-up
+(api/warmup.py) replays the top keys of that file.
+
+Counts are halved whenever the total passes DECAY_TOTAL, so old traffic
+fades out.
+"""
+import atexit
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WARMUP_SETTINGS = {
+    'ENABLED': False,
+    'BLOCKING': False,
+    'TOP_K': 20,
+    'TRACK': False,
+    'SKETCH_PATH': os.path.join(tempfile.gettempdir(), 'eda-popularity.json'),
+    'FLUSH_INTERVAL': 60.0,
+}
+
+WIDTH = 2048
+DEPTH = 4
+# Keys kept in the file with their estimated counts
+CANDIDATES = 64
+# Distinct keys a worker remembers between flushes
+MAX_PENDING_KEYS = 1024
+DECAY_TOTAL = 1_000_000
+
+
+def warmup_settings():
+    return dict(DEFAULT_WARMUP_SETTINGS, **getattr(settings, 'WARMUP', {}))
+
+
+def _slots(key):
+    """Counter index of a key in each row of the sketch (stable across processes)"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * DEPTH).digest()
+    return np.frombuffer(digest, dtype='<u4').astype(np.int64) % WIDTH
+
+
+def _estimate(counts, key):
+    return int(counts[np.arange(DEPTH), _slots(key)].min())
+
+
+def read_sketch(path):
+    """
+    The persisted sketch
+
+    Returns:
+        (counts array, dict of key -> estimated count, total)
+    """
+    try:
+        with open(path) as handle:
+            data = json.load(handle)
+        counts = np.array(data['counts'], dtype=np.int64)
+        if counts.shape != (DEPTH, WIDTH):
+            raise ValueError(f"sketch shape {counts.shape}")
+        return counts, dict(data['keys']), int(data['total'])
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable popularity sketch {path}: {e}")
+    return np.zeros((DEPTH, WIDTH), dtype=np.int64), {}, 0
+
+
+def _write_sketch(path, counts, keys, total):
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'w') as handle:
+        json.dump({'counts': counts.tolist(), 'keys': keys, 'total': total, 'updated': time.time()}, handle)
+    os.replace(tmp_path, path)
+
+
+def top_keys(path, k):
+    """The k most requested keys of the persisted sketch, most popular first"""
+    _, keys, _ = read_sketch(path)
+    return [key for key, _ in sorted(keys.items(), key=lambda item: (-item[1], item[0]))[:k]]
+
+
+class PopularitySketch:
+    """Per-worker request counts, merged into the shared sketch file on flush"""
+
+    def __init__(self, path, flush_interval):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._counts = np.zeros((DEPTH, WIDTH), dtype=np.int64)
+        self._keys = set()
+        self._total = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._flusher = None
+
+    def record(self, key):
+        """Count one request for a canonical key"""
+        with self._lock:
+            self._counts[np.arange(DEPTH), _slots(key)] += 1
+            if len(self._keys) < MAX_PENDING_KEYS:
+                self._keys.add(key)
+            self._total += 1
+
+    def start(self):
+        """Flush every flush_interval seconds from a daemon thread, off the request path"""
+        self._flusher = threading.Thread(target=self._run, name='eda-popularity-flush', daemon=True)
+        self._flusher.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def stop(self):
+        """Stop the flush thread and write out the remaining counts"""
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def flush(self):
+        """Merge the counts since the last flush into the sketch file"""
+        with self._lock:
+            counts, keys, total = self._counts, self._keys, self._total
+            self._counts = np.zeros((DEPTH, WIDTH), dtype=np.int64)
+            self._keys = set()
+            self._total = 0
+        if not total:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(f'{self.path}.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                merged, known, merged_total = read_sketch(self.path)
+                merged += counts
+                merged_total += total
+                if merged_total > DECAY_TOTAL:
+                    merged //= 2
+                    merged_total //= 2
+                estimates = {key: _estimate(merged, key) for key in known.keys() | keys}
+                best = sorted(estimates.items(), key=lambda item: (-item[1], item[0]))[:CANDIDATES]
+                _write_sketch(self.path, merged, dict(best), merged_total)
+        except OSError as e:
+            logger.warning(f"Could not write popularity sketch {self.path}: {e}")
+
+
+_sketch = None
+_sketch_lock = threading.Lock()
+
+
+def get_sketch():
+    """This worker's PopularitySketch, or None when tracking is off"""
+    global _sketch
+    config = warmup_settings()
+    if not config['TRACK']:
+        return None
+    if _sketch is None:
+        with _sketch_lock:
+            if _sketch is None:
+                _sketch = PopularitySketch(config['SKETCH_PATH'], config['FLUSH_INTERVAL'])
+                _sketch.start()
+                # Keep the counts since the last flush when the worker stops
+                atexit.register(_sketch.stop)
+    return _sketch
+
+
+def record(key):
+    """Count a served /api/data/ request key"""
+    sketch = get_sketch()
+    if sketch is not None:
+        sketch.record(key)
@@ -0,0 +1,361 @@
+"""
+Opt-in profiler for slow API requests.
+
+ProfilingMiddleware registers each request to a profiled path with a
+watchdog thread. Requests that finish within PROFILING['THRESHOLD'] cost one
+dict insert and removal. Once a request runs past the threshold, the
+watchdog samples its thread's stack every INTERVAL seconds until it
+finishes, giving a statistical profile of the slow part. Separately, a
+SAMPLE_RATE fraction of requests runs under cProfile from start to end.
+
+Each capture is written by a background thread to PROFILING['PATH'] as
+`<id>.json` (request, canonical payload, dataset version, timings and
+collapsed stacks), plus `<id>.prof` (pstats) for cProfile runs. The
+directory is a ring buffer of the newest KEEP captures. `python manage.py profiles` lists and summarizes
+them.
+
+Stacks are sampled from every thread working for the request: the thread
+serving it under WSGI, plus the compute pool and fan-out threads
+(api/executor.py) and sync views run off the event loop under ASGI, which
+join the request's capture through profiled_thread(). The event loop thread
+itself is not sampled, as it is shared by all requests in flight.
+
+cProfile only sees the thread it is enabled in. Under WSGI that is the
+request thread (work fanned out to other threads shows up in the stack
+samples only); under ASGI, where the request thread is the event loop, a
+sampled request has its stacks sampled from the start instead.
+"""
+import cProfile
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILING_SETTINGS = {
+    'ENABLED': False,
+    'PATHS': ('/api/data/',),
+    'THRESHOLD': 1.0,
+    'INTERVAL': 0.005,
+    'SAMPLE_RATE': 0.0,
+    'KEEP': 50,
+    'PATH': os.path.join(tempfile.gettempdir(), 'eda-profiles'),
+}
+
+# Deepest stack recorded per sample
+MAX_DEPTH = 64
+
+
+def profiling_settings():
+    return dict(DEFAULT_PROFILING_SETTINGS, **getattr(settings, 'PROFILING', {}))
+
+
+class Capture:
+    """Profiling state of one in-flight request"""
+
+    def __init__(self, threshold):
+        self.started = time.monotonic()
+        self.deadline = self.started + threshold
+        self.stacks = Counter()
+        self.samples = 0
+        self.meta = {}
+        # Threads working for the request -> nesting depth
+        self.threads = Counter()
+        self.seen_threads = set()
+        self._lock = threading.Lock()
+
+    def enter(self, thread_id):
+        with self._lock:
+            self.threads[thread_id] += 1
+            self.seen_threads.add(thread_id)
+
+    def exit(self, thread_id):
+        with self._lock:
+            self.threads[thread_id] -= 1
+            if not self.threads[thread_id]:
+                del self.threads[thread_id]
+
+    def thread_ids(self):
+        with self._lock:
+            return list(self.threads)
+
+
+# Capture of the request being handled, for annotate()
+_capture = contextvars.ContextVar('eda_profile_capture', default=None)
+
+
+def annotate(**meta):
+    """Attach request details (canonical payload, dataset version) to the current capture"""
+    capture = _capture.get()
+    if capture is not None:
+        capture.meta.update(meta)
+
+
+@contextlib.contextmanager
+def profiled_thread():
+    """Have the current thread sampled with the request capture of the current context, if any"""
+    capture = _capture.get()
+    if capture is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    capture.enter(thread_id)
+    try:
+        yield
+    finally:
+        capture.exit(thread_id)
+
+
+def profiled(view):
+    """Decorate a sync view so the thread running it is sampled (under ASGI it is not the middleware's)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with profiled_thread():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def _stack(frame):
+    """Collapsed root-to-leaf stack of a frame"""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Watchdog(threading.Thread):
+    """Samples the stacks of requests that outlive their deadline"""
+
+    def __init__(self, interval):
+        super().__init__(name='eda-profiler', daemon=True)
+        self.interval = interval
+        self.captures = {}
+        self.condition = threading.Condition()
+
+    def register(self, capture):
+        with self.condition:
+            self.captures[id(capture)] = capture
+            self.condition.notify()
+
+    def unregister(self, capture):
+        with self.condition:
+            self.captures.pop(id(capture), None)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.captures:
+                    self.condition.wait()
+                now = time.monotonic()
+                overdue = [c for c in self.captures.values() if c.deadline <= now]
+                if not overdue:
+                    # Sleep until the earliest deadline (or a new request)
+                    self.condition.wait(min(c.deadline for c in self.captures.values()) - now)
+                    continue
+            frames = sys._current_frames()
+            with self.condition:
+                for capture in overdue:
+                    # Skip requests that finished since (their capture is being written)
+                    if id(capture) not in self.captures:
+                        continue
+                    for thread_id in capture.thread_ids():
+                        frame = frames.get(thread_id)
+                        if frame is not None:
+                            capture.stacks[_stack(frame)] += 1
+                            capture.samples += 1
+            del frames
+            time.sleep(self.interval)
+
+
+_watchdog = None
+_watchdog_lock = threading.Lock()
+
+
+def get_watchdog(interval):
+    global _watchdog
+    if _watchdog is None:
+        with _watchdog_lock:
+            if _watchdog is None:
+                _watchdog = Watchdog(interval)
+                _watchdog.start()
+    return _watchdog
+
+
+def _profile_functions(profiler, limit=50):
+    """Top functions of a cProfile run by cumulative time"""
+    profiler.create_stats()
+    rows = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in profiler.stats.items():
+        rows.append({
+            'function': f'{name} ({os.path.basename(filename)}:{line})',
+            'calls': calls,
+            'tottime': round(tottime, 6),
+            'cumtime': round(cumtime, 6),
+        })
+    rows.sort(key=lambda row: row['cumtime'], reverse=True)
+    return rows[:limit]
+
+
+def write_capture(root, record, profiler=None, keep=50):
+    """
+    Write a capture into the ring buffer, dropping the oldest beyond `keep`
+
+    Returns:
+        capture id
+    """
+    os.makedirs(root, exist_ok=True)
+    capture_id = f"{time.time_ns()}-{os.getpid()}"
+    if profiler is not None:
+        record['functions'] = _profile_functions(profiler)
+        profiler.dump_stats(os.path.join(root, f'{capture_id}.prof'))
+    record['id'] = capture_id
+    tmp_path = os.path.join(root, f'.tmp-{capture_id}.json')
+    with open(tmp_path, 'w') as handle:
+        json.dump(record, handle)
+    os.replace(tmp_path, os.path.join(root, f'{capture_id}.json'))
+    captures = list_captures(root)
+    for old in captures[:max(0, len(captures) - keep)]:
+        remove_capture(root, old)
+    return capture_id
+
+
+def list_captures(root):
+    """Capture ids in the ring buffer, oldest first"""
+    if not os.path.isdir(root):
+        return []
+    ids = [name[:-5] for name in os.listdir(root) if name.endswith('.json') and not name.startswith('.')]
+    return sorted(ids, key=lambda capture_id: int(capture_id.split('-')[0]))
+
+
+def read_capture(root, capture_id):
+    with open(os.path.join(root, f'{capture_id}.json')) as handle:
+        return json.load(handle)
+
+
+def remove_capture(root, capture_id):
+    for suffix in ('.json', '.prof'):
+        try:
+            os.remove(os.path.join(root, capture_id + suffix))
+        except FileNotFoundError:
+            pass
+
+
+def _record(request, response, capture, config, trigger, profiler=None):
+    """Write the capture of a finished request when it has anything to show"""
+    if profiler is None and not capture.samples:
+        return
+    record = dict(
+        capture.meta,
+        path=request.path,
+        method=request.method,
+        status=response.status_code,
+        duration=round(time.monotonic() - capture.started, 6),
+        trigger=trigger,
+        threshold=config['THRESHOLD'] if trigger == 'threshold' else 0,
+        interval=config['INTERVAL'],
+        samples=capture.samples,
+        threads=len(capture.seen_threads),
+        stacks=dict(capture.stacks.most_common()),
+        pid=os.getpid(),
+        timestamp=time.time(),
+    )
+    # Sorting the pstats and writing files would hold up the response (and,
+    # under ASGI, the event loop): the capture is written by a background thread
+    _get_writer().submit(_write, config, record, profiler)
+
+
+def _write(config, record, profiler):
+    try:
+        write_capture(config['PATH'], record, profiler, config['KEEP'])
+    except Exception as e:
+        logger.warning(f"Could not write profile to {config['PATH']}: {e}")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer():
+    """Single thread writing captures in the order requests finished"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='eda-profile-writer')
+    return _writer
+
+
+def wait_for_writes(timeout=None):
+    """Block until every capture recorded so far has been written"""
+    _get_writer().submit(lambda: None).result(timeout)
+
+
+@sync_and_async_middleware
+def ProfilingMiddleware(get_response):
+    """Captures profiles of slow (or sampled) requests when PROFILING is enabled"""
+
+    if iscoroutinefunction(get_response):
+        async def async_middleware(request):
+            config = profiling_settings()
+            if not config['ENABLED'] or request.path not in config['PATHS']:
+                return await get_response(request)
+
+            # The loop thread runs other requests too: sample the threads of this one from the start
+            sampled = random.random() < config['SAMPLE_RATE']
+            capture = Capture(0 if sampled else config['THRESHOLD'])
+            watchdog = get_watchdog(config['INTERVAL'])
+            token = _capture.set(capture)
+            watchdog.register(capture)
+            try:
+                response = await get_response(request)
+            finally:
+                watchdog.unregister(capture)
+                _capture.reset(token)
+            _record(request, response, capture, config, 'sample' if sampled else 'threshold')
+            return response
+        return async_middleware
+
+    def middleware(request):
+        config = profiling_settings()
+        if not config['ENABLED'] or request.path not in config['PATHS']:
+            return get_response(request)
+
+        capture = Capture(config['THRESHOLD'])
+        watchdog = get_watchdog(config['INTERVAL'])
+        profiler = cProfile.Profile() if random.random() < config['SAMPLE_RATE'] else None
+        token = _capture.set(capture)
+        thread_id = threading.get_ident()
+        capture.enter(thread_id)
+        watchdog.register(capture)
+        if profiler is not None:
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler is active in this thread
+                profiler = None
+        try:
+            response = get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            watchdog.unregister(capture)
+            capture.exit(thread_id)
+            _capture.reset(token)
+        _record(request, response, capture, config, 'sample' if profiler is not None else 'threshold', profiler)
+        return response
+
+    return middleware
@@ -0,0 +1,107 @@
+"""
+Triggers for hot dataset reloads.
+
+Besides the admin endpoint, a reload can be requested with a signal (SIGHUP
+by default) or picked up by a watcher thread that polls DATASET_PATH, and in
+shared-memory mode the segment pointer, for changes. Every trigger calls
+DataLoader.reload_async(), which builds the new state in the background and
+swaps it in when complete.
+"""
+import logging
+import os
+import signal
+import threading
+from django.conf import settings
+from . import shared
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RELOAD_SETTINGS = {
+    'WATCH': False,
+    'WATCH_INTERVAL': 5.0,
+    'SIGNAL': 'SIGHUP',
+    'TOKEN': '',
+}
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def reload_settings():
+    """DATASET_RELOAD merged over the defaults"""
+    return dict(DEFAULT_RELOAD_SETTINGS, **getattr(settings, 'DATASET_RELOAD', {}))
+
+
+def _source_stamp():
+    """What the watcher compares between polls"""
+    try:
+        stat = os.stat(settings.DATASET_PATH)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        stamp = None
+    config = shared.shared_settings()
+    if config['ENABLED']:
+        return stamp, shared.current_segment(config['PATH'])
+    return stamp, None
+
+
+class DatasetWatcher(threading.Thread):
+    """Daemon thread requesting a reload when the source file or shared segment changes"""
+
+    def __init__(self, loader, interval):
+        super().__init__(name='dataset-watcher', daemon=True)
+        self.loader = loader
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.stamp = _source_stamp()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                stamp = _source_stamp()
+            except Exception as e:
+                logger.warning(f"Dataset watcher could not check the source: {e}")
+                continue
+            if stamp != self.stamp:
+                self.stamp = stamp
+                logger.info(f"Dataset source changed, reloading {settings.DATASET_PATH}")
+                self.loader.reload_async()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_watcher(loader):
+    """Start the watcher once per process when DATASET_RELOAD['WATCH'] is set"""
+    global _watcher
+    config = reload_settings()
+    if not config['WATCH']:
+        return None
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = DatasetWatcher(loader, config['WATCH_INTERVAL'])
+            _watcher.start()
+    return _watcher
+
+
+def install_signal_handler(loader):
+    """
+    Reload on DATASET_RELOAD['SIGNAL'] (e.g. `kill -HUP <pid>`)
+
+    Signal handlers can only be installed from the main thread; elsewhere,
+    or when the setting is empty, this does nothing.
+    """
+    name = reload_settings()['SIGNAL']
+    if not name or threading.current_thread() is not threading.main_thread():
+        return False
+    signum = getattr(signal, name, None)
+    if signum is None:
+        logger.warning(f"Unknown reload signal {name!r}")
+        return False
+
+    def handle(signum, frame):
+        logger.info(f"Received {name}, reloading dataset")
+        loader.reload_async()
+
+    signal.signal(signum, handle)
+    return True
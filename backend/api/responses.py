@@ -0,0 +1,130 @@
+"""
+HTTP helpers for the cached JSON endpoints: strong ETags, conditional
+requests and negotiated gzip/brotli compression.
+
+An ETag is derived from the dataset version plus the canonical request key,
+so it can be checked before any work is done. Each content encoding is its
+own representation with its own strong tag ("<digest>-gzip"); If-None-Match
+matches on the digest so a client revalidating any encoding gets a 304.
+Compressed bodies are kept in the response cache next to the plain ones.
+"""
+import gzip
+import hashlib
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from .metrics import stage
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+DEFAULT_COMPRESSION_SETTINGS = {
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+
+
+def _compression_settings():
+    return dict(DEFAULT_COMPRESSION_SETTINGS, **getattr(settings, 'RESPONSE_COMPRESSION', {}))
+
+
+def make_etag(version, key):
+    """Digest identifying the response for a request key on a dataset version"""
+    return hashlib.sha256(f"{version}:{key}".encode('utf-8')).hexdigest()[:32]
+
+
+def _quoted(digest, encoding=None):
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+def etag_matches(request, digest):
+    """True when If-None-Match names any representation of this digest"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"').split('-', 1)[0] == digest:
+            return True
+    return False
+
+
+def negotiate_encoding(request):
+    """Pick 'br', 'gzip' or None from the request's Accept-Encoding"""
+    accepted = {}
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    """Compress a body with the given content encoding"""
+    config = _compression_settings()
+    if encoding == 'br':
+        return brotli.compress(body, quality=config['BROTLI_QUALITY'])
+    return gzip.compress(body, compresslevel=config['GZIP_LEVEL'], mtime=0)
+
+
+def not_modified(digest):
+    """304 response for a matching If-None-Match"""
+    response = HttpResponseNotModified()
+    response['ETag'] = _quoted(digest)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def json_response(request, body, digest, cache=None, key=None, version=None):
+    """
+    Build the response for a serialized JSON body
+
+    Args:
+        request: HttpRequest
+        body: bytes - uncompressed JSON
+        digest: str - from make_etag
+        cache: ResponseCache holding compressed variants (optional)
+        key: str - canonical request key used for the cache
+        version: dataset version used for the cache
+
+    Returns:
+        HttpResponse, compressed when the client accepts it
+    """
+    encoding = negotiate_encoding(request)
+    if encoding and len(body) >= _compression_settings()['MIN_SIZE']:
+        variant_key = f"{key}|{encoding}"
+        payload = cache.get(variant_key, version, track=False) if cache is not None else None
+        if payload is None:
+            with stage('compress') as timed:
+                payload = compress(body, encoding)
+                timed.bytes = len(payload)
+            if cache is not None:
+                cache.set(variant_key, version, payload)
+    else:
+        encoding, payload = None, body
+
+    response = HttpResponse(payload, content_type='application/json')
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = _quoted(digest, encoding)
+    # Clients may keep the body but must revalidate it with If-None-Match
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -0,0 +1,124 @@
+"""
+Compact in-memory schema for the dataset.
+
+Label columns become categoricals, integer-valued numerics are downcast to
+the narrowest width that holds them, other float columns go to float32 when
+every value survives the round trip, and mostly-constant driver columns
+(D*, AV*, EV*) are stored sparse. Every conversion is lossless: a float32
+column upcasts back to the exact float64 values, so the correlation
+statistics do not change. Values that would lose digits (most parsed
+decimals, such as 0.1) keep float64.
+"""
+import numpy as np
+import pandas as pd
+
+# Columns that hold user-facing labels (stored as categoricals)
+LABEL_COLUMNS = [
+    'Market', 'Channel', 'Region', 'Category', 'SubCategory', 'Brand',
+    'Variant', 'PackType', 'PPG', 'PackSize', 'BrCatId',
+]
+
+# Additive measures are kept as float64 so sums stay bit-for-bit stable
+MEASURE_COLUMNS = ['SalesValue', 'Volume', 'VolumeUnits']
+
+DRIVER_PREFIXES = ('D', 'AV', 'EV')
+
+# A driver column is stored sparse when at least this share of rows hold its fill value
+SPARSE_THRESHOLD = 0.9
+
+_NULLABLE_INTS = ['Int8', 'Int16', 'Int32', 'Int64']
+_INTS = ['int8', 'int16', 'int32', 'int64']
+
+
+def is_driver_column(name):
+    """True for the D*/AV*/EV* driver columns used by the correlation matrix"""
+    return any(name.startswith(prefix) for prefix in DRIVER_PREFIXES)
+
+
+def memory_usage(df):
+    """Deep memory footprint of a DataFrame in bytes"""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def _narrowest_int(values, has_missing):
+    """Pick the narrowest integer dtype that can hold every value"""
+    candidates = _NULLABLE_INTS if has_missing else _INTS
+    lo, hi = (values.min(), values.max()) if len(values) else (0, 0)
+    for name, np_name in zip(candidates, _INTS):
+        info = np.iinfo(np_name)
+        if info.min <= lo and hi <= info.max:
+            return name
+    return candidates[-1]
+
+
+def fits_float32(values):
+    """True when every float64 value (NaN included) is exactly representable in float32"""
+    with np.errstate(over='ignore'):
+        narrowed = values.astype(np.float32)
+    return bool(np.array_equal(narrowed.astype(np.float64), values, equal_nan=True))
+
+
+def _narrow_float(dtype, exact):
+    """float32 for a float64 column whose values all fit it, else the dtype unchanged"""
+    return np.dtype(np.float32) if exact and dtype == np.float64 else dtype
+
+
+def _compact_numeric(series, sparse_threshold):
+    """Return the compact form of a numeric column, or the column unchanged"""
+    if isinstance(series.dtype, pd.SparseDtype):
+        return series
+
+    if series.name in MEASURE_COLUMNS:
+        return series
+
+    def narrowed():
+        return _narrow_float(series.dtype, series.dtype == np.float64 and fits_float32(series.to_numpy()))
+
+    if is_driver_column(series.name) and pd.api.types.is_float_dtype(series.dtype) and len(series):
+        fill = 0.0
+        if (series == fill).mean() >= sparse_threshold:
+            return series.astype(pd.SparseDtype(narrowed(), fill))
+        if series.isna().mean() >= sparse_threshold:
+            return series.astype(pd.SparseDtype(narrowed(), np.nan))
+        return series.astype(narrowed())
+
+    present = series.dropna()
+    if present.empty:
+        return series.astype(narrowed())
+    values = present.to_numpy()
+    if pd.api.types.is_float_dtype(values.dtype) and not np.array_equal(values, np.round(values)):
+        return series.astype(narrowed())
+    return series.astype(_narrowest_int(values, len(present) != len(series)))
+
+
+def optimize_frame(df, sparse_threshold=SPARSE_THRESHOLD):
+    """
+    Convert a freshly parsed frame to the compact schema
+
+    Args:
+        df: pandas DataFrame as produced by read_dataset
+        sparse_threshold: float - fill-value share above which drivers go sparse
+
+    Returns:
+        (DataFrame, stats) where stats reports memory before and after
+    """
+    before = memory_usage(df)
+    converted = {}
+
+    for name in df.columns:
+        series = df[name]
+        if name in LABEL_COLUMNS or pd.api.types.is_object_dtype(series.dtype):
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                # astype('category') sorts categories, keeping groupby output order unchanged
+                series = series.astype('category')
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            series = _compact_numeric(series, sparse_threshold)
+        converted[name] = series
+
+    optimized = pd.DataFrame(converted, index=df.index)
+    stats = {
+        'memory_before': before,
+        'memory_after': memory_usage(optimized),
+        'dtypes': {name: str(dtype) for name, dtype in optimized.dtypes.items()},
+    }
+    return optimized, stats
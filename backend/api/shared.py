@@ -0,0 +1,246 @@
+"""
+Shared-memory serving of the loaded dataset across worker processes.
+
+One process publishes the typed frame, the filter indexes, the cube and the
+filter catalog as a segment: a bundle of ``.npy`` arrays plus a manifest in
+a directory under DATASET_SHARED['PATH'] (tmpfs such as /dev/shm by
+default). Workers attach by memory-mapping the arrays read-only, so the
+operating system shares one copy of the pages between all of them.
+
+Segments are versioned. A new one is written next to the old ones and a
+``CURRENT`` pointer file is swapped to it atomically; workers that already
+attached keep their mapping (removing a mapped file does not invalidate
+it), and segments beyond the newest KEEP are removed after each publish.
+"""
+import fcntl
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from . import snapshot
+from .correlation import CorrelationStats
+from .cube import Cube
+from .filter_index import FilterIndex
+
+logger = logging.getLogger(__name__)
+
+POINTER_NAME = 'CURRENT'
+LOCK_NAME = '.publish.lock'
+
+DEFAULT_SHARED_SETTINGS = {
+    'ENABLED': False,
+    'PATH': os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else '/tmp', 'eda-dataset'),
+    'KEEP': 2,
+    'AUTOPUBLISH': True,
+}
+
+
+def shared_settings():
+    """DATASET_SHARED merged over the defaults"""
+    return dict(DEFAULT_SHARED_SETTINGS, **getattr(settings, 'DATASET_SHARED', {}))
+
+
+def _plain(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+def encode_index(index, prefix):
+    """Arrays and JSON metadata for a FilterIndex, array names starting with prefix"""
+    arrays = {}
+    columns = []
+    for position, (column, bitsets) in enumerate(index.bitsets.items()):
+        key = f"{prefix}{position}"
+        values = list(bitsets)
+        words = (index.length + 63) // 64
+        arrays[f"{key}_bitsets"] = (np.vstack([bitsets[v] for v in values]) if values
+                                    else np.zeros((0, words), dtype=np.uint64))
+        if column in index.codes:
+            arrays[f"{key}_codes"] = index.codes[column]
+        columns.append({'column': column, 'array': key, 'values': [_plain(v) for v in values]})
+    return arrays, {'length': index.length, 'numeric': sorted(index.numeric), 'columns': columns}
+
+
+def decode_index(arrays, meta):
+    """Rebuild a FilterIndex whose bitsets and codes are views on the shared arrays"""
+    bitsets = {}
+    codes = {}
+    for spec in meta['columns']:
+        rows = arrays[f"{spec['array']}_bitsets"]
+        bitsets[spec['column']] = {value: rows[i] for i, value in enumerate(spec['values'])}
+        if f"{spec['array']}_codes" in arrays:
+            codes[spec['column']] = arrays[f"{spec['array']}_codes"]
+    return FilterIndex(meta['length'], bitsets, meta['numeric'], codes)
+
+
+def _prefixed(arrays, prefix):
+    return {f"{prefix}{name}": array for name, array in arrays.items()}
+
+
+def _unprefixed(arrays, prefix):
+    return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+
+def _segment_names(root):
+    """Published segment directories, oldest first"""
+    try:
+        entries = os.listdir(root)
+    except FileNotFoundError:
+        return []
+    names = [name for name in entries
+             if '.tmp-' not in name and '.old-' not in name
+             and snapshot.read_manifest(os.path.join(root, name)) is not None]
+    return sorted(names, key=lambda name: int(name.rsplit('-', 1)[-1]))
+
+
+def current_segment(root):
+    """Name of the segment CURRENT points to, or None"""
+    try:
+        with open(os.path.join(root, POINTER_NAME)) as fh:
+            return fh.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _point_to(root, name):
+    """Atomically swap the CURRENT pointer to a segment"""
+    tmp_path = os.path.join(root, f".{POINTER_NAME}.tmp-{os.getpid()}")
+    with open(tmp_path, 'w') as fh:
+        fh.write(name)
+    os.replace(tmp_path, os.path.join(root, POINTER_NAME))
+
+
+def cleanup_segments(root, keep):
+    """
+    Remove old segments, keeping the current one and the newest `keep`
+
+    Workers that mapped a removed segment keep reading it until they attach
+    to a newer one; the pages are freed when the last mapping goes away.
+
+    Returns:
+        list of removed segment names
+    """
+    current = current_segment(root)
+    names = _segment_names(root)
+    keep_names = set(names[-keep:]) if keep > 0 else set()
+    removed = []
+    for name in names:
+        if name != current and name not in keep_names:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            removed.append(name)
+    # Leftovers of interrupted publishes
+    for entry in os.listdir(root):
+        if '.tmp-' in entry or '.old-' in entry:
+            path = os.path.join(root, entry)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+    return removed
+
+
+def publish(root, version, frame, index, cube, catalog, extra=None, keep=2):
+    """
+    Write a new segment and make it current
+
+    Args:
+        root: str - shared directory
+        version: str - dataset version (source content hash)
+        frame: pandas DataFrame with the typed rows
+        index: FilterIndex over the rows (or None)
+        cube: Cube built from the rows
+        catalog: dict from build_catalog
+        extra: dict - additional JSON serializable metadata (source fingerprint, stats)
+        keep: int - number of segments retained after publishing
+
+    Returns:
+        str - name of the published segment
+    """
+    os.makedirs(root, exist_ok=True)
+    name = f"{version}-{time.time_ns()}"
+
+    arrays, columns = snapshot.encode_frame(frame)
+    arrays = _prefixed(arrays, 'frame.')
+    meta = dict(
+        extra or {},
+        version=version,
+        length=len(frame),
+        columns=columns,
+        catalog=catalog,
+    )
+    if index is not None:
+        index_arrays, meta['index'] = encode_index(index, 'index.')
+        arrays.update(index_arrays)
+
+    cell_arrays, cell_columns = snapshot.encode_frame(cube.cells)
+    arrays.update(_prefixed(cell_arrays, 'cells.'))
+    meta['cube'] = {'length': len(cube.cells), 'columns': cell_columns}
+    if cube.index is not None:
+        cube_index_arrays, meta['cube']['index'] = encode_index(cube.index, 'cube_index.')
+        arrays.update(cube_index_arrays)
+    if cube.correlation is not None:
+        correlation = cube.correlation
+        meta['cube']['correlation'] = correlation.columns
+        arrays.update({'correlation.n': correlation.n, 'correlation.sx': correlation.sx,
+                       'correlation.sxx': correlation.sxx, 'correlation.sxy': correlation.sxy})
+
+    snapshot.write_bundle(os.path.join(root, name), arrays, meta)
+    _point_to(root, name)
+    removed = cleanup_segments(root, keep)
+    logger.info(f"Published shared dataset segment {name} ({len(frame)} rows), removed {len(removed)} old segments")
+    return name
+
+
+def attach(root, retries=3):
+    """
+    Map the current segment read-only
+
+    Returns:
+        dict with segment, version, frame, index, cube, catalog and the
+        segment manifest, or None when nothing has been published
+    """
+    for _ in range(retries):
+        name = current_segment(root)
+        if name is None:
+            return None
+        try:
+            arrays, meta = snapshot.read_bundle(os.path.join(root, name), mmap=True)
+        except (FileNotFoundError, OSError, ValueError):
+            # The pointer moved and the segment was cleaned up meanwhile
+            continue
+
+        frame = snapshot.decode_frame(_unprefixed(arrays, 'frame.'), meta['columns'], meta['length'])
+        index = decode_index(arrays, meta['index']) if 'index' in meta else None
+        cube_meta = meta['cube']
+        cells = snapshot.decode_frame(_unprefixed(arrays, 'cells.'), cube_meta['columns'], cube_meta['length'])
+        cube_index = (decode_index(arrays, cube_meta['index'])
+                      if 'index' in cube_meta else None)
+        correlation = None
+        if 'correlation' in cube_meta:
+            correlation = CorrelationStats(
+                cube_meta['correlation'],
+                *(arrays[f"correlation.{stat}"] for stat in ('n', 'sx', 'sxx', 'sxy')),
+            )
+        return {
+            'segment': name,
+            'version': meta['version'],
+            'frame': frame,
+            'index': index,
+            'cube': Cube(cells, cube_index, correlation),
+            'catalog': meta['catalog'],
+            'manifest': meta,
+        }
+    raise RuntimeError(f"Could not attach to the shared dataset under {root}")
+
+
+@contextmanager
+def publish_lock(root):
+    """Exclusive inter-process lock so only one process publishes at a time"""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_NAME), 'w') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
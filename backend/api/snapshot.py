@@ -0,0 +1,363 @@
+"""
+Columnar snapshot of the dataset.
+
+A snapshot is a directory written next to the CSV holding one ``.npy`` file
+per array plus a ``manifest.json`` describing how to rebuild the DataFrame;
+the manifest is written last and is what makes a new snapshot visible.
+Numeric columns are stored as 2D blocks (one per dtype) so they can be
+memory-mapped and handed to pandas without a copy; label columns are stored
+as integer codes with their categories in the manifest.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 4
+MANIFEST_NAME = 'manifest.json'
+
+
+def file_fingerprint(path):
+    """Return size, mtime and sha256 of a source file"""
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': digest.hexdigest(),
+    }
+
+
+class BundleWriter:
+    """
+    Write a bundle array by array, then publish it atomically
+
+    Arrays are written into the bundle directory under file names unique to
+    this writer and synced to disk; the manifest naming them is written last
+    and swapped in with a single os.replace. Readers see either the previous
+    manifest and its files or the new ones, and a crash before the swap
+    leaves the previous bundle intact. Files of the replaced generation are
+    removed after the swap. Arrays can be saved whole or allocated as
+    writable memory maps and filled in pieces, which keeps large bundles out
+    of memory while they are written.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.generation = f"{time.time_ns()}-{os.getpid()}"
+        self.names = []
+        self.layout = {}
+        self.committed = False
+        os.makedirs(self.path, exist_ok=True)
+
+    def array_path(self, name):
+        """File of an array of this writer"""
+        return os.path.join(self.path, _array_file(name, self.generation))
+
+    def save(self, name, array):
+        """Store a complete array"""
+        array = np.ascontiguousarray(array)
+        np.save(self.array_path(name), array, allow_pickle=False)
+        self._add(name, array.dtype, array.shape)
+
+    def allocate(self, name, shape, dtype):
+        """Writable memory-mapped array to be filled by the caller"""
+        self._add(name, np.dtype(dtype), shape)
+        return np.lib.format.open_memmap(self.array_path(name), mode='w+', dtype=dtype, shape=shape)
+
+    def _add(self, name, dtype, shape):
+        self.names.append(name)
+        self.layout[name] = {'dtype': dtype.str, 'shape': [int(n) for n in shape]}
+
+    def commit(self, meta):
+        """Sync the arrays, then swap in the manifest naming them"""
+        for name in self.names:
+            _fsync(self.array_path(name))
+        manifest = dict(meta, format_version=FORMAT_VERSION, generation=self.generation,
+                        arrays=sorted(self.names), layout=self.layout)
+        previous = _read_json(os.path.join(self.path, MANIFEST_NAME))
+        tmp_path = os.path.join(self.path, f".{MANIFEST_NAME}.tmp-{self.generation}")
+        with open(tmp_path, 'w') as fh:
+            json.dump(manifest, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST_NAME))
+        _fsync(self.path)
+        self.committed = True
+        if previous is not None and previous.get('generation') != self.generation:
+            # Readers still mapping them keep their pages until they let go
+            for name in previous.get('arrays', []):
+                _remove(os.path.join(self.path, _array_file(name, previous.get('generation'))))
+
+    def abort(self):
+        """Discard everything written so far, unless committed"""
+        if self.committed:
+            return
+        for name in self.names:
+            _remove(self.array_path(name))
+
+
+def _array_file(name, generation=None):
+    # Bundles of format 2 and older used plain names
+    return f"{name}.{generation}.npy" if generation else f"{name}.npy"
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _read_json(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def write_bundle(path, arrays, meta):
+    """
+    Write a set of named arrays plus a JSON manifest to a directory
+
+    Args:
+        path: str - target directory
+        arrays: dict of name -> numpy array
+        meta: dict - JSON serializable metadata stored in the manifest
+    """
+    writer = BundleWriter(path)
+    try:
+        for name, array in arrays.items():
+            writer.save(name, array)
+        writer.commit(meta)
+    finally:
+        writer.abort()
+
+
+def read_manifest(path):
+    """Read a bundle manifest, returning None if it is missing or unreadable"""
+    manifest = _read_json(os.path.join(path, MANIFEST_NAME))
+    if manifest is None or manifest.get('format_version') != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def read_bundle(path, mmap=True, retries=3):
+    """
+    Read a bundle written by write_bundle
+
+    Every array is checked against the dtype and shape the manifest records.
+    When a newer generation is committed while the arrays are being opened
+    (its commit removes the files of the old one), the read starts over.
+
+    Returns:
+        (arrays, manifest) tuple, arrays memory-mapped read-only when mmap is set
+
+    Raises:
+        FileNotFoundError: when there is no valid bundle at path
+        ValueError: when an array is truncated or does not match the manifest
+    """
+    mode = 'r' if mmap else None
+    for attempt in range(retries):
+        manifest = read_manifest(path)
+        if manifest is None:
+            raise FileNotFoundError(f"No valid bundle at {path}")
+        try:
+            arrays = {
+                name: np.load(os.path.join(path, _array_file(name, manifest['generation'])),
+                              mmap_mode=mode, allow_pickle=False)
+                for name in manifest['arrays']
+            }
+        except FileNotFoundError:
+            if attempt == retries - 1:
+                raise
+            continue
+        for name, array in arrays.items():
+            expected = manifest['layout'][name]
+            if array.dtype.str != expected['dtype'] or list(array.shape) != expected['shape']:
+                raise ValueError(f"Array {name!r} of {path} does not match its manifest")
+        return arrays, manifest
+
+
+def encode_frame(df):
+    """
+    Split a DataFrame into plain numpy arrays and a column layout
+
+    Returns:
+        (arrays, columns) where columns is a JSON serializable list describing
+        how each column is rebuilt by decode_frame
+    """
+    arrays = {}
+    columns = []
+    blocks = {}
+
+    for name in df.columns:
+        series = df[name]
+        dtype = series.dtype
+        spec = {'name': name}
+
+        if isinstance(dtype, pd.SparseDtype):
+            spec['sparse_fill'] = dtype.fill_value.item() if hasattr(dtype.fill_value, 'item') else dtype.fill_value
+            series = series.sparse.to_dense()
+            dtype = series.dtype
+
+        if isinstance(dtype, pd.CategoricalDtype):
+            key = f"codes_{len(columns)}"
+            arrays[key] = series.cat.codes.to_numpy()
+            spec.update(kind='category', array=key, categories=dtype.categories.tolist(),
+                        categories_dtype=str(dtype.categories.dtype))
+        elif pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+            codes, uniques = pd.factorize(series, sort=True)
+            key = f"codes_{len(columns)}"
+            arrays[key] = codes.astype(np.int32)
+            spec.update(kind='object', array=key, categories=[str(u) for u in uniques])
+        elif pd.api.types.is_datetime64_dtype(dtype):
+            key = f"datetime_{len(columns)}"
+            arrays[key] = series.to_numpy(dtype='datetime64[ns]').view(np.int64)
+            spec.update(kind='datetime', array=key)
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype):
+            # Nullable integer / boolean columns: values plus a missing mask
+            key = f"masked_{len(columns)}"
+            arrays[f"{key}_values"] = series.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+            arrays[f"{key}_mask"] = series.isna().to_numpy()
+            spec.update(kind='masked', array=key, dtype=str(dtype))
+        else:
+            blocks.setdefault(str(dtype), []).append((len(columns), series.to_numpy()))
+            spec.update(kind='block', dtype=str(dtype))
+        columns.append(spec)
+
+    for dtype_name, members in blocks.items():
+        key = f"block_{dtype_name}"
+        arrays[key] = np.vstack([values for _, values in members])
+        for row, (position, _) in enumerate(members):
+            columns[position].update(array=key, row=row)
+
+    return arrays, columns
+
+
+def decode_frame(arrays, columns, length):
+    """Rebuild a DataFrame from encode_frame output without copying numeric blocks"""
+    # Each dtype block becomes a single pandas block; passing the transposed
+    # (n_rows, n_cols) view keeps the memory-mapped buffer as the backing store.
+    block_frames = {}
+    for spec in columns:
+        if spec['kind'] == 'block' and spec['array'] not in block_frames:
+            names = [c['name'] for c in columns if c.get('array') == spec['array']]
+            block_frames[spec['array']] = pd.DataFrame(arrays[spec['array']].T, columns=names, copy=False)
+
+    data = {}
+    for spec in columns:
+        name = spec['name']
+        kind = spec['kind']
+        if kind == 'block':
+            continue
+        if kind == 'category':
+            categories = pd.Index(spec['categories'], dtype=spec.get('categories_dtype'))
+            values = pd.Categorical.from_codes(arrays[spec['array']], categories=categories)
+        elif kind == 'object':
+            codes = np.asarray(arrays[spec['array']])
+            values = np.array(spec['categories'], dtype=object).take(codes)
+            values[codes < 0] = np.nan
+        elif kind == 'datetime':
+            values = np.asarray(arrays[spec['array']]).view('datetime64[ns]')
+        elif kind == 'masked':
+            dtype = pd.api.types.pandas_dtype(spec['dtype'])
+            values = dtype.construct_array_type()(
+                np.asarray(arrays[f"{spec['array']}_values"]),
+                np.asarray(arrays[f"{spec['array']}_mask"]),
+            )
+        else:
+            raise ValueError(f"Unknown column kind {kind!r} for {name}")
+        data[name] = values
+
+    # Start from the first block and insert everything else in manifest order;
+    # insert() adds new blocks without touching the existing ones.
+    if block_frames:
+        first = next(iter(block_frames))
+        frame = block_frames.pop(first)
+    else:
+        frame = pd.DataFrame(index=pd.RangeIndex(length))
+    for block in block_frames.values():
+        data.update((name, block[name].to_numpy()) for name in block.columns)
+    for position, spec in enumerate(columns):
+        if spec['name'] not in frame.columns:
+            frame.insert(position, spec['name'], data[spec['name']])
+
+    for spec in columns:
+        if 'sparse_fill' in spec:
+            frame[spec['name']] = frame[spec['name']].astype(
+                pd.SparseDtype(frame[spec['name']].dtype, spec['sparse_fill'])
+            )
+    return frame
+
+
+def write_snapshot(df, source_path, snapshot_path, fingerprint=None, extra=None):
+    """
+    Write a snapshot of an already-typed DataFrame
+
+    Args:
+        df: pandas DataFrame as produced by DataLoader
+        source_path: str - the CSV the frame was parsed from
+        snapshot_path: str - snapshot directory
+        fingerprint: dict - precomputed file_fingerprint of the source
+        extra: dict - additional JSON serializable metadata for the manifest
+    """
+    arrays, columns = encode_frame(df)
+    write_bundle(snapshot_path, arrays, dict(
+        extra or {},
+        source=fingerprint or file_fingerprint(source_path),
+        length=len(df),
+        columns=columns,
+    ))
+    logger.info(f"Wrote dataset snapshot to {snapshot_path}")
+
+
+def snapshot_is_current(manifest, source_path):
+    """
+    Check a snapshot manifest against its source file
+
+    Size and mtime are compared first; if they differ the file is hashed so
+    that a touched-but-unchanged file does not invalidate the snapshot.
+    """
+    if manifest is None:
+        return False
+    source = manifest.get('source', {})
+    stat = os.stat(source_path)
+    if stat.st_size == source.get('size') and stat.st_mtime_ns == source.get('mtime_ns'):
+        return True
+    if stat.st_size != source.get('size'):
+        return False
+    return file_fingerprint(source_path)['sha256'] == source.get('sha256')
+
+
+def load_snapshot(source_path, snapshot_path, mmap=True):
+    """
+    Load a snapshot if it exists and matches the source file
+
+    Returns:
+        (DataFrame, manifest) or (None, None) when the snapshot is missing or stale
+    """
+    manifest = read_manifest(snapshot_path)
+    if not snapshot_is_current(manifest, source_path):
+        return None, None
+    arrays, manifest = read_bundle(snapshot_path, mmap=mmap)
+    frame = decode_frame(arrays, manifest['columns'], manifest['length'])
+    return frame, manifest
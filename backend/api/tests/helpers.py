@@ -0,0 +1,123 @@
+"""
+Helpers shared by the API tests.
+
+Expected values are computed with plain pandas on the CSV (read_csv,
+isin, groupby, corr), independently of the schema, index, cube and
+aggregation code under test.
+"""
+import functools
+import json
+import math
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from .. import views
+from ..data_loader import data_loader
+from ..renderers import RECORDS
+from ..utils import ALL_OUTPUTS
+
+# Popularity tracking would write the shared sketch file
+NO_TRACKING = {'TRACK': False}
+
+
+def assert_close(test, expected, actual, path='body'):
+    """Compare decoded JSON bodies, floats up to rounding"""
+    if isinstance(expected, dict):
+        test.assertIsInstance(actual, dict, path)
+        test.assertEqual(set(expected), set(actual), path)
+        for key in expected:
+            assert_close(test, expected[key], actual[key], f'{path}.{key}')
+    elif isinstance(expected, list):
+        test.assertIsInstance(actual, list, path)
+        test.assertEqual(len(expected), len(actual), path)
+        for position, (a, b) in enumerate(zip(expected, actual)):
+            assert_close(test, a, b, f'{path}[{position}]')
+    elif isinstance(expected, float) and isinstance(actual, (int, float)) and not math.isnan(expected):
+        test.assertLessEqual(abs(expected - actual), 1e-9 * max(1.0, abs(expected)), path)
+    else:
+        test.assertEqual(expected, actual, path)
+
+
+def apply_patch(body, patch):
+    """Client side of a 'patch' delta response"""
+    body = json.loads(json.dumps(body))
+    for name, change in patch['changes'].items():
+        if 'replace' in change:
+            body[name] = change['replace']
+            continue
+
+        def row_key(row):
+            return tuple(row.get(k) for k in change['keys'])
+
+        removed = {tuple(key) for key in change['remove']}
+        rows = [row for row in body[name] if row_key(row) not in removed]
+        positions = {row_key(row): position for position, row in enumerate(rows)}
+        for row in change['upsert']:
+            if row_key(row) in positions:
+                rows[positions[row_key(row)]] = row
+            else:
+                rows.append(row)
+        if 'order' in change:
+            by_key = {row_key(row): row for row in rows}
+            rows = [by_key[tuple(key)] for key in change['order']]
+        body[name] = rows
+    return body
+
+
+# Request filter keys and the columns they select on
+FILTER_COLUMNS = {
+    'brands': 'Brand',
+    'packTypes': 'PackType',
+    'ppgs': 'PPG',
+    'channels': 'Channel',
+    'years': 'Year',
+}
+
+
+@functools.lru_cache(maxsize=None)
+def raw_frame():
+    """The dataset as pandas reads it"""
+    frame = pd.read_csv(settings.DATASET_PATH)
+    frame['date'] = pd.to_datetime(frame['date'], format='%d-%m-%Y', errors='coerce')
+    return frame
+
+
+def select(filters):
+    """Rows of the raw frame matching a filter payload"""
+    frame = raw_frame()
+    mask = np.ones(len(frame), dtype=bool)
+    for key, column in FILTER_COLUMNS.items():
+        if filters.get(key):
+            mask &= frame[column].isin(filters[key]).to_numpy()
+    return frame[mask]
+
+
+def grouped(frame, keys, measures):
+    """Records of the measure sums per key combination, ordered by the keys"""
+    result = frame.groupby(keys)[measures].sum().reset_index().sort_values(keys)
+    return result.to_dict('records')
+
+
+def only(rows, columns):
+    """Rows of a response restricted to some columns"""
+    return [{column: row[column] for column in columns} for row in rows]
+
+
+def post_json(client, path, payload, **headers):
+    return client.post(path, data=json.dumps(payload), content_type='application/json', **headers)
+
+
+def assert_same_state(test, state):
+    """A state built another way serves the same data as the running one"""
+    reference = data_loader.get_state()
+    test.assertEqual(state.version, reference.version)
+    pd.testing.assert_frame_equal(reference.frame, state.frame, check_exact=False)
+    test.assertEqual(state.catalog, reference.catalog)
+    brands = reference.catalog['brands']
+    for filters in ({}, {'brands': brands[:2], 'years': reference.catalog['years'][:1]}):
+        with test.subTest(filters=filters):
+            assert_close(
+                test,
+                json.loads(views.render_data(reference, filters, ALL_OUTPUTS, {}, RECORDS)),
+                json.loads(views.render_data(state, filters, ALL_OUTPUTS, {}, RECORDS)),
+            )
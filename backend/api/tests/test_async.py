@@ -0,0 +1,80 @@
+import asyncio
+import json
+import threading
+from unittest import mock
+from django.test import AsyncRequestFactory, SimpleTestCase, override_settings
+from .. import async_views
+from ..cache import ResponseCache, get_response_cache
+from ..executor import ComputePool, Overloaded
+from .helpers import NO_TRACKING, post_json
+
+
+class ComputePoolTests(SimpleTestCase):
+    def test_cancelled_awaiter_keeps_the_slot_until_the_task_ends(self):
+        pool = ComputePool(workers=1, queue=0, queue_timeout=10)
+        self.addCleanup(pool._executor.shutdown)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        async def scenario():
+            waiter = asyncio.create_task(pool.run(block))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            # The task still occupies the only worker
+            with self.assertRaises(Overloaded):
+                await pool.run(lambda: None)
+            release.set()
+            for _ in range(500):
+                if pool.stats()['running'] == 0 and pool.pending == 0:
+                    break
+                await asyncio.sleep(0.01)
+            return await pool.run(lambda: 'free')
+
+        self.assertEqual(asyncio.run(scenario()), 'free')
+        self.assertEqual(pool.pending, 0)
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class AsyncViewTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.factory = AsyncRequestFactory()
+
+    def post(self, view, payload, **headers):
+        request = self.factory.post('/', data=json.dumps(payload), content_type='application/json', **headers)
+        return asyncio.run(view(request))
+
+    def test_responses_match_the_sync_views(self):
+        payload = {'filters': {'years': [2022]}, 'datasets': ['salesByYear', 'monthlyTrend']}
+        expected = post_json(self.client, '/api/data/', payload)
+        get_response_cache().clear()
+        for _ in range(2):  # computed, then cached
+            response = self.post(async_views.get_filtered_data, payload)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, expected.content)
+            self.assertEqual(response['ETag'], expected['ETag'])
+        facets = {'filters': {'years': [2022]}}
+        self.assertEqual(self.post(async_views.get_filter_options, facets).content,
+                         post_json(self.client, '/api/filters/', facets).content)
+
+    def test_cache_calls_stay_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        threads = []
+        get, put = ResponseCache.get, ResponseCache.set
+
+        def record(method):
+            def wrapper(*args, **kwargs):
+                threads.append(threading.get_ident())
+                return method(*args, **kwargs)
+            return wrapper
+
+        with mock.patch.object(ResponseCache, 'get', record(get)), mock.patch.object(ResponseCache, 'set', record(put)):
+            self.post(async_views.get_filtered_data, {'filters': {'years': [2021]}}, HTTP_ACCEPT_ENCODING='gzip')
+            self.post(async_views.get_filter_options, {'filters': {'years': [2021]}})
+        self.assertGreaterEqual(len(threads), 4)
+        self.assertNotIn(loop_thread, threads)
@@ -0,0 +1,80 @@
+import asyncio
+import json
+from unittest import mock
+from django.test import AsyncRequestFactory, SimpleTestCase, override_settings
+from .. import async_views, views
+from ..cache import get_response_cache
+from .helpers import NO_TRACKING, assert_close, grouped, post_json, select
+
+SCENARIOS = {
+    'datasets': ['salesByYear', 'kpiStats'],
+    'scenarios': [
+        {'id': 'one', 'filters': {'brands': ['Brand 1']}},
+        {'id': 'two', 'filters': {'brands': ['Brand 2']}, 'format': 'columns'},
+        {'filters': {'years': [2022]}, 'datasets': ['salesByBrandYear']},
+        {'id': 'again', 'filters': {'brands': ['Brand 1']}},
+    ],
+}
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class BatchTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+
+    def stream(self, payload):
+        response = post_json(self.client, '/api/data/batch/', payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return list(response.streaming_content)
+
+    def test_scenarios_match_single_requests(self):
+        chunks = self.stream(SCENARIOS)
+        # The opening brace, one chunk per scenario and the closing brace
+        self.assertEqual(len(chunks), len(SCENARIOS['scenarios']) + 2)
+        body = json.loads(b''.join(chunks))
+        self.assertEqual(list(body), ['one', 'two', '2', 'again'])
+        for scenario_id, scenario in zip(body, SCENARIOS['scenarios']):
+            single = post_json(self.client, '/api/data/', dict({'datasets': SCENARIOS['datasets']}, **scenario))
+            self.assertEqual(body[scenario_id], json.loads(single.content), scenario_id)
+        expected = grouped(select({'brands': ['Brand 1']}), ['Year'], ['SalesValue'])
+        assert_close(self, expected, body['one']['salesByYear'])
+        self.assertEqual(list(body['2']), ['salesByBrandYear'])
+
+    def test_repeated_scenarios_are_computed_once(self):
+        render = views.render_data
+        with mock.patch.object(views, 'render_data', side_effect=render) as rendered:
+            self.stream(SCENARIOS)
+        self.assertEqual(rendered.call_count, 3)
+
+    def test_failed_scenario_answers_in_its_slot(self):
+        render = views.render_data
+
+        def fail_for_brand_2(state, filters, *args, **kwargs):
+            if filters.get('brands') == ['Brand 2']:
+                raise ValueError('boom')
+            return render(state, filters, *args, **kwargs)
+
+        with mock.patch.object(views, 'render_data', fail_for_brand_2), self.assertLogs('api.views', 'ERROR'):
+            body = json.loads(b''.join(self.stream(SCENARIOS)))
+        self.assertEqual(body['two'], {'error': 'boom'})
+        self.assertIn('salesByYear', body['one'])
+
+    def test_invalid_batches_are_rejected(self):
+        for payload in ({}, {'scenarios': []}, {'scenarios': [{'id': 1}, {'id': '1'}]},
+                        {'scenarios': [{'datasets': ['nope']}]}, {'scenarios': ['x']}):
+            with self.subTest(payload=payload):
+                self.assertEqual(post_json(self.client, '/api/data/batch/', payload).status_code, 400)
+        with override_settings(BATCH_MAX_SCENARIOS=2):
+            self.assertEqual(post_json(self.client, '/api/data/batch/', SCENARIOS).status_code, 400)
+
+    def test_async_batch_streams_the_same_body(self):
+        expected = b''.join(self.stream(SCENARIOS))
+        get_response_cache().clear()
+        request = AsyncRequestFactory().post('/', data=json.dumps(SCENARIOS), content_type='application/json')
+
+        async def collect():
+            response = await async_views.get_batch_data(request)
+            return [chunk async for chunk in response.streaming_content]
+
+        self.assertEqual(b''.join(asyncio.run(collect())), expected)
@@ -0,0 +1,49 @@
+import json
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from ..cache import get_response_cache
+from ..data_loader import DatasetState, data_loader
+from .helpers import FILTER_COLUMNS, NO_TRACKING, assert_close, post_json, raw_frame, select
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class CatalogTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+
+    def test_options_list_the_selectable_values(self):
+        body = json.loads(self.client.get('/api/filters/').content)
+        frame = raw_frame()
+        self.assertEqual(body['years'], sorted(int(year) for year in frame['Year'].dropna().unique()))
+        expected = sorted(v for v in frame['Brand'].dropna().unique() if not v.startswith('All'))
+        self.assertEqual(body['brands'], expected)
+
+    def test_facets_match_pandas(self):
+        frame = raw_frame()
+        filters = {
+            'brands': sorted(frame['Brand'].dropna().unique())[:2],
+            'channels': sorted(frame['Channel'].dropna().unique())[:2],
+            'years': [2022],
+        }
+        response = post_json(self.client, '/api/filters/', {'filters': filters})
+        self.assertEqual(response.status_code, 200)
+        facets = json.loads(response.content)
+        options = json.loads(self.client.get('/api/filters/').content)
+        for key, column in FILTER_COLUMNS.items():
+            # A dimension's own selection does not narrow its facet
+            others = {k: v for k, v in filters.items() if k != key}
+            reachable = select(others).groupby(column)
+            counts, sales = reachable.size(), reachable['SalesValue'].sum()
+            expected = [
+                {'value': value, 'count': int(counts.get(value, 0)), 'salesValue': float(sales.get(value, 0.0))}
+                for value in options[key]
+            ]
+            assert_close(self, expected, facets[key], key)
+
+    def test_facets_of_an_empty_dataset(self):
+        with mock.patch.object(data_loader, 'get_state', return_value=DatasetState.empty()):
+            options = self.client.get('/api/filters/')
+            facets = post_json(self.client, '/api/filters/', {'filters': {'brands': ['Brand 1']}})
+        self.assertEqual(options.status_code, 200)
+        self.assertEqual(facets.status_code, 200)
+        self.assertEqual(json.loads(facets.content), json.loads(options.content))
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from .. import views
+from ..cache import get_response_cache
+from ..coalesce import LeaderInterrupted, SingleFlight
+from .helpers import NO_TRACKING, post_json
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_computation(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return b'body'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('k', compute)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(flight.do('k', compute)))
+        follower.start()
+        # Let the follower join the leader's future before it finishes
+        while flight.stats()['coalesced'] < 1:
+            threading.Event().wait(0.001)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(results, [b'body', b'body'])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+    def test_failed_leader_settles_followers_and_frees_the_key(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError('boom')
+
+        errors = []
+
+        def call():
+            try:
+                flight.do('k', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        while flight.stats()['coalesced'] < 1:
+            threading.Event().wait(0.001)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(flight.do('k', lambda: b'fresh'), b'fresh')
+
+    def test_interrupted_leader_frees_the_key(self):
+        flight = SingleFlight()
+
+        def interrupt():
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            flight.do('k', interrupt)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+        self.assertEqual(flight.do('k', lambda: b'fresh'), b'fresh')
+
+    def test_cancelled_async_leader_settles_followers_and_frees_the_key(self):
+        flight = SingleFlight()
+
+        async def scenario():
+            running = asyncio.Event()
+
+            async def hang(fn):
+                running.set()
+                await asyncio.Event().wait()
+
+            leader = asyncio.create_task(flight.do_async('k', lambda: b'never', run=hang))
+            await running.wait()
+            follower = asyncio.create_task(flight.do_async('k', lambda: b'never'))
+            await asyncio.sleep(0)
+            # An ASGI client disconnecting cancels the leader's request
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            with self.assertRaises(LeaderInterrupted):
+                await asyncio.wait_for(follower, 5)
+            self.assertEqual(flight.stats()['in_flight'], 0)
+            return await asyncio.wait_for(flight.do_async('k', lambda: b'fresh'), 5)
+
+        self.assertEqual(asyncio.run(scenario()), b'fresh')
+
+    def test_cancelled_async_follower_leaves_the_others_waiting(self):
+        flight = SingleFlight()
+
+        async def scenario():
+            running, release = asyncio.Event(), asyncio.Event()
+
+            async def slow(fn):
+                running.set()
+                await release.wait()
+                return fn()
+
+            leader = asyncio.create_task(flight.do_async('k', lambda: b'body', run=slow))
+            await running.wait()
+            quitter = asyncio.create_task(flight.do_async('k', lambda: b'never'))
+            stayer = asyncio.create_task(flight.do_async('k', lambda: b'never'))
+            await asyncio.sleep(0)
+            quitter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await quitter
+            release.set()
+            return await asyncio.wait_for(asyncio.gather(leader, stayer), 5)
+
+        self.assertEqual(asyncio.run(scenario()), [b'body', b'body'])
+        self.assertEqual(flight.stats()['errors'], 0)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class CoalescedViewTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+
+    def test_identical_concurrent_requests_compute_once(self):
+        render = views.render_data
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow_render(*args, **kwargs):
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return render(*args, **kwargs)
+
+        payload = {'filters': {'years': [2021]}}
+        responses = []
+
+        def post():
+            responses.append(post_json(self.client, '/api/data/', payload))
+
+        coalesced = views.data_flight.stats()['coalesced']
+        with mock.patch.object(views, 'render_data', slow_render):
+            leader = threading.Thread(target=post)
+            leader.start()
+            started.wait(5)
+            follower = threading.Thread(target=post)
+            follower.start()
+            # Release the leader only once the follower waits on it
+            while views.data_flight.stats()['coalesced'] == coalesced:
+                threading.Event().wait(0.001)
+            release.set()
+            leader.join(5)
+            follower.join(5)
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(responses[0].content, responses[1].content)
+        self.assertEqual(len(calls), 1)
@@ -0,0 +1,51 @@
+import json
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+from ..cache import get_response_cache
+from .helpers import NO_TRACKING, post_json, raw_frame, select
+
+KPIS = ['SalesValue', 'Volume', 'ASP']
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class CorrelationTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+
+    def body(self, filters):
+        payload = {'filters': filters, 'datasets': ['kpiCorrelation', 'correlationMatrix']}
+        response = post_json(self.client, '/api/data/', payload)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def assert_pairs(self, expected, actual):
+        self.assertEqual([key for key, _ in expected], [key for key, _ in actual])
+        for (key, a), (_, b) in zip(expected, actual):
+            self.assertAlmostEqual(a, b, places=9, msg=key)
+
+    def expected_matrix(self, frame):
+        whole = raw_frame()
+        columns = [c for c in whole.columns
+                   if c in ('SalesValue', 'Volume', 'VolumeUnits') or c.startswith(('D', 'AV', 'EV'))]
+        columns = [c for c in columns if whole[c].dtype.kind in 'if']
+        columns = [c for c in columns if whole[c].dropna().nunique() > 1]
+        corr = frame[columns].corr()
+        return [((a, b), corr.loc[a, b]) for i, a in enumerate(columns) for b in columns[i + 1:]
+                if np.isfinite(corr.loc[a, b])]
+
+    def expected_kpis(self, frame):
+        monthly = frame.groupby(['Year', 'Month'])[['SalesValue', 'Volume']].sum()
+        monthly['ASP'] = monthly['SalesValue'] / monthly['Volume'].where(monthly['Volume'] != 0)
+        corr = monthly[KPIS].corr()
+        return [((a, b), corr.loc[a, b]) for a in KPIS for b in KPIS if np.isfinite(corr.loc[a, b])]
+
+    def test_correlations_match_pandas(self):
+        frame = raw_frame()
+        for filters in ({}, {'brands': sorted(frame['Brand'].dropna().unique())[:2], 'years': [2022]}):
+            with self.subTest(filters=filters):
+                body = self.body(filters)
+                selected = select(filters)
+                self.assert_pairs(self.expected_matrix(selected),
+                                  [((p['var1'], p['var2']), p['corr']) for p in body['correlationMatrix']])
+                self.assert_pairs(self.expected_kpis(selected),
+                                  [((p['row'], p['col']), p['value']) for p in body['kpiCorrelation']])
@@ -0,0 +1,56 @@
+import json
+from django.test import SimpleTestCase, override_settings
+from ..cache import get_response_cache
+from ..delta import get_delta_store
+from ..utils import ALL_OUTPUTS
+from .helpers import NO_TRACKING, assert_close, grouped, only, post_json, raw_frame, select
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class DefaultBodyTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        get_delta_store().clear()
+
+    def body(self, payload):
+        response = post_json(self.client, '/api/data/', payload)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def assert_matches_pandas(self, filters, body):
+        frame = select(filters)
+        self.assertEqual(set(body['salesByYear'][0]), {'Year', 'SalesValue'})
+        assert_close(self, grouped(frame, ['Year'], ['SalesValue']), body['salesByYear'], 'salesByYear')
+        assert_close(self, grouped(frame, ['Year'], ['Volume']), body['volumeByYear'], 'volumeByYear')
+        for name, column in (('salesByBrandYear', 'Brand'), ('salesByPPGYear', 'PPG')):
+            assert_close(self, grouped(frame, ['Year', column], ['SalesValue']),
+                         only(body[name], ['Year', column, 'SalesValue']), name)
+
+        self.assertEqual(set(body['monthlyTrend'][0]), {'Year', 'Month', 'YearMonth', 'SalesValue', 'Volume', 'date'})
+        assert_close(self, grouped(frame, ['Year', 'Month'], ['SalesValue', 'Volume']),
+                     only(body['monthlyTrend'], ['Year', 'Month', 'SalesValue', 'Volume']), 'monthlyTrend')
+
+        share = frame.groupby('Brand')[['SalesValue', 'Volume']].sum().reset_index()
+        share = share.sort_values('SalesValue', ascending=False).to_dict('records')
+        assert_close(self, share, body['marketShareSales'], 'marketShareSales')
+
+        sales = frame['SalesValue']
+        expected = {'sum': sales.sum(), 'average': sales.mean(), 'min': sales.min(), 'max': sales.max(),
+                    'count': int(sales.count())}
+        assert_close(self, expected, body['kpiStats']['value'], 'kpiStats.value')
+
+    def test_default_body_has_every_dataset(self):
+        body = self.body({})
+        self.assertEqual(list(body), ALL_OUTPUTS)
+        self.assertEqual(set(body['kpiStats']), {'value', 'volume'})
+        self.assertEqual(body['kpiStats']['value']['count'], raw_frame()['SalesValue'].count())
+        self.assert_matches_pandas({}, body)
+
+    def test_filtered_body_matches_pandas(self):
+        frame = raw_frame()
+        filters = {
+            'brands': sorted(frame['Brand'].dropna().unique())[:3],
+            'channels': sorted(frame['Channel'].dropna().unique())[:2],
+            'years': [2021, 2022],
+        }
+        self.assert_matches_pandas(filters, self.body({'filters': filters}))
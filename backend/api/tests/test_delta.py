@@ -0,0 +1,85 @@
+import json
+from django.test import SimpleTestCase, override_settings
+from ..cache import get_response_cache
+from ..delta import get_delta_store
+from .helpers import NO_TRACKING, apply_patch, assert_close, grouped, post_json, raw_frame, select
+
+DATASETS = ['salesByYear', 'salesByBrandYear', 'monthlyTrend', 'marketShareSales', 'kpiStats']
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class DeltaTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        get_delta_store().clear()
+        frame = raw_frame()
+        brands = sorted(frame['Brand'].dropna().unique())
+        self.steps = [
+            {'brands': brands[:1]},
+            {'brands': brands[:2]},
+            {'brands': brands[:2], 'years': [2021]},
+            {'brands': brands[1:2], 'years': [2021]},
+        ]
+
+    def post(self, payload, **headers):
+        return post_json(self.client, '/api/data/', dict(payload, datasets=DATASETS), **headers)
+
+    def expected(self, filters):
+        frame = select(filters)
+        monthly = frame.groupby(['Year', 'Month'])[['SalesValue', 'Volume']].sum().reset_index()
+        share = frame.groupby('Brand')[['SalesValue', 'Volume']].sum().reset_index()
+        sales, volume = frame['SalesValue'], frame['Volume']
+        return {
+            'salesByYear': grouped(frame, ['Year'], ['SalesValue']),
+            'salesByBrandYear': grouped(frame, ['Year', 'Brand'], ['SalesValue']),
+            'monthlyTrend': monthly.to_dict('records'),
+            'marketShareSales': share.sort_values('SalesValue', ascending=False).to_dict('records'),
+            'kpiStats': {
+                name: {'sum': column.sum(), 'average': column.mean(), 'min': column.min(), 'max': column.max(),
+                       'count': int(column.count())}
+                for name, column in (('value', sales), ('volume', volume))
+            },
+        }
+
+    def received(self, body):
+        body = dict(body)
+        body['monthlyTrend'] = [{k: v for k, v in row.items() if k not in ('YearMonth', 'date')}
+                                for row in body['monthlyTrend']]
+        return body
+
+    def test_delta_matches_pandas(self):
+        for mode in ('full', 'patch'):
+            get_response_cache().clear()
+            get_delta_store().clear()
+            etag = body = None
+            for filters in self.steps:
+                delta = {'mode': mode, 'base': etag} if etag else {'mode': mode}
+                response = self.post({'filters': filters, 'delta': delta})
+                self.assertEqual(response.status_code, 200)
+                received = json.loads(response.content)
+                if 'changes' in received:
+                    etag = received['delta']['etag']
+                    received = apply_patch(body, received)
+                else:
+                    etag = response['ETag']
+                with self.subTest(mode=mode, filters=filters, delta=response['X-Delta']):
+                    assert_close(self, self.expected(filters), self.received(received))
+                body = received
+            self.assertIn('incremental', response['X-Delta'])
+
+    def test_incremental_bodies_are_kept_apart_from_full_ones(self):
+        etag = None
+        for filters in self.steps[:2]:
+            response = self.post({'filters': filters, 'delta': {'base': etag} if etag else True})
+            etag = response['ETag']
+        self.assertEqual(response['X-Delta'], 'incremental')
+        # Only weakly equivalent to the full computation
+        self.assertTrue(etag.startswith('W/'))
+
+        plain = self.post({'filters': self.steps[1]})
+        self.assertFalse(plain['ETag'].startswith('W/'))
+        self.assertEqual(plain['ETag'], etag[2:])
+        get_response_cache().clear()
+        self.assertEqual(self.post({'filters': self.steps[1]}).content, plain.content)
+        # A client holding the incremental body revalidates it
+        self.assertEqual(self.post({'filters': self.steps[1]}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
@@ -0,0 +1,53 @@
+import numpy as np
+from django.test import SimpleTestCase
+from ..filter_index import FilterIndex, pack_mask, unpack_mask
+from .helpers import raw_frame, select
+
+
+class FilterIndexTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.frame = raw_frame()
+        cls.index = FilterIndex.build(cls.frame)
+
+    def test_bitsets_round_trip(self):
+        for length in (0, 1, 63, 64, 65, 130):
+            mask = np.arange(length) % 3 == 0
+            np.testing.assert_array_equal(unpack_mask(pack_mask(mask), length), mask)
+
+    def test_value_bitsets_match_isin(self):
+        for column in ('Brand', 'Channel', 'Year'):
+            for value, bitset in self.index.bitsets[column].items():
+                expected = (self.frame[column] == value).to_numpy()
+                np.testing.assert_array_equal(unpack_mask(bitset, len(self.frame)), expected, f'{column}={value}')
+
+    def test_rows_match_isin(self):
+        brands = sorted(self.frame['Brand'].dropna().unique())[:2]
+        channels = sorted(self.frame['Channel'].dropna().unique())[:1]
+        cases = [
+            {'brands': brands},
+            {'brands': brands, 'channels': channels},
+            {'brands': brands, 'years': [2021, 2022]},
+            {'brands': ['NoSuchBrand']},
+        ]
+        for filters in cases:
+            expected = np.flatnonzero(self.frame.index.isin(select(filters).index))
+            np.testing.assert_array_equal(self.index.rows(filters), expected, filters)
+
+    def test_numeric_values_are_coerced(self):
+        expected = self.index.rows({'years': [2022]})
+        self.assertGreater(len(expected), 0)
+        for value in ('2022', 2022.0, '2022.0'):
+            np.testing.assert_array_equal(self.index.rows({'years': [value]}), expected, value)
+
+    def test_no_active_filter_selects_everything(self):
+        self.assertIsNone(self.index.rows({}))
+        self.assertIsNone(self.index.rows({'brands': [], 'years': []}))
+
+    def test_excluded_dimension_is_left_out(self):
+        brands = sorted(self.frame['Brand'].dropna().unique())[:1]
+        filters = {'brands': brands, 'years': [2022]}
+        bitset = self.index.bitset(filters, exclude='Brand')
+        expected = (self.frame['Year'] == 2022).to_numpy()
+        np.testing.assert_array_equal(unpack_mask(bitset, len(self.frame)), expected)
@@ -0,0 +1,29 @@
+import json
+from django.test import SimpleTestCase, override_settings
+from ..cache import canonical_filters, get_response_cache
+from .helpers import NO_TRACKING, post_json
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class FilterPayloadTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+
+    def test_equivalent_selections_compare_equal(self):
+        self.assertEqual(canonical_filters({'brands': ['B', 'A', 'B'], 'years': ['2022', 2021.0, 2022]}),
+                         {'brands': ['A', 'B'], 'years': [2021, 2022]})
+        self.assertEqual(canonical_filters({'brands': [], 'ppgs': None}), {})
+
+    def test_fractional_years_are_not_truncated(self):
+        self.assertEqual(canonical_filters({'years': [2021.5, '2021.5', 2021]}),
+                         {'years': [2021, 2021.5, '2021.5']})
+        response = post_json(self.client, '/api/data/', {'filters': {'years': [2021.5]}, 'datasets': ['salesByYear']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['salesByYear'], [])
+
+    def test_malformed_filters_are_rejected(self):
+        for filters in ({'brands': [['Brand 1']]}, {'brands': 'Brand 1'}, {'years': [{'y': 2021}]},
+                        {'channels': [True]}, ['brands']):
+            with self.subTest(filters=filters):
+                self.assertEqual(post_json(self.client, '/api/data/', {'filters': filters}).status_code, 400)
+                self.assertEqual(post_json(self.client, '/api/filters/', {'filters': filters}).status_code, 400)
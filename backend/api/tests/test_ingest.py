@@ -0,0 +1,28 @@
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+from ..data_loader import DataLoader
+from ..ingest import IndexBuilder
+from .helpers import assert_same_state, raw_frame, select
+
+
+class ChunkedIngestTests(SimpleTestCase):
+    def test_folded_index_matches_pandas(self):
+        frame = raw_frame()
+        builder = IndexBuilder()
+        for start in range(0, len(frame), 1024):
+            builder.add(frame.iloc[start:start + 1024])
+        index = builder.finish(numeric=['Year'])
+        filters = {'brands': sorted(frame['Brand'].dropna().unique())[:2], 'years': [2022]}
+        expected = np.flatnonzero(frame.index.isin(select(filters).index))
+        np.testing.assert_array_equal(index.rows(filters), expected)
+
+    def test_chunks_must_be_word_aligned(self):
+        builder = IndexBuilder()
+        builder.add(raw_frame().iloc[:100])
+        with self.assertRaises(ValueError):
+            builder.add(raw_frame().iloc[100:200])
+
+    @override_settings(DATASET_CHUNKED_INGEST=True, DATASET_MEMORY_BUDGET=2 * 1024 * 1024,
+                       DATASET_SNAPSHOT_ENABLED=False)
+    def test_chunked_load_matches(self):
+        assert_same_state(self, DataLoader()._build_state())
@@ -0,0 +1,59 @@
+import json
+from django.test import SimpleTestCase, override_settings
+from ..cache import get_response_cache
+from .helpers import NO_TRACKING, assert_close, only, post_json, raw_frame
+
+OTHER = 'Other'
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class TopNTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+
+    def body(self, payload):
+        response = post_json(self.client, '/api/data/', payload)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    @staticmethod
+    def folded(keys, member, limit):
+        """Rows with members outside the top `limit` by SalesValue relabelled OTHER"""
+        frame = raw_frame().dropna(subset=keys).copy()
+        totals = frame.groupby(member)['SalesValue'].sum()
+        top = set(totals.nlargest(limit).index)
+        outside = [key not in top for key in frame.set_index(member).index]
+        for column in member:
+            frame.loc[outside, column] = OTHER
+        return frame, len(totals)
+
+    def test_monthly_brands_beyond_the_top_n_are_summed_into_other(self):
+        keys = ['Year', 'Month', 'Brand']
+        frame, members = self.folded(keys, ['Brand'], 2)
+        expected = frame.groupby(keys)[['SalesValue', 'Volume']].sum().reset_index()
+        expected['last'] = expected['Brand'] == OTHER
+        expected = expected.sort_values(['Year', 'Month', 'last', 'Brand'])[keys + ['SalesValue', 'Volume']]
+
+        body = self.body({'datasets': ['monthlyBrandSales'], 'limit': 2})
+        self.assertEqual(body['meta']['limits']['monthlyBrandSales']['members'], members)
+        self.assertEqual(body['meta']['limits']['monthlyBrandSales']['kept'], 2)
+        rows = body['monthlyBrandSales']
+        self.assertEqual(len({row['Brand'] for row in rows}), 3)
+        assert_close(self, expected.to_dict('records'), only(rows, keys + ['SalesValue', 'Volume']))
+
+    def test_combos_fold_into_one_other_row_last(self):
+        keys = ['Brand', 'PackType', 'PPG']
+        frame, _ = self.folded(keys, keys, 5)
+        expected = frame.groupby(keys)[['SalesValue', 'Volume']].sum().reset_index()
+        expected['last'] = expected['Brand'] == OTHER
+        expected = expected.sort_values(['last'] + keys)[keys + ['SalesValue', 'Volume']].to_dict('records')
+
+        rows = self.body({'datasets': ['marketShareCombo'], 'limit': {'marketShareCombo': 5}})['marketShareCombo']
+        assert_close(self, expected, only(rows, keys + ['SalesValue', 'Volume']))
+        [other] = [row for row in rows if row['Combo'] == OTHER]
+        self.assertEqual(other['Brand'], OTHER)
+
+    def test_small_groupings_are_not_folded(self):
+        body = self.body({'datasets': ['marketShareCombo', 'salesByYear'], 'limit': 1000})
+        self.assertEqual(list(body['meta']['limits']), ['marketShareCombo'])
+        self.assertNotIn(OTHER, [row['Combo'] for row in body['marketShareCombo']])
@@ -0,0 +1,70 @@
+import re
+from django.test import SimpleTestCase, override_settings
+from ..cache import get_response_cache
+from ..metrics import CONTENT_TYPE, Histogram
+from .helpers import NO_TRACKING, post_json
+
+SAMPLE = re.compile(r'^([a-z_]+)(\{[^}]*\})? (\S+)$')
+
+
+def samples(text):
+    """{(name, labels): value} of a Prometheus text export"""
+    result = {}
+    for line in text.splitlines():
+        if line.startswith('#') or not line:
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        result[(match.group(1), match.group(2) or '')] = float(match.group(3))
+    return result
+
+
+class HistogramTests(SimpleTestCase):
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram('eda_test_seconds', 'Test', (0.1, 1.0), ('view',))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, 'data')
+        lines = []
+        histogram.render(lines)
+        exported = samples('\n'.join(lines))
+        self.assertEqual(exported[('eda_test_seconds_bucket', '{view="data",le="0.1"}')], 2)
+        self.assertEqual(exported[('eda_test_seconds_bucket', '{view="data",le="1.0"}')], 3)
+        self.assertEqual(exported[('eda_test_seconds_bucket', '{view="data",le="+Inf"}')], 4)
+        self.assertEqual(exported[('eda_test_seconds_count', '{view="data"}')], 4)
+        self.assertAlmostEqual(exported[('eda_test_seconds_sum', '{view="data"}')], 2.65)
+        self.assertIn('# TYPE eda_test_seconds histogram', lines)
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class MetricsEndpointTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+
+    def scrape(self):
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], CONTENT_TYPE)
+        return samples(response.content.decode('utf-8'))
+
+    def test_requests_and_stages_are_exported(self):
+        series = ('eda_request_duration_seconds_count', '{view="filtered_data",status="200"}')
+        before = self.scrape().get(series, 0)
+        post_json(self.client, '/api/data/', {'filters': {'years': [2022]}})
+        after = self.scrape()
+        self.assertEqual(after[series], before + 1)
+        for name in ('select', 'aggregate', 'encode'):
+            self.assertGreater(after[('eda_stage_duration_seconds_count', f'{{stage="{name}"}}')], 0)
+        self.assertGreater(after[('eda_dataset_rows', '')], 0)
+        self.assertIn(('eda_response_cache_misses_total', ''), after)
+
+    def test_server_timing_header(self):
+        payload = {'filters': {'years': [2021]}}
+        self.assertFalse(post_json(self.client, '/api/data/', payload).has_header('Server-Timing'))
+        get_response_cache().clear()
+        with override_settings(METRICS={'ENABLED': True, 'SERVER_TIMING': True}):
+            response = post_json(self.client, '/api/data/', payload)
+        entries = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        for name in ('select', 'aggregate', 'encode', 'total'):
+            self.assertIn(name, entries)
+        self.assertEqual(len(entries), len(set(entries)))
+        self.assertRegex(response['Server-Timing'], r'select;dur=[0-9.]+;desc="\d+ rows"')
@@ -0,0 +1,63 @@
+import json
+from django.test import SimpleTestCase, override_settings
+from ..cache import get_response_cache
+from .helpers import NO_TRACKING, assert_close, only, post_json, raw_frame, select
+
+MEASURES = ['SalesValue', 'Volume']
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class TimeGrainTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+
+    def post(self, payload):
+        return post_json(self.client, '/api/data/', payload)
+
+    @staticmethod
+    def periods(frame, grain):
+        """Frame with the period key columns of a grain, and those keys"""
+        if grain == 'week':
+            iso = frame['date'].dt.isocalendar()
+            return frame.assign(Year=iso['year'], Week=iso['week']).dropna(subset=['Week']), ['Year', 'Week']
+        if grain == 'quarter':
+            return frame.assign(Quarter=(frame['Month'] - 1) // 3 + 1), ['Year', 'Quarter']
+        return frame, ['Year']
+
+    def test_trends_match_pandas_at_every_grain(self):
+        filters = {'brands': sorted(raw_frame()['Brand'].dropna().unique())[:3]}
+        for grain in ('week', 'quarter', 'year'):
+            with self.subTest(grain=grain):
+                payload = {'filters': filters, 'datasets': ['monthlyTrend', 'monthlyBrandSales'], 'grain': grain}
+                body = json.loads(self.post(payload).content)
+                self.assertEqual(body['meta']['grain'], grain)
+                frame, keys = self.periods(select(filters), grain)
+                for name, split in (('monthlyTrend', []), ('monthlyBrandSales', ['Brand'])):
+                    expected = frame.groupby(keys + split)[MEASURES].sum().reset_index()
+                    expected = expected.sort_values(keys + split).to_dict('records')
+                    assert_close(self, expected, only(body[name], keys + split + MEASURES), name)
+
+    def test_kpi_correlation_is_monthly_at_every_grain(self):
+        monthly = json.loads(self.post({'datasets': ['kpiCorrelation']}).content)
+        for grain in ('week', 'quarter', 'year'):
+            with self.subTest(grain=grain):
+                body = json.loads(self.post({'datasets': ['kpiCorrelation', 'monthlyTrend'], 'grain': grain}).content)
+                self.assertEqual(body['meta']['grain'], grain)
+                assert_close(self, monthly['kpiCorrelation'], body['kpiCorrelation'])
+
+    def test_fields_of_an_adaptive_grain(self):
+        payload = {'datasets': ['monthlyTrend'], 'grain': 'auto', 'maxPoints': 4,
+                   'fields': {'monthlyTrend': ['YearWeek', 'YearQuarter', 'SalesValue']}}
+        body = json.loads(self.post(payload).content)
+        self.assertEqual(body['meta']['grain'], 'year')
+        self.assertEqual(set(body['monthlyTrend'][0]), {'SalesValue'})
+
+    def test_auto_grain_is_the_finest_that_fits(self):
+        frame = raw_frame()
+        months = frame.groupby(['Year', 'Month']).ngroups
+        quarters = self.periods(frame, 'quarter')[0].groupby(['Year', 'Quarter']).ngroups
+        for max_points, grain in ((months, 'month'), (months - 1, 'quarter'), (quarters - 1, 'year')):
+            with self.subTest(max_points=max_points):
+                body = json.loads(self.post({'datasets': ['monthlyTrend'], 'grain': 'auto',
+                                             'maxPoints': max_points}).content)
+                self.assertEqual(body['meta']['grain'], grain)
@@ -0,0 +1,55 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from django.test import AsyncClient, SimpleTestCase, override_settings
+from .. import profiling
+from ..cache import get_response_cache
+from .helpers import NO_TRACKING, post_json
+
+
+class ProfilingTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='eda-profiles-test-')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        get_response_cache().clear()
+        self.config = {'ENABLED': True, 'THRESHOLD': 0, 'INTERVAL': 0.001, 'PATH': self.root}
+
+    def captures(self):
+        profiling.wait_for_writes(5)
+        return [profiling.read_capture(self.root, c) for c in profiling.list_captures(self.root)]
+
+    def test_fan_out_threads_are_sampled(self):
+        fan_out = {'MODE': 'threads', 'WORKERS': 2, 'MIN_CELLS': 0}
+        with override_settings(PROFILING=self.config, DATA_PARALLELISM=fan_out, WARMUP=NO_TRACKING):
+            post_json(self.client, '/api/data/', {})
+        [capture] = self.captures()
+        self.assertIn('version', capture)
+        self.assertGreater(capture['samples'], 0)
+        self.assertGreater(capture['threads'], 1)
+
+    def test_requests_served_through_asgi_are_sampled(self):
+        with override_settings(PROFILING=self.config, WARMUP=NO_TRACKING):
+            response = asyncio.run(AsyncClient().post('/api/data/', data='{}', content_type='application/json'))
+        self.assertEqual(response.status_code, 200)
+        [capture] = self.captures()
+        self.assertEqual(capture['trigger'], 'threshold')
+        self.assertGreater(capture['samples'], 0)
+
+    def test_captures_are_written_off_the_request_thread(self):
+        writers = []
+        write = profiling.write_capture
+
+        def record_thread(*args, **kwargs):
+            writers.append(threading.current_thread().name)
+            return write(*args, **kwargs)
+
+        with override_settings(PROFILING=dict(self.config, SAMPLE_RATE=1.0), WARMUP=NO_TRACKING), \
+                mock.patch.object(profiling, 'write_capture', record_thread):
+            post_json(self.client, '/api/data/', {'datasets': ['kpiStats']})
+        [capture] = self.captures()
+        self.assertEqual(capture['trigger'], 'sample')
+        self.assertTrue(capture['functions'])
+        self.assertEqual(len(writers), 1)
+        self.assertTrue(writers[0].startswith('eda-profile-writer'))
@@ -0,0 +1,52 @@
+import json
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from .. import views
+from ..cache import get_response_cache
+from .helpers import NO_TRACKING, assert_close, grouped, post_json, raw_frame
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class ProjectionTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+
+    def post(self, payload):
+        return post_json(self.client, '/api/data/', payload)
+
+    def test_projection_and_columns_format(self):
+        response = self.post({'datasets': ['salesByYear', 'kpiStats'], 'fields': {'salesByYear': ['SalesValue']},
+                              'format': 'columns'})
+        body = json.loads(response.content)
+        self.assertEqual(list(body), ['salesByYear', 'kpiStats'])
+        self.assertEqual(list(body['salesByYear']), ['SalesValue'])
+        expected = [row['SalesValue'] for row in grouped(raw_frame(), ['Year'], ['SalesValue'])]
+        assert_close(self, expected, body['salesByYear']['SalesValue'])
+
+    def test_invalid_requests_are_rejected(self):
+        for payload in (
+            {'datasets': ['noSuchDataset']},
+            {'fields': {'salesByYear': ['noSuchColumn']}},
+            {'fields': {'kpiStats': ['value']}},
+            {'format': 'xml'},
+            {'limit': 0},
+            {'limit': {'salesByYear': 5}},
+            {'grain': 'fortnight'},
+            {'grain': 'week', 'maxPoints': 0},
+            {'delta': {'mode': 'sideways'}},
+            {'datasets': 'salesByYear'},
+            {'fields': {'salesByYear': 'SalesValue'}},
+            {'grain': 'quarter', 'fields': {'monthlyTrend': ['YearMonth']}},
+            [],
+            'salesByYear',
+        ):
+            with self.subTest(payload=payload):
+                response = self.post(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', json.loads(response.content))
+
+    def test_computation_errors_are_server_errors(self):
+        with mock.patch.object(views, 'render_data', side_effect=ValueError('internal')):
+            with self.assertLogs('api.views', 'ERROR'):
+                response = self.post({'filters': {'years': [2021]}})
+        self.assertEqual(response.status_code, 500)
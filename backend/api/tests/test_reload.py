@@ -0,0 +1,47 @@
+import os
+from unittest import mock
+from django.test import SimpleTestCase
+from ..apps import _serves_requests
+from ..data_loader import data_loader
+
+
+class ReloadTests(SimpleTestCase):
+    def test_unchanged_source_keeps_the_current_state(self):
+        current = data_loader.get_state()
+        self.assertIs(data_loader.reload(), current)
+        self.assertIs(data_loader.get_state(), current)
+
+    def test_failed_reload_keeps_serving(self):
+        current = data_loader.get_state()
+        with mock.patch.object(data_loader, '_build_state', side_effect=OSError('unreadable')):
+            with self.assertRaises(OSError):
+                data_loader.reload()
+        self.assertIs(data_loader.get_state(), current)
+
+    def test_changed_source_is_swapped_in(self):
+        current = data_loader.get_state()
+        rebuilt = data_loader._build_state()
+        rebuilt.version = 'next'
+        self.addCleanup(data_loader._swap, current)
+        with mock.patch.object(data_loader, '_build_state', return_value=rebuilt):
+            self.assertIs(data_loader.reload(), rebuilt)
+        self.assertIs(data_loader.get_state(), rebuilt)
+        self.assertGreater(rebuilt.generation, current.generation)
+
+
+class StartupTests(SimpleTestCase):
+    def test_only_serving_processes_install_startup_hooks(self):
+        cases = [
+            (['manage.py', 'migrate'], {}, False),
+            (['manage.py', 'build_snapshot'], {}, False),
+            (['manage.py', 'runserver'], {}, False),
+            (['manage.py', 'runserver'], {'RUN_MAIN': 'true'}, True),
+            (['manage.py', 'runserver', '--noreload'], {}, True),
+            (['/usr/bin/gunicorn', 'eda_project.wsgi'], {}, True),
+        ]
+        for argv, environ, expected in cases:
+            with self.subTest(argv=argv, environ=environ), mock.patch('sys.argv', argv), \
+                    mock.patch.dict('os.environ', environ):
+                if 'RUN_MAIN' not in environ:
+                    os.environ.pop('RUN_MAIN', None)
+                self.assertIs(_serves_requests(), expected)
@@ -0,0 +1,48 @@
+import gzip
+import json
+from django.test import SimpleTestCase, override_settings
+from ..cache import get_response_cache
+from .helpers import NO_TRACKING, post_json, raw_frame
+
+
+@override_settings(WARMUP=NO_TRACKING)
+class ConditionalResponseTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.brands = sorted(raw_frame()['Brand'].dropna().unique())
+
+    def post(self, payload, **headers):
+        return post_json(self.client, '/api/data/', payload, **headers)
+
+    def test_etag_revalidation(self):
+        payload = {'filters': {'brands': self.brands[:2]}}
+        response = self.post(payload)
+        etag = response['ETag']
+        self.assertEqual(self.post(payload, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Key order and duplicate filter values do not change the request key
+        same = {'filters': {'brands': self.brands[1::-1] + self.brands[:1]}}
+        self.assertEqual(self.post(same, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        other = self.post({'filters': {'brands': self.brands[:1]}}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other['ETag'], etag)
+
+    def test_compressed_variants_share_the_digest(self):
+        payload = {'filters': {'brands': self.brands[:2]}}
+        plain = self.post(payload)
+        compressed = self.post(payload, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(compressed['ETag'], plain['ETag'][:-1] + '-gzip"')
+        self.assertEqual(json.loads(gzip.decompress(compressed.content)), json.loads(plain.content))
+        # Either representation's tag revalidates either encoding
+        for etag in (plain['ETag'], compressed['ETag'], 'W/' + compressed['ETag']):
+            for encoding in ('', 'gzip'):
+                with self.subTest(etag=etag, encoding=encoding):
+                    response = self.post(payload, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING=encoding)
+                    self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.post(payload, HTTP_IF_NONE_MATCH='"deadbeef-gzip"').status_code, 200)
+
+    def test_small_bodies_are_not_compressed(self):
+        response = self.post({'datasets': ['kpiStats']}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertNotIn('-gzip', response['ETag'])
@@ -0,0 +1,17 @@
+import pandas as pd
+from django.test import SimpleTestCase
+from ..schema import optimize_frame
+
+
+class SchemaTests(SimpleTestCase):
+    def test_floats_are_narrowed_only_when_lossless(self):
+        frame = pd.DataFrame({
+            'SalesValue': [0.5, 1.5, 2.5],
+            'D1': [0.5, 0.25, float('nan')],
+            'D2': [0.1, 0.2, 0.3],
+            'Other': [0.5, 1.25, 2.0],
+        })
+        optimized, stats = optimize_frame(frame)
+        self.assertEqual(stats['dtypes'], {'SalesValue': 'float64', 'D1': 'float32', 'D2': 'float64',
+                                           'Other': 'float32'})
+        pd.testing.assert_frame_equal(optimized.astype('float64'), frame)
@@ -0,0 +1,27 @@
+import shutil
+import tempfile
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+from ..data_loader import DataLoader
+from ..filter_index import FilterIndex
+from ..shared import decode_index, encode_index
+from .helpers import assert_same_state, raw_frame
+
+
+class SharedLoadTests(SimpleTestCase):
+    def test_index_round_trips_through_arrays(self):
+        index = FilterIndex.build(raw_frame())
+        arrays, meta = encode_index(index, 'idx')
+        decoded = decode_index(arrays, meta)
+        self.assertEqual(decoded.numeric, index.numeric)
+        filters = {'years': ['2022'], 'channels': sorted(raw_frame()['Channel'].dropna().unique())[:1]}
+        np.testing.assert_array_equal(decoded.rows(filters), index.rows(filters))
+        np.testing.assert_array_equal(decoded.codes['Brand'], index.codes['Brand'])
+
+    def test_shared_load_matches(self):
+        root = tempfile.mkdtemp(prefix='eda-shared-test-')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        with override_settings(DATASET_SHARED={'ENABLED': True, 'PATH': root, 'KEEP': 2, 'AUTOPUBLISH': True}):
+            state = DataLoader()._build_state()
+        self.assertIsNotNone(state.segment)
+        assert_same_state(self, state)
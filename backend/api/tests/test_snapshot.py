@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from django.test import SimpleTestCase
+from .. import snapshot
+
+
+class BundleTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix='eda-bundle-test-')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.path = os.path.join(root, 'bundle')
+        snapshot.write_bundle(self.path, {'values': np.arange(4)}, {'label': 'first'})
+
+    def test_rewrite_replaces_the_previous_generation(self):
+        snapshot.write_bundle(self.path, {'values': np.arange(6.0)}, {'label': 'second'})
+        arrays, manifest = snapshot.read_bundle(self.path)
+        self.assertEqual(manifest['label'], 'second')
+        np.testing.assert_array_equal(arrays['values'], np.arange(6.0))
+        self.assertEqual(len([name for name in os.listdir(self.path) if name.endswith('.npy')]), 1)
+
+    def test_interrupted_write_keeps_the_previous_bundle(self):
+        writer = snapshot.BundleWriter(self.path)
+        writer.save('values', np.arange(10))
+        # Crash before commit: the manifest still names the first generation
+        arrays, manifest = snapshot.read_bundle(self.path)
+        self.assertEqual(manifest['label'], 'first')
+        np.testing.assert_array_equal(arrays['values'], np.arange(4))
+        writer.abort()
+        self.assertEqual(len([name for name in os.listdir(self.path) if name.endswith('.npy')]), 1)
+
+    def test_array_not_matching_the_manifest_is_rejected(self):
+        manifest = snapshot.read_manifest(self.path)
+        np.save(os.path.join(self.path, f"values.{manifest['generation']}.npy"), np.arange(3))
+        with self.assertRaises(ValueError):
+            snapshot.read_bundle(self.path)
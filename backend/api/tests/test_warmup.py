@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import time
+from django.test import SimpleTestCase, override_settings
+from .. import popularity, views, warmup
+from ..cache import get_response_cache
+from ..data_loader import data_loader
+from .helpers import post_json
+
+
+def request_key(payload):
+    return views.parse_data_request(payload)[-1]
+
+
+class PopularityTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix='eda-popularity-test-')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.path = os.path.join(root, 'sketch.json')
+
+    def test_workers_merge_their_counts_into_the_file(self):
+        first, second = (popularity.PopularitySketch(self.path, 60) for _ in range(2))
+        for key, times in (('a', 3), ('b', 1)):
+            for _ in range(times):
+                first.record(key)
+        for key, times in (('b', 5), ('c', 2)):
+            for _ in range(times):
+                second.record(key)
+        # Recording never writes in the request thread
+        self.assertFalse(os.path.exists(self.path))
+        first.flush()
+        second.flush()
+        self.assertEqual(popularity.top_keys(self.path, 3), ['b', 'a', 'c'])
+        _, keys, total = popularity.read_sketch(self.path)
+        self.assertEqual(total, 11)
+        self.assertEqual(keys['b'], 6)
+
+    def test_counts_are_flushed_in_the_background(self):
+        sketch = popularity.PopularitySketch(self.path, 0.01)
+        sketch.start()
+        self.addCleanup(sketch.stop)
+        sketch.record('a')
+        for _ in range(500):
+            if os.path.exists(self.path):
+                break
+            time.sleep(0.01)
+        self.assertEqual(popularity.top_keys(self.path, 1), ['a'])
+
+    def test_tracking_is_off_by_default(self):
+        with override_settings(WARMUP={'SKETCH_PATH': self.path}):
+            self.assertIsNone(popularity.get_sketch())
+            post_json(self.client, '/api/data/', {'datasets': ['kpiStats']})
+        self.assertFalse(os.path.exists(self.path))
+
+
+class WarmupTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix='eda-warmup-test-')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.path = os.path.join(root, 'sketch.json')
+        get_response_cache().clear()
+        self.addCleanup(warmup._update, **warmup.status())
+
+    def test_popular_responses_are_primed(self):
+        popular = [request_key({'filters': {'years': [2022]}}), request_key({'datasets': ['kpiStats']})]
+        sketch = popularity.PopularitySketch(self.path, 60)
+        for key in popular + popular[:1] + ['{"stale": true}']:
+            sketch.record(key)
+        sketch.flush()
+
+        with override_settings(WARMUP={'SKETCH_PATH': self.path, 'TOP_K': 3}), \
+                self.assertLogs('api.warmup', 'WARNING'):
+            result = warmup.warm_up()
+        self.assertEqual(result['keys'], 4)
+        self.assertEqual((result['primed'], result['failed']), (3, 1))
+        self.assertEqual(warmup.status()['state'], warmup.READY)
+        cache, version = get_response_cache(), data_loader.get_state().version
+        for key in popular + [request_key({})]:
+            self.assertIsNotNone(cache.get(key, version, track=False), key)
+
+    def test_health_answers_503_while_warming(self):
+        warmup._update(state=warmup.WARMING)
+        response = self.client.get('/api/health/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'warming')
+        warmup._update(state=warmup.READY)
+        self.assertEqual(self.client.get('/api/health/').status_code, 200)
@@ -1,12 +1,21 @@
 """
 URL configuration for the API app.
 """
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    from . import async_views as handlers
+else:
+    handlers = views
+
 urlpatterns = [
-    path('health/', views.health_check, name='health_check'),
-    path('filters/', views.get_filter_options, name='filter_options'),
-    path('data/', views.get_filtered_data, name='filtered_data'),
+    path('health/', handlers.health_check, name='health_check'),
+    path('filters/', handlers.get_filter_options, name='filter_options'),
+    path('data/', handlers.get_filtered_data, name='filtered_data'),
+    path('data/batch/', handlers.get_batch_data, name='batch_data'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('admin/reload/', views.reload_dataset, name='reload_dataset'),
 ]
 
@@ -3,86 +3,471 @@ Utility functions for data processing and aggregation
 """
 import pandas as pd
 import numpy as np
+from django.conf import settings
+from .correlation import column_matrix, correlation_columns, correlation_matrix, sufficient_stats, upper_pairs
+from .cube import CUBE_DIMENSIONS, DATE_POSITION
+from .filter_index import active_filters
+from .metrics import stage
 
 
-def clean_data(data):
-    """Replace NaN and infinity values with None for JSON serialization"""
-    return data.replace([np.inf, -np.inf], np.nan).where(pd.notna(data), None)
-
-
-def apply_filters(df, filters):
+def apply_filters(df, filters, index=None):
     """
     Apply user-selected filters to the dataframe
     
     Args:
         df: pandas DataFrame
         filters: dict with filter keys (brands, packTypes, ppgs, channels, years)
+        index: FilterIndex built for df - when given, rows are selected from
+            the precomputed bitsets instead of scanning each column
     
     Returns:
-        Filtered DataFrame
+        Filtered DataFrame (df itself when no filter is active; treat as read-only)
+    """
+    if index is not None:
+        rows = index.rows(filters)
+        return df if rows is None else df.take(rows)
+
+    mask = None
+    for column, values in active_filters(filters):
+        column_mask = df[column].isin(values).to_numpy()
+        mask = column_mask if mask is None else mask & column_mask
+
+    return df if mask is None else df[mask]
+
+
+# Every chart dataset is a sum of measures over some grouping of the cube
+# dimensions. 'label' adds a derived text column, 'order' re-sorts the result.
+# 'member' marks the keys whose combinations can be capped to the top N by
+# SalesValue, the rest being folded into an OTHER_LABEL member.
+COMBO_KEYS = ['Brand', 'PackType', 'PPG']
+OTHER_LABEL = 'Other'
+# Measure members are ranked by when a dataset is capped
+RANK_MEASURE = 'SalesValue'
+
+DATASET_SPECS = {
+    'salesByYear': {'keys': ['Year'], 'measures': ['SalesValue']},
+    'volumeByYear': {'keys': ['Year'], 'measures': ['Volume']},
+    'salesByBrandYear': {'keys': ['Year', 'Brand'], 'measures': ['SalesValue']},
+    'volumeByBrandYear': {'keys': ['Year', 'Brand'], 'measures': ['Volume']},
+    'salesByPackTypeYear': {'keys': ['Year', 'PackType'], 'measures': ['SalesValue']},
+    'salesByPPGYear': {'keys': ['Year', 'PPG'], 'measures': ['SalesValue']},
+    'salesByComboYear': {'keys': ['Year', 'Brand', 'PackType', 'PPG'], 'measures': ['SalesValue'],
+                         'label': 'combo', 'member': COMBO_KEYS},
+    'volumeByPackTypeYear': {'keys': ['Year', 'PackType'], 'measures': ['Volume']},
+    'volumeByPPGYear': {'keys': ['Year', 'PPG'], 'measures': ['Volume']},
+    'volumeByComboYear': {'keys': ['Year', 'Brand', 'PackType', 'PPG'], 'measures': ['Volume'],
+                          'label': 'combo', 'member': COMBO_KEYS},
+    'monthlyTrend': {'keys': ['Year', 'Month'], 'measures': ['SalesValue', 'Volume'],
+                     'first_date': True, 'label': 'year_month'},
+    'monthlyBrandSales': {'keys': ['Year', 'Month', 'Brand'], 'measures': ['SalesValue', 'Volume'],
+                          'first_date': True, 'label': 'year_month', 'member': ['Brand']},
+    'monthlyChannelSales': {'keys': ['Year', 'Month', 'Channel'], 'measures': ['SalesValue', 'Volume'],
+                            'first_date': True, 'label': 'year_month'},
+    'marketShareSales': {'keys': ['Brand'], 'measures': ['SalesValue', 'Volume'], 'order': 'share'},
+    'marketSharePackType': {'keys': ['PackType'], 'measures': ['SalesValue', 'Volume'], 'order': 'share'},
+    'marketSharePPG': {'keys': ['PPG'], 'measures': ['SalesValue', 'Volume'], 'order': 'share'},
+    'marketShareCombo': {'keys': ['Brand', 'PackType', 'PPG'], 'measures': ['SalesValue', 'Volume'],
+                         'label': 'combo', 'member': COMBO_KEYS},
+    'yearBrandSales': {'keys': ['Brand', 'Year'], 'measures': ['SalesValue']},
+    'yearPackTypeSales': {'keys': ['PackType', 'Year'], 'measures': ['SalesValue']},
+    'yearPPGSales': {'keys': ['PPG', 'Year'], 'measures': ['SalesValue']},
+    'yearComboSales': {'keys': ['Brand', 'PackType', 'PPG', 'Year'], 'measures': ['SalesValue'],
+                       'label': 'combo', 'member': COMBO_KEYS},
+}
+
+
+# Outputs of /api/data/ that are not plain groupings of the cube
+DERIVED_OUTPUTS = ['kpiStats', 'kpiCorrelation', 'correlationMatrix']
+ALL_OUTPUTS = list(DATASET_SPECS) + DERIVED_OUTPUTS
+
+
+def parse_projection(payload):
     """
-    filtered_df = df.copy()
+    Read the optional dataset projection from a /api/data/ request body
     
-    if filters.get('brands') and len(filters['brands']) > 0:
-        filtered_df = filtered_df[filtered_df['Brand'].isin(filters['brands'])]
+    Args:
+        payload: dict with optional 'datasets' (list of output names) and
+            'fields' (dict of dataset name -> list of columns to keep)
     
-    if filters.get('packTypes') and len(filters['packTypes']) > 0:
-        filtered_df = filtered_df[filtered_df['PackType'].isin(filters['packTypes'])]
+    Returns:
+        (names, fields) with names in canonical response order
     
-    if filters.get('ppgs') and len(filters['ppgs']) > 0:
-        filtered_df = filtered_df[filtered_df['PPG'].isin(filters['ppgs'])]
+    Raises:
+        ValueError: for unknown dataset names, malformed field masks or
+            fields on non-tabular outputs
+    """
+    requested = payload.get('datasets') or ALL_OUTPUTS
+    if not isinstance(requested, list) or not all(isinstance(name, str) for name in requested):
+        raise ValueError("'datasets' must be a list of dataset names")
+    unknown = sorted(set(requested) - set(ALL_OUTPUTS))
+    if unknown:
+        raise ValueError(f"Unknown datasets: {', '.join(unknown)}")
+    names = [name for name in ALL_OUTPUTS if name in set(requested)]
+
+    masks = payload.get('fields') or {}
+    if not isinstance(masks, dict):
+        raise ValueError("'fields' must be an object of dataset name -> list of columns")
+    fields = {}
+    for name, columns in masks.items():
+        if name not in DATASET_SPECS:
+            raise ValueError(f"Field masks are only supported for tabular datasets, not {name!r}")
+        if not isinstance(columns, list) or not all(isinstance(column, str) for column in columns):
+            raise ValueError(f"Fields of {name!r} must be a list of column names")
+        fields[name] = list(dict.fromkeys(columns))
+    return names, fields
+
+
+def dataset_columns(name):
+    """Columns of a DATASET_SPECS dataset (monthly trends for the trend datasets)"""
+    spec = DATASET_SPECS[name]
+    columns = spec['keys'] + spec['measures']
+    if spec.get('first_date'):
+        columns = columns + ['date']
+    if spec.get('label') == 'year_month':
+        columns = columns + ['YearMonth']
+    elif spec.get('label') == 'combo':
+        columns = columns + ['Combo']
+    return columns
+
+
+def parse_limits(payload, names):
+    """
+    Work out the top-N cap of each capped dataset of a request
+
+    Args:
+        payload: dict with an optional 'limit' - an int for every capped
+            dataset, or a dict of dataset name -> int (null to lift a cap)
+        names: output names of the request (from parse_projection)
+
+    Returns:
+        dict of dataset name -> N, starting from settings.DATASET_TOP_N
+
+    Raises:
+        ValueError: for non-positive limits or datasets that cannot be capped
+    """
+    capped = [name for name in names if name in DATASET_SPECS and 'member' in DATASET_SPECS[name]]
+    limits = {name: n for name, n in getattr(settings, 'DATASET_TOP_N', {}).items() if name in capped}
+    requested = payload.get('limit')
+    if requested is None:
+        requested = {}
+    elif not isinstance(requested, dict):
+        requested = dict.fromkeys(capped, requested)
+    for name, n in requested.items():
+        if name not in DATASET_SPECS or 'member' not in DATASET_SPECS[name]:
+            raise ValueError(f"Dataset {name!r} cannot be limited")
+        if n is None:
+            limits.pop(name, None)
+        elif isinstance(n, bool) or not isinstance(n, int) or n < 1:
+            raise ValueError(f"Limit for {name!r} must be a positive integer")
+        elif name in capped:
+            limits[name] = n
+    return {name: limits[name] for name in capped if name in limits}
+
+
+def project_fields(frame, columns):
+    """Keep only the requested columns of a dataset, in the requested order"""
+    missing = [c for c in columns if c not in frame.columns]
+    if missing:
+        raise ValueError(f"Unknown fields: {', '.join(missing)}")
+    return frame[columns]
+
+
+def plan_aggregations(names):
+    """
+    Work out the distinct groupings needed for a set of datasets
     
-    if filters.get('channels') and len(filters['channels']) > 0:
-        filtered_df = filtered_df[filtered_df['Channel'].isin(filters['channels'])]
+    Each distinct key set is computed once with every measure any dataset
+    needs from it. A key set that is contained in a larger requested one is
+    rolled up from the smallest such grouping instead of from the cube.
     
-    if filters.get('years') and len(filters['years']) > 0:
-        filtered_df = filtered_df[filtered_df['Year'].isin(filters['years'])]
+    Args:
+        names: list of DATASET_SPECS names
     
-    return filtered_df
+    Returns:
+        List of (keys, measures, first_date, parent) steps in execution order;
+        parent is the key set to roll up from, or None for the cube cells
+    """
+    needs = {}
+    for name in names:
+        spec = DATASET_SPECS[name]
+        keys = frozenset(spec['keys'])
+        measures, first_date = needs.get(keys, (set(), False))
+        wanted = set(spec['measures']) | ({RANK_MEASURE} if 'member' in spec else set())
+        needs[keys] = (measures | wanted, first_date or spec.get('first_date', False))
+
+    # Smallest groupings first, so each one can push its needs into its parent
+    ordered = sorted(needs, key=lambda k: (len(k), sorted(k)))
+    parents = {}
+    for keys in ordered:
+        supersets = [other for other in ordered if keys < other]
+        if supersets:
+            parent = min(supersets, key=lambda k: (len(k), sorted(k)))
+            parents[keys] = parent
+            measures, first_date = needs[keys]
+            parent_measures, parent_first = needs[parent]
+            needs[parent] = (parent_measures | measures, parent_first or first_date)
+
+    return [
+        (keys, sorted(needs[keys][0]), needs[keys][1], parents.get(keys))
+        for keys in reversed(ordered)
+    ]
+
 
+def _cell_arrays(cells, keys, measures, first_date):
+    """Pull dimension codes and measure arrays out of the cube cells"""
+    source = {
+        'codes': {d: cells[d].cat.codes.to_numpy() for d in keys},
+        'measures': {m: cells[m].to_numpy(dtype=float) for m in measures},
+    }
+    if first_date:
+        source['date_pos'] = cells[DATE_POSITION].to_numpy()
+        source['date'] = cells['date'].to_numpy()
+    return source
 
-def aggregate_by_dimension(df, dimension, metric='SalesValue'):
+
+def _group(source, keys, measures, first_date):
     """
-    Generic aggregation function by dimension and year
+    Sum measures by keys on integer codes
+    
+    The key codes are folded into one int64 per row (missing keys kept as
+    their own code, so coarser rollups stay exact), then np.unique and
+    np.bincount do the grouping without going through pandas.
+    """
+    keys = sorted(keys)
+    length = len(source['codes'][keys[0]])
+    combined = np.zeros(length, dtype=np.int64)
+    radix = 1
+    for d in keys:
+        codes = source['codes'][d]
+        size = int(codes.max()) + 2 if length else 1
+        if radix * size >= 2 ** 62:
+            _, combined = np.unique(combined, return_inverse=True)
+            radix = int(combined.max()) + 1
+        combined = combined * size + (codes + 1)
+        radix *= size
+
+    uniques, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+    result = {
+        'codes': {d: source['codes'][d][first] for d in keys},
+        'measures': {
+            m: np.bincount(inverse, weights=source['measures'][m], minlength=len(uniques))
+            for m in measures
+        },
+    }
+    if first_date:
+        # Within each group, the row with the smallest date position wins
+        order = np.lexsort((source['date_pos'], inverse))
+        heads = order[np.r_[0, np.flatnonzero(np.diff(inverse[order])) + 1]] if length else order
+        result['date_pos'] = source['date_pos'][heads]
+        result['date'] = source['date'][heads]
+    return result
+
+
+def split_plan(plan):
+    """
+    Split a plan into independent trees, one per grouping read from the cube
+
+    Each tree keeps plan order (parents before the rollups that use them), so
+    the trees can be executed concurrently.
+    """
+    trees = {}
+    root_of = {}
+    for step in plan:
+        keys, parent = step[0], step[3]
+        root = keys if parent is None else root_of[parent]
+        root_of[keys] = root
+        trees.setdefault(root, []).append(step)
+    return list(trees.values())
+
+
+def run_aggregations(cells, plan, map_fn=None, roots=None):
+    """
+    Execute a plan from plan_aggregations against cube cells
     
     Args:
-        df: pandas DataFrame
-        dimension: str - column name to group by (e.g., 'Brand', 'PackType')
-        metric: str - metric to aggregate (default: 'SalesValue')
+        cells: DataFrame of cube cells
+        plan: steps from plan_aggregations
+        map_fn: optional callable(fn, items) running the plan's independent
+            trees (see executor.get_fanout); serial when omitted
+        roots: optional dict of key set -> grouped arrays already computed
+            for the steps read from the cube (see delta.roots_of)
     
     Returns:
-        Aggregated DataFrame
+        dict of key set -> grouped arrays (missing keys still present)
     """
-    result = df.groupby(['Year', dimension]).agg({
-        metric: 'sum'
-    }).reset_index()
-    return result
+    roots = roots or {}
+
+    def run(steps):
+        results = {}
+        for keys, measures, first_date, parent in steps:
+            if parent is None and keys in roots:
+                results[keys] = roots[keys]
+                continue
+            with stage('group.' + '.'.join(sorted(keys))) as timed:
+                if parent is None:
+                    source = _cell_arrays(cells, keys, measures, first_date)
+                    timed.rows = len(cells)
+                else:
+                    source = results[parent]
+                    timed.rows = len(next(iter(source['codes'].values())))
+                results[keys] = _group(source, keys, measures, first_date)
+        return results
+
+    if map_fn is None:
+        return run(plan)
+    results = {}
+    for tree in map_fn(run, split_plan(plan)):
+        results.update(tree)
+    return results
+
+
+def _fold_other(grouped, spec, levels, limit):
+    """
+    Keep the top `limit` members of a grouping by RANK_MEASURE, summing the
+    rest into one OTHER_LABEL member per combination of the remaining keys
+
+    Members are ranked on their integer key codes with a partial selection,
+    so no labels are built for the folded rows. The folded member gets the
+    code one past the last category, so it sorts after every real member.
+
+    Returns:
+        (grouped, levels, info) where info gives the original group and
+        member counts
+    """
+    keys, member = spec['keys'], spec['member']
+    rest = [d for d in keys if d not in member]
+    codes = {d: grouped['codes'][d] for d in keys}
+    valid = np.logical_and.reduce([c >= 0 for c in codes.values()])
+    rows = np.flatnonzero(valid)
+
+    sizes = [len(levels[d]) for d in member]
+    member_ids = np.ravel_multi_index([codes[d][rows] for d in member], sizes) if len(rows) else rows
+    members, inverse = np.unique(member_ids, return_inverse=True)
+    info = {'limit': limit, 'groups': len(rows), 'members': len(members), 'kept': min(limit, len(members))}
+    if len(members) <= limit:
+        return grouped, levels, info
+
+    totals = np.bincount(inverse, weights=grouped['measures'][RANK_MEASURE][rows], minlength=len(members))
+    top = np.zeros(len(members), dtype=bool)
+    top[np.argpartition(-totals, limit - 1)[:limit]] = True
+    kept, folded = rows[top[inverse]], rows[~top[inverse]]
 
+    # One folded row per combination of the non-member keys
+    if rest:
+        rest_ids = np.ravel_multi_index([codes[d][folded] for d in rest], [len(levels[d]) for d in rest])
+        _, first, slot = np.unique(rest_ids, return_index=True, return_inverse=True)
+    else:
+        first, slot = np.zeros(1, dtype=np.intp), np.zeros(len(folded), dtype=np.intp)
+    n_other = len(first)
 
-def aggregate_total_by_year(df, metric='SalesValue'):
-    """Aggregate total metric by year"""
-    result = df.groupby('Year').agg({
-        metric: 'sum'
-    }).reset_index()
-    return result.sort_values('Year')
+    result = {
+        'codes': {
+            d: np.concatenate([
+                codes[d][kept],
+                np.full(n_other, len(levels[d]), dtype=codes[d].dtype) if d in member else codes[d][folded][first],
+            ])
+            for d in keys
+        },
+        'measures': {
+            m: np.concatenate([values[kept], np.bincount(slot, weights=values[folded], minlength=n_other)])
+            for m, values in grouped['measures'].items()
+        },
+    }
+    if 'date_pos' in grouped:
+        # The folded row carries the earliest date of the rows it sums
+        order = np.lexsort((grouped['date_pos'][folded], slot))
+        heads = folded[order[np.r_[0, np.flatnonzero(np.diff(slot[order])) + 1]]]
+        result['date_pos'] = np.concatenate([grouped['date_pos'][kept], grouped['date_pos'][heads]])
+        result['date'] = np.concatenate([grouped['date'][kept], grouped['date'][heads]])
 
+    levels = dict(levels)
+    for d in member:
+        levels[d] = levels[d].append(pd.Index([OTHER_LABEL]))
+    return result, levels, info
 
-def aggregate_market_share(df, dimension):
+
+def _finish(grouped, spec, levels, limit=None):
+    """
+    Shape a grouping into a dataset: drop missing keys, order and label it
+
+    With a limit, members beyond the top N are folded (see _fold_other) and
+    frame.attrs['cap'] gives the limit and the group, member and kept counts.
     """
-    Aggregate market share data by dimension
+    info = None
+    if limit is not None:
+        grouped, levels, info = _fold_other(grouped, spec, levels, limit)
+
+    keys = spec['keys']
+    codes = [grouped['codes'][d] for d in keys]
+    order = np.lexsort(codes[::-1])
+    order = order[np.logical_and.reduce([c[order] >= 0 for c in codes])]
+
+    data = {d: levels[d].take(grouped['codes'][d][order]) for d in keys}
+    data.update((m, grouped['measures'][m][order]) for m in spec['measures'])
+    if spec.get('first_date'):
+        data['date'] = grouped['date'][order]
+    result = pd.DataFrame(data)
+
+    if spec.get('label') == 'year_month':
+        result = add_year_month(result)
+    elif spec.get('label') == 'combo':
+        result = add_combo(result)
+        if info is not None and info['kept'] < info['members']:
+            result.loc[result['Brand'] == OTHER_LABEL, 'Combo'] = OTHER_LABEL
+    if spec.get('order') == 'share':
+        result = result.sort_values('SalesValue', ascending=False)
+    if info is not None:
+        result.attrs['cap'] = info
+    return result
+
+
+def build_datasets(cells, names=None, map_fn=None, limits=None, roots=None):
+    """
+    Compute chart datasets from cube cells in a single planned pass
     
     Args:
-        df: pandas DataFrame
-        dimension: str - column name to group by
+        cells: DataFrame of cube cells (see Cube.select)
+        names: list of DATASET_SPECS names (default: all of them)
+        map_fn: optional callable(fn, items) to run the independent groupings
+            and the per-dataset shaping concurrently (see executor.get_fanout)
+        limits: optional dict of dataset name -> top-N cap (see parse_limits)
+        roots: optional precomputed groupings passed to run_aggregations
     
     Returns:
-        DataFrame with SalesValue and Volume aggregated
+        dict of dataset name -> DataFrame, same shapes as grouping the raw rows
     """
-    result = df.groupby(dimension).agg({
-        'SalesValue': 'sum',
-        'Volume': 'sum'
-    }).reset_index()
-    return result.sort_values('SalesValue', ascending=False)
+    names = list(DATASET_SPECS) if names is None else names
+    results = run_aggregations(cells, plan_aggregations(names), map_fn, roots)
+    levels = {d: cells[d].cat.categories for d in CUBE_DIMENSIONS}
+
+    limits = limits or {}
+
+    def finish(name):
+        spec = DATASET_SPECS[name]
+        return _finish(results[frozenset(spec['keys'])], spec, levels, limits.get(name))
+
+    if map_fn is None:
+        return {name: finish(name) for name in names}
+    return dict(zip(names, map_fn(finish, names)))
+
+
+def add_year_month(df):
+    """Insert the 'YYYY-MM' label after the Year and Month columns of an aggregate"""
+    # Labels are formatted once per distinct month, then taken by integer key
+    months = df['Year'].to_numpy(dtype=np.int64) * 12 + df['Month'].to_numpy(dtype=np.int64) - 1
+    ids, inverse = np.unique(months, return_inverse=True)
+    labels = np.array([f'{i // 12}-{i % 12 + 1:02d}' for i in ids.tolist()], dtype=object)
+    df.insert(df.columns.get_loc('Month') + 1, 'YearMonth', labels[inverse])
+    return df
+
+
+def add_combo(df):
+    """Insert the 'Brand · PackType · PPG' label after the PPG column of an aggregate"""
+    combo = (df['Brand'].astype(str) + ' · ' +
+             df['PackType'].astype(str) + ' · ' +
+             df['PPG'].astype(str))
+    df.insert(df.columns.get_loc('PPG') + 1, 'Combo', combo)
+    return df
 
 
 def calculate_kpi_correlation(monthly_trend_df):
@@ -96,26 +481,19 @@ def calculate_kpi_correlation(monthly_trend_df):
         List of correlation pairs
     """
     try:
-        mt = monthly_trend_df.copy()
-        # Calculate ASP (Average Selling Price)
-        mt['ASP'] = mt.apply(
-            lambda r: (r['SalesValue'] / r['Volume']) 
-            if (pd.notna(r['SalesValue']) and pd.notna(r['Volume']) and r['Volume'] not in [0, None]) 
-            else np.nan, 
-            axis=1
-        )
-        
-        corr = mt[['SalesValue', 'Volume', 'ASP']].corr()
+        sales = monthly_trend_df['SalesValue'].to_numpy(dtype=float)
+        volume = monthly_trend_df['Volume'].to_numpy(dtype=float)
+        # ASP (Average Selling Price), missing where volume is missing or zero
+        with np.errstate(divide='ignore', invalid='ignore'):
+            asp = np.where(np.isnan(sales) | np.isnan(volume) | (volume == 0), np.nan, sales / volume)
+
         kpi_order = ['SalesValue', 'Volume', 'ASP']
-        correlation_pairs = []
-        
-        for r in kpi_order:
-            for c in kpi_order:
-                val = corr.loc[r, c] if (r in corr.index and c in corr.columns) else np.nan
-                if pd.notna(val):
-                    correlation_pairs.append({'row': r, 'col': c, 'value': float(val)})
-        
-        return correlation_pairs
+        corr = correlation_matrix(*sufficient_stats(np.column_stack([sales, volume, asp])))
+        rows, cols = np.nonzero(np.isfinite(corr))
+        return [
+            {'row': kpi_order[r], 'col': kpi_order[c], 'value': value}
+            for r, c, value in zip(rows.tolist(), cols.tolist(), corr[rows, cols].tolist())
+        ]
     except Exception:
         return []
 
@@ -124,44 +502,18 @@ def calculate_general_correlation(df):
     """
     Calculate correlation between numeric columns
     
+    Used for frames without a cube; Cube.correlation_pairs serves the same
+    pairs from precomputed statistics.
+    
     Args:
         df: pandas DataFrame
     
     Returns:
         List of correlation pairs
     """
-    corr_columns = []
-    
-    # Add standard columns
-    for col in ['SalesValue', 'Volume', 'VolumeUnits']:
-        if col in df.columns:
-            corr_columns.append(col)
-    
-    # Add columns starting with specific prefixes
-    for col in df.columns:
-        if any(col.startswith(prefix) for prefix in ['D', 'AV', 'EV']):
-            if pd.api.types.is_numeric_dtype(df[col]):
-                corr_columns.append(col)
-    
-    # Deduplicate while preserving order
-    corr_columns = list(dict.fromkeys(corr_columns))
-    correlation_pairs = []
-    
-    if len(corr_columns) >= 2:
-        corr_df = df[corr_columns].corr()
-        cols = list(corr_df.columns)
-        
-        for i in range(len(cols)):
-            for j in range(i + 1, len(cols)):
-                val = corr_df.iloc[i, j]
-                if pd.notna(val):
-                    try:
-                        correlation_pairs.append({
-                            'var1': cols[i], 
-                            'var2': cols[j], 
-                            'corr': float(val)
-                        })
-                    except Exception:
-                        pass
-    
-    return correlation_pairs
+    corr_columns = correlation_columns(df)
+    if len(corr_columns) < 2:
+        return []
+    values = column_matrix(df, corr_columns)
+    values = values - np.nanmean(values, axis=0)
+    return upper_pairs(corr_columns, correlation_matrix(*sufficient_stats(values)))
@@ -1,215 +1,507 @@
 """
 API views for the EDA application.
 """
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
 from rest_framework import status
-import pandas as pd
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+import functools
+import hmac
 import logging
 from .data_loader import data_loader
+from .delta import DeltaEntry, diff_body, get_delta_store, parse_delta, patch_body, roots_of, selection_sums
+from .executor import get_fanout
+from .metrics import CONTENT_TYPE, export, stage
+from .periods import TREND_DATASETS, build_trends, choose_grain, parse_grain, projection_columns
+from . import popularity, warmup
+from .profiling import annotate, profiled
+from .catalog import facet_counts
+from .coalesce import data_flight
+from .cache import canonical_filters, canonical_key, get_response_cache
+from .cube import summarize
+from .reload import reload_settings
+from .responses import etag_matches, json_response, make_etag, not_modified
+from .renderers import RECORDS, RESPONSE_FORMATS, FastJSONRenderer, dumps, serialize_frame
 from .utils import (
-    apply_filters, clean_data, aggregate_by_dimension,
-    aggregate_total_by_year, aggregate_market_share,
-    calculate_kpi_correlation, calculate_general_correlation
+    DATASET_SPECS, build_datasets,
+    parse_limits, parse_projection, project_fields,
+    calculate_kpi_correlation
 )
 
 logger = logging.getLogger(__name__)
 
+# Top-level batch keys used as defaults for every scenario
+BATCH_DEFAULTS = ('datasets', 'fields', 'format', 'limit')
 
-@api_view(['GET'])
+
+def filter_options_key(filters=None):
+    """Cache key of /api/filters/ (GET) or of the facets of a selection (POST)"""
+    if filters is None:
+        return 'filters'
+    return canonical_key({'facets': canonical_filters(filters)})
+
+
+def render_filter_options(state, filters=None):
+    """Serialized filter catalog, or facet counts when filters are given"""
+    # Options are precomputed per dataset version, excluding 'All*' values and NaN
+    if filters is None:
+        return dumps(state.catalog)
+    return dumps(facet_counts(state.cube, state.catalog, filters))
+
+
+@profiled
+@api_view(['GET', 'POST'])
 def get_filter_options(request):
     """
     Get all available filter options (brands, pack types, PPG, channels, years)
+
+    A POST with {'filters': {...}} returns facets instead: for each dimension
+    every option with the row count and SalesValue still reachable under the
+    selection on the other dimensions.
     """
     try:
-        df = data_loader.get_data()
-        
-        # Get unique values for each filter, excluding 'All*' values and NaN
-        brands = sorted([b for b in df['Brand'].unique() if pd.notna(b) and not str(b).startswith('All')])
-        pack_types = sorted([p for p in df['PackType'].unique() if pd.notna(p) and not str(p).startswith('All')])
-        ppgs = sorted([p for p in df['PPG'].unique() if pd.notna(p) and not str(p).startswith('All')])
-        channels = sorted([c for c in df['Channel'].unique() if pd.notna(c) and not str(c).startswith('All')])
-        years = sorted([int(y) for y in df['Year'].unique() if pd.notna(y)])
-        
-        return Response({
-            'brands': brands,
-            'packTypes': pack_types,
-            'ppgs': ppgs,
-            'channels': channels,
-            'years': years
-        })
+        filters = None
+        if request.method == 'POST':
+            if not isinstance(request.data, dict):
+                raise ValueError("Expected a JSON object")
+            filters = request.data.get('filters', {})
+        key = filter_options_key(filters)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        cache = get_response_cache()
+        state = data_loader.get_state()
+        version = state.version
+        digest = make_etag(version, key)
+        if etag_matches(request, digest):
+            return not_modified(digest)
+        body = cache.get(key, version)
+        if body is None:
+            body = render_filter_options(state, filters)
+            cache.set(key, version, body)
+        return json_response(request, body, digest, cache, key, version)
     except Exception as e:
         logger.error(f"Error fetching filter options: {e}", exc_info=True)
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@api_view(['POST'])
-def get_filtered_data(request):
+def parse_data_request(payload):
     """
-    Get filtered and aggregated data based on user selections.
+    Validate a /api/data/ payload
+
+    Returns:
+        (filters, names, fields, response_format, limits, grain, key) where
+        grain is None for monthly trends (see periods.parse_grain) and key is
+        the canonical cache key of the request
+
+    Raises:
+        ValueError: for a payload that is not an object, malformed filters or
+            unknown datasets, fields, formats, limits or grains
     """
-    try:
-        df = data_loader.get_data().copy()
-        filters = request.data.get('filters', {})
-        
-        # Apply filters using utility function
-        df = apply_filters(df, filters)
-        
-        # Aggregate data for different chart types
-        
-        # 1. Sales Value by Year
-        sales_by_year = aggregate_total_by_year(df, 'SalesValue')
-        
-        # 2. Volume by Year
-        volume_by_year = aggregate_total_by_year(df, 'Volume')
-        
-        # 3. Sales Value by Brand and Year
-        sales_by_brand_year = aggregate_by_dimension(df, 'Brand', 'SalesValue')
-        
-        # 4. Volume by Brand and Year
-        volume_by_brand_year = aggregate_by_dimension(df, 'Brand', 'Volume')
-        
-        # 5. Monthly trend (Line Chart)
-        df['YearMonth'] = df['Year'].astype(str) + '-' + df['Month'].astype(str).str.zfill(2)
-        monthly_trend = df.groupby(['Year', 'Month', 'YearMonth']).agg({
-            'SalesValue': 'sum',
-            'Volume': 'sum',
-            'date': 'first'
-        }).reset_index()
-        monthly_trend = monthly_trend.sort_values(['Year', 'Month'])
-
-        # 5b. KPI correlation matrix across monthly KPIs (SalesValue, Volume, ASP)
-        kpi_correlation = calculate_kpi_correlation(monthly_trend)
-
-        # 5c. Monthly brand sales (for potential market share trends)
-        monthly_brand_sales = df.groupby(['Year', 'Month', 'YearMonth', 'Brand']).agg({
-            'SalesValue': 'sum',
-            'Volume': 'sum',
-            'date': 'first'
-        }).reset_index().sort_values(['Year', 'Month', 'Brand'])
-        
-        # 5d. Monthly channel sales
-        monthly_channel_sales = df.groupby(['Year', 'Month', 'YearMonth', 'Channel']).agg({
-            'SalesValue': 'sum',
-            'Volume': 'sum',
-            'date': 'first'
-        }).reset_index().sort_values(['Year', 'Month', 'Channel'])
-        
-        # 6. Market Share by Brand
-        market_share_sales = aggregate_market_share(df, 'Brand')
-        
-        # 7. Year-wise Sales Value by Brand (Vertical Bar Chart)
-        year_brand_sales = df.groupby(['Brand', 'Year']).agg({
-            'SalesValue': 'sum'
-        }).reset_index()
-
-        # Additional datasets for view modes
-        sales_by_packtype_year = aggregate_by_dimension(df, 'PackType', 'SalesValue')
-        sales_by_ppg_year = aggregate_by_dimension(df, 'PPG', 'SalesValue')
-
-        # Add Combo label for combinations
-        df['Combo'] = (df['Brand'].astype(str).fillna('') + ' · ' +
-                       df['PackType'].astype(str).fillna('') + ' · ' +
-                       df['PPG'].astype(str).fillna(''))
-
-        # Sales by Combo and Year
-        sales_by_combo_year = df.groupby(['Year', 'Brand', 'PackType', 'PPG', 'Combo']).agg({
-            'SalesValue': 'sum'
-        }).reset_index()
-
-        # Volume variants
-        volume_by_packtype_year = aggregate_by_dimension(df, 'PackType', 'Volume')
-        volume_by_ppg_year = aggregate_by_dimension(df, 'PPG', 'Volume')
-
-        volume_by_combo_year = df.groupby(['Year', 'Brand', 'PackType', 'PPG', 'Combo']).agg({
-            'Volume': 'sum'
-        }).reset_index()
-
-        # Year-wise sales by other dimensions (for vertical grouped bars)
-        year_packtype_sales = df.groupby(['PackType', 'Year']).agg({
-            'SalesValue': 'sum'
-        }).reset_index()
-
-        year_ppg_sales = df.groupby(['PPG', 'Year']).agg({
-            'SalesValue': 'sum'
-        }).reset_index()
-
-        year_combo_sales = df.groupby(['Brand', 'PackType', 'PPG', 'Combo', 'Year']).agg({
-            'SalesValue': 'sum'
-        }).reset_index()
-
-        # Market share variants
-        market_share_packtype = aggregate_market_share(df, 'PackType')
-        market_share_ppg = aggregate_market_share(df, 'PPG')
-
-        market_share_combo = df.groupby(['Brand', 'PackType', 'PPG', 'Combo']).agg({
-            'SalesValue': 'sum',
-            'Volume': 'sum'
-        }).reset_index()
-
-        # Basic correlation matrix between available numeric fields
-        correlation_pairs = calculate_general_correlation(df)
-
-        # KPI summary stats computed over the filtered dataset
-        kpi_stats = {
-            'value': {
-                'sum': float(df['SalesValue'].sum()),
-                'average': float(df['SalesValue'].mean()) if len(df) > 0 else 0.0,
-                'min': float(df['SalesValue'].min()) if len(df) > 0 else 0.0,
-                'max': float(df['SalesValue'].max()) if len(df) > 0 else 0.0,
-                'count': int(df['SalesValue'].count()),
-            },
-            'volume': {
-                'sum': float(df['Volume'].sum()),
-                'average': float(df['Volume'].mean()) if len(df) > 0 else 0.0,
-                'min': float(df['Volume'].min()) if len(df) > 0 else 0.0,
-                'max': float(df['Volume'].max()) if len(df) > 0 else 0.0,
-                'count': int(df['Volume'].count()),
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object")
+    filters = payload.get('filters', {})
+    response_format = payload.get('format', RECORDS)
+    names, fields = parse_projection(payload)
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"Unknown format {response_format!r}, expected one of {', '.join(RESPONSE_FORMATS)}")
+    limits = parse_limits(payload, names)
+    grain = parse_grain(payload)
+    for name, columns in fields.items():
+        known = projection_columns(name, grain)
+        unknown = [column for column in columns if column not in known]
+        if unknown:
+            raise ValueError(f"Unknown fields of {name!r}: {', '.join(unknown)}")
+    request = {
+        'filters': canonical_filters(filters),
+        'datasets': names,
+        'fields': fields,
+        'format': response_format,
+    }
+    if limits:
+        request['limits'] = limits
+    if grain:
+        request['grain'] = grain
+    return filters, names, fields, response_format, limits, grain, canonical_key(request)
+
+
+def tabular_outputs(names):
+    """DATASET_SPECS entries computed for the requested outputs"""
+    tabular = [name for name in names if name in DATASET_SPECS]
+    if 'kpiCorrelation' in names and 'monthlyTrend' not in tabular:
+        tabular.append('monthlyTrend')
+    return tabular
+
+
+def render_data(state, filters, names, fields, response_format, limits=None, grain=None, roots=None):
+    """
+    Compute and serialize the /api/data/ response body
+
+    Args:
+        state: DatasetState the request is answered from
+        filters: dict with filter keys (brands, packTypes, ppgs, channels, years)
+        names: list of output names from parse_projection
+        fields: dict of dataset name -> columns from parse_projection
+        response_format: RECORDS or COLUMNS
+        limits: dict of dataset name -> top-N cap from parse_limits; capped
+            datasets are described under the response's 'meta' key
+        grain: time grain from parse_grain for the trend datasets (monthly
+            when None); the grain used is given under 'meta'. kpiCorrelation
+            is always computed over months
+        roots: precomputed root groupings (see delta.roots_of), used instead
+            of grouping the selected cells
+
+    Returns:
+        bytes - the JSON body
+    """
+    # Charts are rolled up from the pre-aggregated cube cells matching the filters
+    with stage('select') as timed:
+        cells = state.cube.select(filters)
+        timed.rows = len(cells)
+    # Independent groupings and outputs may be spread over threads (DATA_PARALLELISM)
+    fan_out = get_fanout(len(cells))
+
+    # Only the requested datasets are computed, in one planned pass over the cells
+    tabular = tabular_outputs(names)
+    if grain is not None:
+        grain = choose_grain(cells, state.calendar, grain)
+    with stage('aggregate') as timed:
+        if grain in (None, 'month'):
+            datasets = build_datasets(cells, tabular, fan_out, limits, roots)
+            monthly_trend = datasets.get('monthlyTrend')
+        else:
+            # Trends at another grain are rolled up separately (see api/periods.py);
+            # kpiCorrelation is computed over months whatever the grain
+            monthly = [n for n in tabular if n not in TREND_DATASETS]
+            if 'kpiCorrelation' in names:
+                monthly.append('monthlyTrend')
+            datasets = build_datasets(cells, monthly, fan_out, limits, roots)
+            monthly_trend = datasets.pop('monthlyTrend', None)
+            datasets.update(build_trends(state, cells, filters, names, grain, limits))
+        timed.rows = len(cells)
+
+    def output(name):
+        if name in DATASET_SPECS:
+            frame = datasets[name]
+            if name in fields:
+                # Fields were checked when parsing; with maxPoints some belong to another grain
+                frame = project_fields(frame, [column for column in fields[name] if column in frame.columns])
+            return serialize_frame(frame, response_format)
+        if name == 'kpiStats':
+            # KPI summary stats computed over the filtered dataset
+            return {
+                'value': summarize(cells, 'SalesValue'),
+                'volume': summarize(cells, 'Volume'),
             }
-        }
+        if name == 'kpiCorrelation':
+            # KPI correlation matrix across monthly KPIs (SalesValue, Volume, ASP)
+            return calculate_kpi_correlation(monthly_trend)
+        # Basic correlation matrix between available numeric fields,
+        # summed from the cube's per-cell sufficient statistics
+        return state.cube.correlation_pairs(filters)
 
-        return Response({
-            'salesByYear': clean_data(sales_by_year).to_dict('records'),
-            'volumeByYear': clean_data(volume_by_year).to_dict('records'),
-            'kpiStats': kpi_stats,
+    with stage('serialize'):
+        response = dict(zip(names, fan_out(output, names)))
+    meta = {}
+    if limits:
+        meta['limits'] = {name: datasets[name].attrs['cap'] for name in limits}
+    if grain is not None:
+        meta['grain'] = grain
+    if meta:
+        response['meta'] = meta
+    with stage('encode') as timed:
+        body = dumps(response)
+        timed.bytes = len(body)
+    return body
 
-            'salesByBrandYear': clean_data(sales_by_brand_year).to_dict('records'),
-            'volumeByBrandYear': clean_data(volume_by_brand_year).to_dict('records'),
 
-            'salesByPackTypeYear': clean_data(sales_by_packtype_year).to_dict('records'),
-            'salesByPPGYear': clean_data(sales_by_ppg_year).to_dict('records'),
-            'salesByComboYear': clean_data(sales_by_combo_year).to_dict('records'),
+def render_and_cache(state, cache, filters, names, fields, response_format, limits, grain, key):
+    """Render a /api/data/ body and store it in the response cache"""
+    body = render_data(state, filters, names, fields, response_format, limits, grain)
+    cache.set(key, state.version, body)
+    return body
 
-            'volumeByPackTypeYear': clean_data(volume_by_packtype_year).to_dict('records'),
-            'volumeByPPGYear': clean_data(volume_by_ppg_year).to_dict('records'),
-            'volumeByComboYear': clean_data(volume_by_combo_year).to_dict('records'),
 
-            'monthlyTrend': clean_data(monthly_trend).to_dict('records'),
-            'kpiCorrelation': kpi_correlation,
-            'monthlyBrandSales': clean_data(monthly_brand_sales).to_dict('records'),
-            'monthlyChannelSales': clean_data(monthly_channel_sales).to_dict('records'),
+def compute_data(state, cache, filters, names, fields, response_format, limits, grain, key):
+    """
+    render_and_cache() for a request
+
+    Concurrent identical requests share one computation of the body.
+    """
+    compute = functools.partial(
+        render_and_cache, state, cache, filters, names, fields, response_format, limits, grain, key,
+    )
+    with stage('compute'):
+        return data_flight.do(f"{state.version}:{key}", compute)
+
+
+def incremental_key(key):
+    """Cache key of a body rendered from incrementally updated sums"""
+    return f"{key}|incremental"
+
+
+def delta_data(state, cache, delta, filters, names, fields, response_format, limits, grain, key):
+    """
+    Answer a /api/data/ request that opted into delta updates
+
+    The root group sums of the response are recorded under its ETag digest.
+    When the request names a recorded base one toggled filter value away,
+    the sums are updated from the base instead of regrouping the selection.
+    In 'patch' mode the changes against the base body are returned when that
+    body is still cached and the patch is the smaller of the two.
+
+    Sums updated from a base can differ from a regroup in the last digits, so
+    a body rendered from them is cached apart from the full computation
+    (under incremental_key) and is only weakly equivalent to it.
+
+    Returns:
+        (body, how the sums were obtained: 'incremental', 'full' or 'cached',
+        True when body is a patch, False when body was rendered from
+        incrementally updated sums)
+    """
+    version = state.version
+    digest = make_etag(version, key)
+    store = get_delta_store()
+    base = store.get(delta['base']) if delta['base'] else None
+    body, exact = cache.get(key, version), True
+    if body is None:
+        body, exact = cache.get(incremental_key(key), version, track=False), False
+    how = 'cached'
+    if body is None or store.get(digest) is None:
+        with stage('compute'):
+            sums, incremental = selection_sums(state, base, filters, tabular_outputs(names))
+            how = 'incremental' if incremental else 'full'
+            if body is None:
+                body = render_data(
+                    state, filters, names, fields, response_format, limits, grain, roots_of(state, sums),
+                )
+                exact = not incremental
+                cache.set(key if exact else incremental_key(key), version, body)
+        store.put(digest, DeltaEntry(version, key if exact else incremental_key(key), filters, sums))
+
+    if delta['mode'] == 'patch' and base is not None and base.version == version:
+        base_body = cache.get(base.body_key, version, track=False)
+        if base_body is not None:
+            with stage('diff'):
+                patch = patch_body(delta['base'], digest, diff_body(base_body, body, response_format))
+            # Most rows change when a large slice is toggled: send the smaller body
+            if len(patch) < len(body):
+                return patch, how, True, exact
+    return body, how, False, exact
+
+
+def delta_response(request, body, how, patch, exact, digest, cache, key, version):
+    """json_response for delta_data results, tagged with X-Delta"""
+    if patch:
+        # A patch is relative to its base: neither cached nor revalidated
+        response = json_response(request, body, digest)
+        response['Cache-Control'] = 'no-store'
+        del response['ETag']
+    elif exact:
+        response = json_response(request, body, digest, cache, key, version)
+    else:
+        response = json_response(request, body, digest, cache, incremental_key(key), version)
+        response['ETag'] = 'W/' + response['ETag']
+    response['X-Delta'] = how + (', patch' if patch else '')
+    return response
+
+
+def parse_batch_request(payload):
+    """
+    Validate a /api/data/batch/ payload
 
-            'marketShareSales': clean_data(market_share_sales).to_dict('records'),
-            'marketSharePackType': clean_data(market_share_packtype).to_dict('records'),
-            'marketSharePPG': clean_data(market_share_ppg).to_dict('records'),
-            'marketShareCombo': clean_data(market_share_combo).to_dict('records'),
+    Each scenario is a /api/data/ payload with an optional 'id' (its position
+    by default); top-level 'datasets', 'fields', 'format' and 'limit' apply to
+    every scenario that does not set them.
 
-            'yearBrandSales': clean_data(year_brand_sales).to_dict('records'),
-            'yearPackTypeSales': clean_data(year_packtype_sales).to_dict('records'),
-            'yearPPGSales': clean_data(year_ppg_sales).to_dict('records'),
-            'yearComboSales': clean_data(year_combo_sales).to_dict('records'),
+    Returns:
+        list of (scenario id, parse_data_request result)
 
-            'correlationMatrix': correlation_pairs
-        })
+    Raises:
+        ValueError: for a payload that is not an object, a malformed list,
+            duplicate ids or an invalid scenario
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object")
+    scenarios = payload.get('scenarios')
+    if not isinstance(scenarios, list) or not scenarios:
+        raise ValueError("'scenarios' must be a non-empty list")
+    max_scenarios = getattr(settings, 'BATCH_MAX_SCENARIOS', 50)
+    if len(scenarios) > max_scenarios:
+        raise ValueError(f"At most {max_scenarios} scenarios per batch")
+
+    defaults = {name: payload[name] for name in BATCH_DEFAULTS if name in payload}
+    parsed = []
+    seen = set()
+    for position, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict):
+            raise ValueError(f"Scenario {position} must be an object")
+        scenario_id = str(scenario.get('id', position))
+        if scenario_id in seen:
+            raise ValueError(f"Duplicate scenario id {scenario_id!r}")
+        seen.add(scenario_id)
+        try:
+            parsed.append((scenario_id, parse_data_request(dict(defaults, **scenario))))
+        except ValueError as e:
+            raise ValueError(f"Scenario {scenario_id!r}: {e}")
+    return parsed
+
+
+def stream_batch(state, scenarios):
+    """
+    Yield the batch response body: a JSON object of scenario id -> the body
+    /api/data/ returns for that scenario, one scenario at a time
+
+    Every scenario is sliced from the shared cube of `state`; bodies already
+    in the response cache (or repeated in the batch) are not recomputed. A
+    scenario that fails is answered with {"error": ...} in its slot.
+    """
+    cache = get_response_cache()
+    yield b'{'
+    for position, (scenario_id, (filters, names, fields, response_format, limits, grain, key)) in enumerate(scenarios):
+        try:
+            body = cache.get(key, state.version)
+            if body is None:
+                body = compute_data(state, cache, filters, names, fields, response_format, limits, grain, key)
+        except Exception as e:
+            logger.error(f"Error in batch scenario {scenario_id!r}: {e}", exc_info=True)
+            body = dumps({'error': str(e)})
+        yield (b',' if position else b'') + dumps(scenario_id) + b':' + body
+    yield b'}'
+
+
+def batch_response(body):
+    """Streaming JSON response for a batch body iterator"""
+    response = StreamingHttpResponse(body, content_type='application/json')
+    # Let proxies pass each scenario on as soon as it is written
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@profiled
+@api_view(['POST'])
+@renderer_classes([FastJSONRenderer])
+def get_filtered_data(request):
+    """
+    Get filtered and aggregated data based on user selections.
+
+    The body may restrict the response with 'datasets' (list of output names)
+    and 'fields' (dataset name -> list of columns); by default every dataset
+    is returned in full. 'format': 'columns' returns each tabular dataset as
+    {column: [values]} instead of a list of records. 'limit' (an int, or
+    dataset name -> int) keeps the top N combos/brands of the capped datasets
+    and folds the rest into an "Other" member. 'delta' (true, or {'base':
+    ETag, 'mode': 'full' | 'patch'}) records the response for incremental
+    updates and recomputes from a base one toggled filter value away.
+    """
+    try:
+        filters, names, fields, response_format, limits, grain, key = parse_data_request(request.data)
+        delta = parse_delta(request.data)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    # Counted for the warm-up of future workers
+    popularity.record(key)
+    try:
+        # Identical selections are served from the serialized response cache
+        cache = get_response_cache()
+        # One dataset state for the whole request, even if a reload swaps it meanwhile
+        state = data_loader.get_state()
+        version = state.version
+        # Recorded with the profile if this request gets profiled
+        annotate(payload=key, version=version)
+        digest = make_etag(version, key)
+        if etag_matches(request, digest):
+            return not_modified(digest)
+        if delta is not None:
+            body, how, patch, exact = delta_data(
+                state, cache, delta, filters, names, fields, response_format, limits, grain, key,
+            )
+            return delta_response(request, body, how, patch, exact, digest, cache, key, version)
+        body = cache.get(key, version)
+        if body is not None:
+            return json_response(request, body, digest, cache, key, version)
+
+        body = compute_data(state, cache, filters, names, fields, response_format, limits, grain, key)
+        return json_response(request, body, digest, cache, key, version)
     except Exception as e:
         logger.error(f"Error in get_filtered_data: {e}", exc_info=True)
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+def get_batch_data(request):
+    """
+    Evaluate several filter scenarios in one request.
+
+    The body is {'scenarios': [{'id', 'filters', ...}, ...]} plus optional
+    'datasets', 'fields', 'format' and 'limit' defaults. The response is a
+    JSON object of scenario id -> that scenario's /api/data/ body, streamed
+    as each scenario is ready.
+    """
+    try:
+        scenarios = parse_batch_request(request.data)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    # Every scenario is answered from the same dataset version
+    state = data_loader.get_state()
+    return batch_response(stream_batch(state, scenarios))
+
+
 @api_view(['GET'])
 def health_check(request):
     """
     Simple health check endpoint
+
+    Answers 503 with status 'warming' while the worker warms up (see
+    api/warmup.py), so load balancers hold traffic back until it is ready.
+    """
+    warming = warmup.is_warming()
+    return Response({
+        'status': 'warming' if warming else 'ok',
+        'message': 'Warming up' if warming else 'Application is running',
+        # Not waiting for the dataset the warm-up is loading
+        'dataset': data_loader.describe(load=not warming),
+        'warmup': warmup.status(),
+        'responseCache': get_response_cache().stats(),
+        'coalescing': data_flight.stats(),
+        'delta': get_delta_store().stats(),
+    }, status=status.HTTP_503_SERVICE_UNAVAILABLE if warming else status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def metrics(request):
+    """
+    Per-worker metrics in the Prometheus text format: request and stage
+    latency histograms, cache hit rates, dataset load time and memory
+    """
+    return HttpResponse(export(), content_type=CONTENT_TYPE)
+
+
+@api_view(['POST'])
+def reload_dataset(request):
+    """
+    Reload the dataset from DATASET_PATH without downtime
+
+    Requires the X-Reload-Token header to match DATASET_RELOAD['TOKEN'] (the
+    endpoint is disabled while no token is configured). The new version is
+    built in the background and swapped in when ready; pass {'wait': true}
+    to block until the reload has finished.
     """
-    return Response({'status': 'ok', 'message': 'Application is running'})
+    token = reload_settings()['TOKEN']
+    provided = request.META.get('HTTP_X_RELOAD_TOKEN', '')
+    if not token or not hmac.compare_digest(provided.encode('utf-8'), token.encode('utf-8')):
+        return Response({'error': 'Reloading is not permitted'}, status=status.HTTP_403_FORBIDDEN)
+
+    if request.data.get('wait'):
+        try:
+            data_loader.reload()
+        except Exception as e:
+            logger.error(f"Dataset reload failed: {e}", exc_info=True)
+            return Response({'error': str(e), 'dataset': data_loader.describe()},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({'status': 'reloaded', 'dataset': data_loader.describe()})
+
+    data_loader.reload_async()
+    return Response({'status': 'reloading', 'dataset': data_loader.describe()}, status=status.HTTP_202_ACCEPTED)
 
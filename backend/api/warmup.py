@@ -0,0 +1,128 @@
+"""
+Warm-up of a worker before it takes traffic.
+
+warm_up() loads the dataset state (frame, filter indexes, cube and calendar
+keys), renders the /api/filters/ catalog and the default unfiltered
+/api/data/ response, then replays the TOP_K most requested /api/data/ keys
+of the popularity sketch (api/popularity.py) into the response cache.
+
+With WARMUP['ENABLED'], ApiConfig.ready() starts it in a background thread
+(or runs it inline with BLOCKING) and /api/health/ answers 503 with status
+'warming' until it is done, so load balancers hold traffic back meanwhile.
+`python manage.py warmup` runs the same steps from the command line.
+"""
+import json
+import logging
+import threading
+import time
+from . import views
+from .cache import get_response_cache
+from .data_loader import data_loader
+from .popularity import top_keys, warmup_settings
+
+logger = logging.getLogger(__name__)
+
+IDLE, WARMING, READY, FAILED = 'idle', 'warming', 'ready', 'failed'
+
+_status = {'state': IDLE}
+_status_lock = threading.Lock()
+
+
+def status():
+    """Progress of this worker's warm-up, for /api/health/"""
+    with _status_lock:
+        return dict(_status)
+
+
+def is_warming():
+    return status()['state'] == WARMING
+
+
+def _update(**values):
+    with _status_lock:
+        _status.update(values)
+
+
+def replay(state, cache, key):
+    """
+    Render the /api/data/ response of a canonical request key into the cache
+
+    Returns:
+        True when it was computed, False when it was already cached
+    """
+    if cache.get(key, state.version, track=False) is not None:
+        return False
+    request = json.loads(key)
+    views.compute_data(
+        state, cache, request['filters'], request['datasets'], request['fields'], request['format'],
+        request.get('limits', {}), request.get('grain'), key,
+    )
+    return True
+
+
+def warm_up(top_k=None):
+    """
+    Load the dataset and prime the response cache
+
+    Args:
+        top_k: popular keys to replay (default WARMUP['TOP_K'])
+
+    Returns:
+        dict with the timings and the number of responses primed
+    """
+    config = warmup_settings()
+    top_k = config['TOP_K'] if top_k is None else top_k
+    started = time.perf_counter()
+    _update(state=WARMING, started=time.time(), error=None)
+    try:
+        state = data_loader.get_state()
+        loaded = time.perf_counter()
+        cache = get_response_cache()
+
+        key = views.filter_options_key()
+        if cache.get(key, state.version, track=False) is None:
+            cache.set(key, state.version, views.render_filter_options(state))
+
+        # The default unfiltered response first, then the most requested ones
+        keys = [views.parse_data_request({})[-1]]
+        keys += [key for key in top_keys(config['SKETCH_PATH'], top_k) if key not in keys]
+        primed = failed = 0
+        for key in keys:
+            try:
+                primed += replay(state, cache, key)
+            except Exception as e:
+                # Keys recorded by an older release may no longer be valid
+                failed += 1
+                logger.warning(f"Warm-up could not replay {key}: {e}")
+
+        result = {
+            'version': state.version,
+            'loadDuration': round(loaded - started, 4),
+            'duration': round(time.perf_counter() - started, 4),
+            'keys': len(keys),
+            'primed': primed,
+            'failed': failed,
+        }
+        _update(state=READY, finished=time.time(), **result)
+        logger.info(f"Warm-up done in {result['duration']:.2f}s: {primed} of {len(keys)} responses primed")
+        return result
+    except Exception as e:
+        _update(state=FAILED, finished=time.time(), error=str(e))
+        logger.error(f"Warm-up failed: {e}", exc_info=True)
+        raise
+
+
+def start(blocking=False):
+    """Run warm_up inline or in a daemon thread, marking the worker as warming right away"""
+    _update(state=WARMING, started=time.time())
+
+    def run():
+        try:
+            warm_up()
+        except Exception:
+            pass  # logged and reported by warm_up
+
+    if blocking:
+        run()
+    else:
+        threading.Thread(target=run, name='eda-warmup', daemon=True).start()
@@ -4,6 +4,8 @@ Django settings for eda_project project.
 
 from pathlib import Path
 import os
+import tempfile
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -30,6 +32,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -112,3 +116,143 @@ REST_FRAMEWORK = {
 
 # Dataset path
 DATASET_PATH = os.path.join(BASE_DIR, 'eda_project', 'Technical Evaluation.csv')
+
+# Columnar snapshot of the dataset, rebuilt with `manage.py build_snapshot`
+DATASET_SNAPSHOT_ENABLED = True
+DATASET_SNAPSHOT_PATH = DATASET_PATH + '.snapshot'
+# Write the snapshot automatically when it is missing or stale
+DATASET_SNAPSHOT_AUTOBUILD = True
+
+# Memory available for loading the dataset. With DATASET_CHUNKED_INGEST set to
+# 'auto', CSVs larger than this are streamed in chunks sized from the budget
+# (see api/ingest.py) instead of being parsed in one go; True/False force it.
+DATASET_MEMORY_BUDGET = 512 * 1024 * 1024
+DATASET_CHUNKED_INGEST = 'auto'
+
+# Shared-memory serving (see api/shared.py): the dataset, indexes and cube are
+# published once as memory-mapped arrays (`manage.py publish_dataset`, or by
+# the first worker when AUTOPUBLISH is set) and every worker maps them
+# read-only instead of holding a private copy.
+DATASET_SHARED = {
+    'ENABLED': os.environ.get('DATASET_SHARED', '') == '1',
+    'PATH': os.environ.get('DATASET_SHARED_PATH', os.path.join(
+        '/dev/shm' if os.path.isdir('/dev/shm') else '/tmp', 'eda-dataset')),
+    # Newest segments retained after a publish (the current one is always kept)
+    'KEEP': 2,
+    'AUTOPUBLISH': True,
+}
+
+# Hot reload of the dataset (see api/reload.py). WATCH polls DATASET_PATH
+# every WATCH_INTERVAL seconds, SIGNAL names the signal that triggers a reload
+# and a non-empty TOKEN enables POST /api/admin/reload/ (X-Reload-Token header).
+DATASET_RELOAD = {
+    'WATCH': False,
+    'WATCH_INTERVAL': 5.0,
+    'SIGNAL': 'SIGHUP',
+    'TOKEN': os.environ.get('DATASET_RELOAD_TOKEN', ''),
+}
+
+# Serve /api/filters/, /api/data/ and /api/health/ with the async views of
+# api/async_views.py (run under ASGI, e.g. uvicorn eda_project.asgi:application)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '') == '1'
+
+# Thread pool of the async views (see api/executor.py): at most WORKERS
+# computations run at once, QUEUE more may wait up to QUEUE_TIMEOUT seconds
+# and further requests are answered 503.
+COMPUTE_POOL = {
+    'WORKERS': min(8, os.cpu_count() or 1),
+    'QUEUE': 32,
+    'QUEUE_TIMEOUT': 10.0,
+}
+
+# Fan-out of the independent aggregations of one /api/data/ request (see
+# api/executor.py). 'serial' runs them one after another; 'threads' spreads
+# them over WORKERS threads once a selection has MIN_CELLS cube cells, trading
+# overall throughput for per-request latency.
+DATA_PARALLELISM = {
+    'MODE': os.environ.get('DATA_PARALLELISM', 'serial'),
+    'WORKERS': min(4, os.cpu_count() or 1),
+    'MIN_CELLS': 50000,
+}
+
+# Request and stage metrics (see api/metrics.py), exported at /api/metrics/.
+# SERVER_TIMING adds a Server-Timing header with the stage durations of each
+# API response; WINDOW is the number of recent requests latency quantiles
+# are computed over.
+METRICS = {
+    'ENABLED': True,
+    'SERVER_TIMING': os.environ.get('SERVER_TIMING', '') == '1',
+    'WINDOW': 1024,
+}
+
+# Profiler for slow requests (see api/profiling.py). Requests to PATHS running
+# longer than THRESHOLD seconds have their stack sampled every INTERVAL
+# seconds, a SAMPLE_RATE fraction runs under cProfile, and the newest KEEP
+# captures are kept in PATH (list them with `manage.py profiles`).
+PROFILING = {
+    'ENABLED': os.environ.get('PROFILING', '') == '1',
+    'PATHS': ('/api/data/',),
+    'THRESHOLD': float(os.environ.get('PROFILING_THRESHOLD', '1.0')),
+    'INTERVAL': 0.005,
+    'SAMPLE_RATE': float(os.environ.get('PROFILING_SAMPLE_RATE', '0')),
+    'KEEP': 50,
+    'PATH': os.environ.get('PROFILING_PATH', os.path.join(tempfile.gettempdir(), 'eda-profiles')),
+}
+
+# Default top-N caps of the combo/brand datasets of /api/data/ (dataset name
+# -> N, e.g. {'salesByComboYear': 20}); the rest is folded into an "Other"
+# member. Requests can override them with 'limit'.
+DATASET_TOP_N = {}
+
+# Most scenarios one POST /api/data/batch/ may evaluate
+BATCH_MAX_SCENARIOS = 50
+
+# Time grain of the trend datasets of /api/data/ when a request sets no
+# 'grain' (see api/periods.py), and the most periods 'grain': 'auto' returns
+TIME_GRAIN = {
+    'DEFAULT': 'month',
+    'MAX_POINTS': 104,
+}
+
+# Warm-up before a worker takes traffic (see api/warmup.py): with ENABLED the
+# dataset is loaded and the default plus the TOP_K most requested /api/data/
+# responses are cached at startup (inline with BLOCKING), /api/health/
+# answering 503 meanwhile. TRACK records request popularity in SKETCH_PATH,
+# shared by the workers and merged every FLUSH_INTERVAL seconds; it is off
+# with DEBUG unless WARMUP_TRACK=1.
+WARMUP = {
+    'ENABLED': os.environ.get('WARMUP', '') == '1',
+    'BLOCKING': False,
+    'TOP_K': 20,
+    'TRACK': os.environ.get('WARMUP_TRACK', '0' if DEBUG else '1') == '1',
+    'SKETCH_PATH': os.environ.get('WARMUP_SKETCH_PATH', os.path.join(tempfile.gettempdir(), 'eda-popularity.json')),
+    'FLUSH_INTERVAL': 60.0,
+}
+
+# Incremental /api/data/ updates (see api/delta.py): group sums of the last
+# MAX_ENTRIES responses requested with 'delta' are kept per worker as bases
+DELTA = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 64,
+}
+
+# Cache of serialized /api/data/ responses (see api/cache.py). Use
+# 'BACKEND': 'django' with a shared CACHES backend to share hits across workers.
+RESPONSE_CACHE = {
+    'BACKEND': 'local',
+    'MAX_ENTRIES': 256,
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'TTL': 300,
+    'CACHE_ALIAS': 'default',
+}
+
+# Compression of cached JSON responses (brotli is used when installed)
+RESPONSE_COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+
+# Let the frontend revalidate cached responses across origins
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match')
+CORS_EXPOSE_HEADERS = ['ETag']
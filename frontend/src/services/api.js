@@ -92,6 +92,9 @@ export const apiClient = new ApiClient();
 // Specific API endpoints
 export const edaApi = {
   getFilterOptions: () => apiClient.get('/api/filters/'),
-  getFilteredData: (filters) => apiClient.post('/api/data/', { filters }),
+  // Per-option row counts / SalesValue still reachable under the current selection
+  getFilterFacets: (filters) => apiClient.post('/api/filters/', { filters }),
+  // options may carry { datasets, fields } to fetch only the charts being rendered
+  getFilteredData: (filters, options = {}) => apiClient.post('/api/data/', { filters, ...options }),
   healthCheck: () => apiClient.get('/api/health/')
 };